@@ -0,0 +1,28 @@
+"""ipd_bot_stats rating columns for the sampled rating mode
+
+Revision ID: 0b7d2e9c4a83
+Revises: f1a6c3e8b527
+Create Date: 2026-10-18 14:05:52.274118
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = '0b7d2e9c4a83'
+down_revision = 'f1a6c3e8b527'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing snapshots start unrated; the rating mode samples them from scratch.
+    op.add_column("ipd_bot_stats", sa.Column("rating", sa.Float(), nullable=False, server_default="1500"))
+    op.add_column("ipd_bot_stats", sa.Column("rating_rd", sa.Float(), nullable=False, server_default="350"))
+
+
+def downgrade() -> None:
+    op.drop_column("ipd_bot_stats", "rating_rd")
+    op.drop_column("ipd_bot_stats", "rating")
@@ -0,0 +1,70 @@
+"""ipd adaptive multi-seed samples on duels and cached results
+
+Revision ID: 2c9e5f1b8d36
+Revises: 0b7d2e9c4a83
+Create Date: 2026-10-18 15:10:37.480261
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = '2c9e5f1b8d36'
+down_revision = '0b7d2e9c4a83'
+branch_labels = None
+depends_on = None
+
+
+def _create_cache(with_samples: bool) -> None:
+    cols = [
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("hash_a", sa.String(length=64), nullable=False),
+        sa.Column("hash_b", sa.String(length=64), nullable=False),
+        sa.Column("seed", sa.Integer(), nullable=False),
+    ]
+    key = ["hash_a", "hash_b", "seed"]
+    if with_samples:
+        cols.append(sa.Column("max_seeds", sa.Integer(), nullable=False, server_default="1"))
+        key.append("max_seeds")
+    cols += [
+        sa.Column("harness_version", sa.String(length=128), nullable=False),
+        sa.Column("score_a", sa.Integer(), nullable=False),
+        sa.Column("score_b", sa.Integer(), nullable=False),
+        sa.Column("exec_ms_a", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("exec_ms_b", sa.Integer(), nullable=False, server_default="0"),
+    ]
+    if with_samples:
+        cols += [
+            sa.Column("samples", sa.Integer(), nullable=False, server_default="1"),
+            sa.Column("score_diff_mean", sa.Float(), nullable=False, server_default="0"),
+            sa.Column("score_diff_sd", sa.Float(), nullable=False, server_default="0"),
+        ]
+    cols.append(sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False))
+    op.create_table(
+        "ipd_result_cache",
+        *cols,
+        sa.UniqueConstraint(*key, "harness_version", name="uq_ipd_result_cache_key"),
+    )
+
+
+def upgrade() -> None:
+    op.add_column("ipd_duels", sa.Column("samples", sa.Integer(), nullable=False, server_default="1"))
+    op.add_column("ipd_duels", sa.Column("score_diff_mean", sa.Float(), nullable=False, server_default="0"))
+    op.add_column("ipd_duels", sa.Column("score_diff_sd", sa.Float(), nullable=False, server_default="0"))
+    # Existing duels are single-seed.
+    op.execute("UPDATE ipd_duels SET score_diff_mean = score1 - score2")
+
+    # The cache key gains the seed budget; it is only a cache, so rebuild it empty.
+    op.drop_table("ipd_result_cache")
+    _create_cache(with_samples=True)
+
+
+def downgrade() -> None:
+    op.drop_table("ipd_result_cache")
+    _create_cache(with_samples=False)
+
+    op.drop_column("ipd_duels", "score_diff_sd")
+    op.drop_column("ipd_duels", "score_diff_mean")
+    op.drop_column("ipd_duels", "samples")
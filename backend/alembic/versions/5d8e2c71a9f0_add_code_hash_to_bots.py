@@ -0,0 +1,47 @@
+"""add code_hash to bots
+
+Revision ID: 5d8e2c71a9f0
+Revises: 3f4b13deb89b
+Create Date: 2026-10-18 09:12:41.118204
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = '5d8e2c71a9f0'
+down_revision = '3f4b13deb89b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 1) Add column nullable first to backfill.
+    op.add_column("bots", sa.Column("code_hash", sa.String(length=64), nullable=True))
+
+    # 2) Backfill using python AST hashing (same canonical form as services.code_hash).
+    import ast
+    import hashlib
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, code FROM bots")).fetchall()
+    for (bid, code) in rows:
+        try:
+            tree = ast.parse(code)
+            canonical = ast.dump(tree, include_attributes=False)
+            ch = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        except Exception:
+            # Unparsable draft: hash the raw source, as services.code_hash does.
+            ch = hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest()
+        conn.execute(sa.text("UPDATE bots SET code_hash = :ch WHERE id = :id"), {"ch": ch, "id": bid})
+
+    # 3) Tighten + index.
+    op.alter_column("bots", "code_hash", existing_type=sa.String(length=64), nullable=False)
+    op.create_index(op.f("ix_bots_code_hash"), "bots", ["code_hash"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_bots_code_hash"), table_name="bots")
+    op.drop_column("bots", "code_hash")
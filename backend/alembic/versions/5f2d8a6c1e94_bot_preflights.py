@@ -0,0 +1,38 @@
+"""bot_preflights: submit-time smoke runs keyed by code hash
+
+Revision ID: 5f2d8a6c1e94
+Revises: 7e4a1d9b3c52
+Create Date: 2026-10-18 17:20:37.604219
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = '5f2d8a6c1e94'
+down_revision = '7e4a1d9b3c52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "bot_preflights",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("code_hash", sa.String(length=64), nullable=False),
+        sa.Column("harness_version", sa.String(length=128), nullable=False),
+        sa.Column("ok", sa.Boolean(), nullable=False),
+        sa.Column("failure", sa.String(length=32), nullable=True),
+        sa.Column("error_log", sa.Text(), nullable=True),
+        sa.Column("startup_ms", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("avg_step_ms", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("max_step_ms", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.UniqueConstraint("code_hash", "harness_version", name="uq_bot_preflights_key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("bot_preflights")
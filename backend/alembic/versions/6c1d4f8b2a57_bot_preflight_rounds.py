@@ -0,0 +1,39 @@
+"""bot_preflights.rounds: key preflights by the number of rounds played
+
+Revision ID: 6c1d4f8b2a57
+Revises: b3f92a7c4e18
+Create Date: 2026-10-18 23:58:12.904417
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = '6c1d4f8b2a57'
+down_revision = 'b3f92a7c4e18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing rows were played with the default of 10 rounds.
+    op.add_column("bot_preflights", sa.Column("rounds", sa.Integer(), nullable=False, server_default="10"))
+    # Outcomes of timeouts and dead bot processes are no longer kept; they may not recur.
+    op.execute("DELETE FROM bot_preflights WHERE failure IN ('step_timeout', 'match_timeout', 'bot_exited')")
+    op.drop_constraint("uq_bot_preflights_key", "bot_preflights", type_="unique")
+    op.create_unique_constraint(
+        "uq_bot_preflights_key", "bot_preflights", ["code_hash", "harness_version", "rounds"]
+    )
+
+
+def downgrade() -> None:
+    # Keep one row per (code_hash, harness_version) before narrowing the key again.
+    op.execute(
+        "DELETE FROM bot_preflights p USING bot_preflights q "
+        "WHERE p.code_hash = q.code_hash AND p.harness_version = q.harness_version AND p.id < q.id"
+    )
+    op.drop_constraint("uq_bot_preflights_key", "bot_preflights", type_="unique")
+    op.create_unique_constraint("uq_bot_preflights_key", "bot_preflights", ["code_hash", "harness_version"])
+    op.drop_column("bot_preflights", "rounds")
@@ -0,0 +1,38 @@
+"""ipd forfeits for failing bots and quarantine of their snapshots
+
+Revision ID: 7e4a1d9b3c52
+Revises: 2c9e5f1b8d36
+Create Date: 2026-10-18 16:42:10.518306
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = '7e4a1d9b3c52'
+down_revision = '2c9e5f1b8d36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("ipd_duels", sa.Column("failure", sa.String(length=32), nullable=True))
+    op.add_column("ipd_duels", sa.Column("fault", sa.String(length=8), nullable=True))
+    op.add_column("ipd_result_cache", sa.Column("failure", sa.String(length=32), nullable=True))
+    op.add_column("ipd_result_cache", sa.Column("fault", sa.String(length=8), nullable=True))
+    # Failed duels used to be left unrecorded (their jobs are "failed"), so no
+    # snapshot has forfeits yet.
+    op.add_column("ipd_bot_stats", sa.Column("forfeits", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("ipd_bot_stats", sa.Column("quarantined", sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    op.drop_column("ipd_bot_stats", "quarantined")
+    op.drop_column("ipd_bot_stats", "forfeits")
+    op.drop_column("ipd_result_cache", "fault")
+    op.drop_column("ipd_result_cache", "failure")
+    op.execute("DELETE FROM ipd_duels WHERE failure IS NOT NULL")
+    op.drop_column("ipd_duels", "fault")
+    op.drop_column("ipd_duels", "failure")
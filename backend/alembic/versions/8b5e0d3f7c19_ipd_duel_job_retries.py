@@ -0,0 +1,29 @@
+"""ipd_duel_jobs.attempts/retry_after: retry duels lost to sandbox errors
+
+Revision ID: 8b5e0d3f7c19
+Revises: 6c1d4f8b2a57
+Create Date: 2026-10-18 09:47:31.208655
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = '8b5e0d3f7c19'
+down_revision = '6c1d4f8b2a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("ipd_duel_jobs", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("ipd_duel_jobs", sa.Column("retry_after", sa.DateTime(timezone=True), nullable=True))
+    # Failed jobs were never retried; give them a fresh set of attempts.
+    op.execute("UPDATE ipd_duel_jobs SET status = 'queued', error_log = NULL WHERE status = 'failed'")
+
+
+def downgrade() -> None:
+    op.drop_column("ipd_duel_jobs", "retry_after")
+    op.drop_column("ipd_duel_jobs", "attempts")
@@ -0,0 +1,41 @@
+"""ipd duel jobs for background tournament
+
+Revision ID: 9a41f0c3d2e7
+Revises: 5d8e2c71a9f0
+Create Date: 2026-10-18 10:03:27.540912
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = '9a41f0c3d2e7'
+down_revision = '5d8e2c71a9f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ipd_duel_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("bot1_id", sa.Integer(), sa.ForeignKey("bots.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("bot2_id", sa.Integer(), sa.ForeignKey("bots.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("bot1_hash", sa.String(length=64), nullable=False),
+        sa.Column("bot2_hash", sa.String(length=64), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="queued"),
+        sa.Column("error_log", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.UniqueConstraint("bot1_id", "bot2_id", "bot1_hash", "bot2_hash", name="uq_ipd_duel_jobs_pair_hash"),
+    )
+    op.create_index(op.f("ix_ipd_duel_jobs_bot1_id"), "ipd_duel_jobs", ["bot1_id"], unique=False)
+    op.create_index(op.f("ix_ipd_duel_jobs_bot2_id"), "ipd_duel_jobs", ["bot2_id"], unique=False)
+    op.create_index(op.f("ix_ipd_duel_jobs_status"), "ipd_duel_jobs", ["status"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_table("ipd_duel_jobs")
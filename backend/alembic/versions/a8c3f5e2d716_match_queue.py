@@ -0,0 +1,30 @@
+"""matches.queued_at for queued test matches
+
+Revision ID: a8c3f5e2d716
+Revises: 5f2d8a6c1e94
+Create Date: 2026-10-18 18:03:11.742950
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = 'a8c3f5e2d716'
+down_revision = '5f2d8a6c1e94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "matches",
+        sa.Column("queued_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    # Matches so far were played as soon as they were requested.
+    op.execute("UPDATE matches SET queued_at = started_at")
+
+
+def downgrade() -> None:
+    op.drop_column("matches", "queued_at")
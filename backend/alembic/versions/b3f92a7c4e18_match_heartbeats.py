@@ -0,0 +1,26 @@
+"""matches.heartbeat_at for re-queueing matches of dead workers
+
+Revision ID: b3f92a7c4e18
+Revises: d4e7b1a9c305
+Create Date: 2026-10-18 22:41:06.318204
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = 'b3f92a7c4e18'
+down_revision = 'd4e7b1a9c305'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("matches", sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True))
+    op.execute("UPDATE matches SET heartbeat_at = started_at WHERE status = 'running'")
+
+
+def downgrade() -> None:
+    op.drop_column("matches", "heartbeat_at")
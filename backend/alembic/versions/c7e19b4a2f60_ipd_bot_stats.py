@@ -0,0 +1,49 @@
+"""ipd_bot_stats running totals for the leaderboard
+
+Revision ID: c7e19b4a2f60
+Revises: 9a41f0c3d2e7
+Create Date: 2026-10-18 11:21:05.370416
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = 'c7e19b4a2f60'
+down_revision = '9a41f0c3d2e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ipd_bot_stats",
+        sa.Column("bot_id", sa.Integer(), sa.ForeignKey("bots.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("code_hash", sa.String(length=64), nullable=False),
+        sa.Column("score_sum", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("exec_ms_sum", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("duels", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("bot_id", "code_hash"),
+    )
+
+    # Backfill from existing duels, but only for each bot's current code.
+    op.execute(
+        """
+        INSERT INTO ipd_bot_stats (bot_id, code_hash, score_sum, exec_ms_sum, duels)
+        SELECT s.bot_id, s.bot_hash, SUM(s.score), SUM(s.exec_ms), COUNT(*)
+        FROM (
+            SELECT bot1_id AS bot_id, bot1_hash AS bot_hash, score1 AS score, exec_ms_1 AS exec_ms FROM ipd_duels
+            UNION ALL
+            SELECT bot2_id, bot2_hash, score2, exec_ms_2 FROM ipd_duels
+        ) s
+        JOIN bots b ON b.id = s.bot_id AND b.code_hash = s.bot_hash
+        GROUP BY s.bot_id, s.bot_hash
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ipd_bot_stats")
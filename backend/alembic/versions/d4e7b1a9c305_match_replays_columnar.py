@@ -0,0 +1,199 @@
+"""match_replays: one compact row per match instead of match_steps
+
+Revision ID: d4e7b1a9c305
+Revises: a8c3f5e2d716
+Create Date: 2026-10-18 19:11:46.380127
+
+"""
+
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = 'd4e7b1a9c305'
+down_revision = 'a8c3f5e2d716'
+branch_labels = None
+depends_on = None
+
+# Matches converted per batch; every batch commits on its own so the
+# migration can run against a live database without long-held locks.
+BATCH_MATCHES = 500
+
+_PAYOFF = {("C", "C"): (3, 3), ("D", "C"): (5, 0), ("C", "D"): (0, 5), ("D", "D"): (1, 1)}
+_MAX_ROUNDS = 200
+
+
+def _pack_actions(acts):
+    out = bytearray((len(acts) + 7) // 8)
+    for i, act in enumerate(acts):
+        if act == "D":
+            out[i >> 3] |= 1 << (i & 7)
+    return bytes(out)
+
+
+def _unpack_actions(data, rounds):
+    return "".join("D" if data[i >> 3] >> (i & 7) & 1 else "C" for i in range(rounds))
+
+
+def _observation(round_num, history):
+    return {"round": round_num, "max_rounds": _MAX_ROUNDS, "history": history}
+
+
+def _replay_row(match_id, steps):
+    # steps: (round, act_a, act_b, reward_a, reward_b, cum_a, cum_b) in round order.
+    n = len(steps)
+    return {
+        "match_id": match_id,
+        "rounds": n,
+        "acts_a": _pack_actions("".join(s[1] for s in steps)),
+        "acts_b": _pack_actions("".join(s[2] for s in steps)),
+        "rewards_a": bytes(int(s[3]) for s in steps),
+        "rewards_b": bytes(int(s[4]) for s in steps),
+        "cum_a": struct.pack(f"<{n}I", *(int(s[5]) for s in steps)),
+        "cum_b": struct.pack(f"<{n}I", *(int(s[6]) for s in steps)),
+    }
+
+
+def _match_ids_after(conn, table, last):
+    return list(
+        conn.execute(
+            sa.text(f"SELECT DISTINCT match_id FROM {table} WHERE match_id > :last ORDER BY match_id LIMIT :n"),
+            {"last": last, "n": BATCH_MATCHES},
+        ).scalars()
+    )
+
+
+def _copy_steps(conn, replays, ids):
+    steps = conn.execute(
+        sa.text(
+            "SELECT match_id, round, act_a, act_b, reward_a, reward_b, cum_a, cum_b FROM match_steps "
+            "WHERE match_id IN :ids ORDER BY match_id, round"
+        ).bindparams(sa.bindparam("ids", expanding=True)),
+        {"ids": ids},
+    ).all()
+    by_match = {}
+    for s in steps:
+        by_match.setdefault(s[0], []).append(tuple(s[1:]))
+    # Re-runnable: a batch interrupted before its commit is simply redone.
+    conn.execute(replays.delete().where(replays.c.match_id.in_(ids)))
+    conn.execute(replays.insert(), [_replay_row(mid, rows) for mid, rows in by_match.items()])
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    # The batches below commit the table with them; a re-run after an
+    # interruption finds it already there.
+    if not sa.inspect(conn).has_table("match_replays"):
+        op.create_table(
+            "match_replays",
+            sa.Column("match_id", sa.Integer(), sa.ForeignKey("matches.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("rounds", sa.Integer(), nullable=False),
+            sa.Column("acts_a", sa.LargeBinary(), nullable=False),
+            sa.Column("acts_b", sa.LargeBinary(), nullable=False),
+            sa.Column("rewards_a", sa.LargeBinary(), nullable=False),
+            sa.Column("rewards_b", sa.LargeBinary(), nullable=False),
+            sa.Column("cum_a", sa.LargeBinary(), nullable=False),
+            sa.Column("cum_b", sa.LargeBinary(), nullable=False),
+        )
+    replays = sa.table(
+        "match_replays",
+        *(sa.column(c) for c in ("match_id", "rounds", "acts_a", "acts_b", "rewards_a", "rewards_b", "cum_a", "cum_b")),
+    )
+
+    with op.get_context().autocommit_block():
+        last = 0
+        while True:
+            ids = _match_ids_after(conn, "match_steps", last)
+            if not ids:
+                break
+            _copy_steps(conn, replays, ids)
+            last = ids[-1]
+
+    # Back in a transaction: steps written while the batches ran (new
+    # matches, or rounds added to a match after its batch) are copied with
+    # writers locked out, and the table is dropped before the lock is released.
+    if conn.dialect.name == "postgresql":
+        op.execute("LOCK TABLE match_steps IN EXCLUSIVE MODE")
+    stale = list(
+        conn.execute(
+            sa.text(
+                "SELECT s.match_id FROM match_steps s LEFT JOIN match_replays r ON r.match_id = s.match_id "
+                "GROUP BY s.match_id, r.rounds HAVING r.rounds IS NULL OR count(*) <> r.rounds ORDER BY s.match_id"
+            )
+        ).scalars()
+    )
+    for i in range(0, len(stale), BATCH_MATCHES):
+        _copy_steps(conn, replays, stale[i : i + BATCH_MATCHES])
+    op.drop_table("match_steps")
+
+
+def downgrade() -> None:
+    json_type = sa.JSON().with_variant(postgresql.JSONB(astext_type=sa.Text()), "postgresql")
+    conn = op.get_bind()
+    if not sa.inspect(conn).has_table("match_steps"):
+        op.create_table(
+            "match_steps",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("match_id", sa.Integer(), sa.ForeignKey("matches.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("round", sa.Integer(), nullable=False),
+            sa.Column("obs_a", json_type, nullable=False),
+            sa.Column("act_a", sa.String(length=1), nullable=False),
+            sa.Column("obs_b", json_type, nullable=False),
+            sa.Column("act_b", sa.String(length=1), nullable=False),
+            sa.Column("reward_a", sa.Integer(), nullable=False),
+            sa.Column("reward_b", sa.Integer(), nullable=False),
+            sa.Column("cum_a", sa.Integer(), nullable=False),
+            sa.Column("cum_b", sa.Integer(), nullable=False),
+            sa.UniqueConstraint("match_id", "round", name="uq_match_steps_match_id_round"),
+        )
+        op.create_index(op.f("ix_match_steps_match_id"), "match_steps", ["match_id"], unique=False)
+    steps_table = sa.table(
+        "match_steps",
+        *(
+            sa.column(c, sa.JSON() if c.startswith("obs") else None)
+            for c in ("match_id", "round", "obs_a", "act_a", "obs_b", "act_b", "reward_a", "reward_b", "cum_a", "cum_b")
+        ),
+    )
+
+    with op.get_context().autocommit_block():
+        last = 0
+        while True:
+            ids = _match_ids_after(conn, "match_replays", last)
+            if not ids:
+                break
+            rows = []
+            for match_id, n, acts_a, acts_b, cum_a, cum_b in conn.execute(
+                sa.text(
+                    "SELECT match_id, rounds, acts_a, acts_b, cum_a, cum_b FROM match_replays WHERE match_id IN :ids"
+                ).bindparams(sa.bindparam("ids", expanding=True)),
+                {"ids": ids},
+            ):
+                a = _unpack_actions(acts_a, n)
+                b = _unpack_actions(acts_b, n)
+                cums_a = struct.unpack(f"<{n}I", cum_a)
+                cums_b = struct.unpack(f"<{n}I", cum_b)
+                for i in range(n):
+                    ra, rb = _PAYOFF[(a[i], b[i])]
+                    rows.append(
+                        {
+                            "match_id": match_id,
+                            "round": i + 1,
+                            "obs_a": _observation(i + 1, [[x, y] for x, y in zip(a[:i], b[:i])]),
+                            "act_a": a[i],
+                            "obs_b": _observation(i + 1, [[y, x] for x, y in zip(a[:i], b[:i])]),
+                            "act_b": b[i],
+                            "reward_a": ra,
+                            "reward_b": rb,
+                            "cum_a": cums_a[i],
+                            "cum_b": cums_b[i],
+                        }
+                    )
+            conn.execute(steps_table.delete().where(steps_table.c.match_id.in_(ids)))
+            if rows:
+                conn.execute(steps_table.insert(), rows)
+            last = ids[-1]
+
+    op.drop_table("match_replays")
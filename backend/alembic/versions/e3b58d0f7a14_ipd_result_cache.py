@@ -0,0 +1,38 @@
+"""ipd_result_cache: match results keyed by code hashes
+
+Revision ID: e3b58d0f7a14
+Revises: c7e19b4a2f60
+Create Date: 2026-10-18 12:02:48.915230
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = 'e3b58d0f7a14'
+down_revision = 'c7e19b4a2f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ipd_result_cache",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("hash_a", sa.String(length=64), nullable=False),
+        sa.Column("hash_b", sa.String(length=64), nullable=False),
+        sa.Column("seed", sa.Integer(), nullable=False),
+        sa.Column("harness_version", sa.String(length=128), nullable=False),
+        sa.Column("score_a", sa.Integer(), nullable=False),
+        sa.Column("score_b", sa.Integer(), nullable=False),
+        sa.Column("exec_ms_a", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("exec_ms_b", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.UniqueConstraint("hash_a", "hash_b", "seed", "harness_version", name="uq_ipd_result_cache_key"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ipd_result_cache")
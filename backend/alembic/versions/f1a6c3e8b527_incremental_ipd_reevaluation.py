@@ -0,0 +1,52 @@
+"""incremental ipd re-evaluation: obsolete duels, job priority
+
+Revision ID: f1a6c3e8b527
+Revises: e3b58d0f7a14
+Create Date: 2026-10-18 13:14:09.602733
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+revision = 'f1a6c3e8b527'
+down_revision = 'e3b58d0f7a14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("ipd_duels", sa.Column("obsolete", sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column("ipd_duel_jobs", sa.Column("priority", sa.Integer(), nullable=False, server_default="0"))
+
+    # Duels not played with both bots' current code are obsolete.
+    op.execute(
+        """
+        UPDATE ipd_duels SET obsolete = TRUE
+        WHERE NOT EXISTS (SELECT 1 FROM bots b WHERE b.id = ipd_duels.bot1_id AND b.code_hash = ipd_duels.bot1_hash)
+           OR NOT EXISTS (SELECT 1 FROM bots b WHERE b.id = ipd_duels.bot2_id AND b.code_hash = ipd_duels.bot2_hash)
+        """
+    )
+
+    # Stats now only count current duels; rebuild them.
+    op.execute("DELETE FROM ipd_bot_stats")
+    op.execute(
+        """
+        INSERT INTO ipd_bot_stats (bot_id, code_hash, score_sum, exec_ms_sum, duels)
+        SELECT s.bot_id, s.bot_hash, SUM(s.score), SUM(s.exec_ms), COUNT(*)
+        FROM (
+            SELECT bot1_id AS bot_id, bot1_hash AS bot_hash, score1 AS score, exec_ms_1 AS exec_ms
+            FROM ipd_duels WHERE NOT obsolete
+            UNION ALL
+            SELECT bot2_id, bot2_hash, score2, exec_ms_2 FROM ipd_duels WHERE NOT obsolete
+        ) s
+        GROUP BY s.bot_id, s.bot_hash
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("ipd_duel_jobs", "priority")
+    op.drop_column("ipd_duels", "obsolete")
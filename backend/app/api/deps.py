@@ -1,6 +1,6 @@
 from typing import Annotated
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
@@ -8,6 +8,8 @@ from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.db.session import get_db
 from app.models.user import User
+from app.services.ipd_tournament import IpdTournament
+from app.services.match_queue import MatchQueue
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
@@ -34,3 +36,10 @@ def get_current_user(
         raise credentials_exception
     return user
 
+
+def get_ipd_tournament(request: Request) -> IpdTournament:
+    return request.app.state.ipd_tournament
+
+
+def get_match_queue(request: Request) -> MatchQueue:
+    return request.app.state.match_queue
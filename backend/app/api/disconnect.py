@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+
+T = TypeVar("T")
+
+
+async def _until_disconnected(request: Request) -> None:
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """Await `awaitable`, cancelling it as soon as the client goes away.
+
+    Starlette keeps running an endpoint after its client disconnected;
+    this lets long sandbox runs stop (and kill their container) instead.
+    Only for endpoints that do not read a request body. Raises
+    HTTPException(499) after a disconnect; nobody is left to receive it.
+    """
+
+    work = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_until_disconnected(request))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if not work.done():
+        work.cancel()
+        try:
+            await work
+        except asyncio.CancelledError:
+            pass
+        raise HTTPException(status_code=499, detail="client_disconnected")
+    return work.result()
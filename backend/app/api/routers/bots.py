@@ -1,22 +1,23 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
 import secrets
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_ipd_tournament, get_match_queue
+from app.api.disconnect import cancel_on_disconnect
 from app.core.config import settings
 from app.crud.bots import create_bot, delete_bot, get_bot, list_bots, submit_bot, update_bot_code
 from app.db.session import get_db
-from app.models.match import Match
-from app.models.match_step import MatchStep
 from app.schemas.bot import BotCreateIn, BotDetailOut, BotOut, BotUpdateCodeIn
 from app.schemas.match import RunTestOut
-from app.services.code_hash import code_hash_py
-from app.services.docker_ipd_runner import DockerRunConfig, run_ipd_in_docker
+from app.services.docker_ipd_runner import DockerRunConfig
+from app.services.ipd_preflight import preflight_bot_async
+from app.services.ipd_tournament import IpdTournament, plan_bot_duels
+from app.services.match_queue import MatchQueue, enqueue_test_match, queue_position
 
 router = APIRouter(prefix="/bots", tags=["bots"])
 
@@ -84,7 +85,11 @@ def bots_get(bot_id: int, db: Session = Depends(get_db), user=Depends(get_curren
 
 @router.put("/{bot_id}", response_model=BotDetailOut)
 def bots_update_code(
-    bot_id: int, payload: BotUpdateCodeIn, db: Session = Depends(get_db), user=Depends(get_current_user)
+    bot_id: int,
+    payload: BotUpdateCodeIn,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+    tournament: IpdTournament = Depends(get_ipd_tournament),
 ):
     try:
         bot = update_bot_code(db, user_id=user.id, bot_id=bot_id, code=payload.code)
@@ -93,6 +98,9 @@ def bots_update_code(
             raise HTTPException(status_code=404, detail="bot_not_found")
         raise
 
+    if bot.env_id == "ipd" and plan_bot_duels(db, bot, mode=tournament.mode, target_rd=tournament.target_rd):
+        tournament.notify()
+
     return BotDetailOut(
         id=bot.id,
         env_id=bot.env_id,
@@ -105,8 +113,19 @@ def bots_update_code(
     )
 
 
-@router.post("/{bot_id}/run-test")
-def bots_run_test(bot_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)) -> RunTestOut:
+@router.post("/{bot_id}/run-test", status_code=202)
+def bots_run_test(
+    bot_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+    match_queue: MatchQueue = Depends(get_match_queue),
+) -> RunTestOut:
+    """Queue a sandbox test match against always_cooperate.
+
+    Returns 202 right away; poll GET /matches/{match_id} until its status is
+    "completed" or "failed" (see services.match_queue).
+    """
+
     bot = get_bot(db, user.id, bot_id)
     if bot is None:
         raise HTTPException(status_code=404, detail="bot_not_found")
@@ -114,69 +133,58 @@ def bots_run_test(bot_id: int, db: Session = Depends(get_db), user=Depends(get_c
     if bot.env_id != "ipd":
         raise HTTPException(status_code=400, detail="unsupported_env")
 
-    seed = secrets.randbelow(2**31 - 1)
-    baseline_code = "def act(observation, state):\n    return 'C', state\n"
-
-    bot_hash = code_hash_py(bot.code)
-
-    match = Match(
-        env_id="ipd",
-        user_id=user.id,
-        bot_id=bot.id,
-        bot_code_hash=bot_hash,
-        opponent_name="always_cooperate",
-        seed=seed,
-        status="running",
-    )
-    db.add(match)
-    db.commit()
-    db.refresh(match)
-
-    cfg = DockerRunConfig(image=settings.runner_image)
-    result = run_ipd_in_docker(cfg=cfg, bot_a_code=bot.code, bot_b_code=baseline_code, seed=seed)
-
-    if result.error_log:
-        match.status = "failed"
-        match.finished_at = datetime.now(timezone.utc)
-        match.error_log = result.error_log
-        db.add(match)
-        db.commit()
-        raise HTTPException(status_code=500, detail="runner_failed")
-
-    steps = [
-        MatchStep(
-            match_id=match.id,
-            round=int(s["round"]),
-            obs_a=s["obs_a"],
-            act_a=str(s["act_a"]),
-            obs_b=s["obs_b"],
-            act_b=str(s["act_b"]),
-            reward_a=int(s["reward_a"]),
-            reward_b=int(s["reward_b"]),
-            cum_a=int(s["cum_a"]),
-            cum_b=int(s["cum_b"]),
-        )
-        for s in result.steps
-    ]
-
-    match.status = "completed"
-    match.finished_at = datetime.now(timezone.utc)
-    db.add(match)
-    db.add_all(steps)
-    db.commit()
-
-    return RunTestOut(match_id=match.id, cum_a=int(result.cum_a), cum_b=int(result.cum_b))
+    match = enqueue_test_match(db, user_id=user.id, bot=bot, seed=secrets.randbelow(2**31 - 1))
+    match_queue.notify()
+    return RunTestOut(match_id=match.id, status=match.status, queue_position=queue_position(db, match))
 
 
 @router.post("/{bot_id}/submit", response_model=BotOut)
-def bots_submit(bot_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
+async def bots_submit(
+    bot_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+    tournament: IpdTournament = Depends(get_ipd_tournament),
+):
+    """Enter the bot into the leaderboard.
+
+    IPD bots first pass a short sandbox preflight (see
+    services.ipd_preflight), cached per code hash; a bot that fails to load,
+    lacks `act`, replies too slowly or plays an invalid action is rejected
+    with 400 "preflight_failed: <reason>". The endpoint is async so that a
+    preflight in progress holds no worker thread; database work runs in the
+    threadpool, and a client that disconnects mid-preflight gets its
+    sandbox killed.
+    """
+
+    bot = await run_in_threadpool(get_bot, db, user.id, bot_id)
+    if bot is not None and bot.env_id == "ipd" and settings.ipd_preflight_enabled:
+        cfg = DockerRunConfig(image=settings.runner_image)
+        try:
+            preflight = await cancel_on_disconnect(request, preflight_bot_async(db, cfg=cfg, bot=bot))
+        except RuntimeError as e:
+            if str(e).endswith("sandbox_busy"):
+                raise HTTPException(status_code=503, detail="runner_busy")
+            raise HTTPException(status_code=500, detail="runner_failed")
+        if not preflight.ok:
+            raise HTTPException(
+                status_code=400, detail=f"preflight_failed: {preflight.failure}\n{(preflight.error_log or '')[:2000]}"
+            )
+
+    return await run_in_threadpool(_submit, db, user_id=user.id, bot_id=bot_id, tournament=tournament)
+
+
+def _submit(db: Session, *, user_id: int, bot_id: int, tournament: IpdTournament) -> BotOut:
     try:
-        bot = submit_bot(db, user_id=user.id, bot_id=bot_id)
+        bot = submit_bot(db, user_id=user_id, bot_id=bot_id)
     except ValueError as e:
         if str(e) == "bot_not_found":
             raise HTTPException(status_code=404, detail="bot_not_found")
         raise
 
+    if bot.env_id == "ipd" and plan_bot_duels(db, bot, mode=tournament.mode, target_rd=tournament.target_rd):
+        tournament.notify()
+
     return BotOut(
         id=bot.id,
         env_id=bot.env_id,
@@ -1,24 +1,37 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
-from app.core.config import settings
+from app.api.deps import get_ipd_tournament
 from app.db.session import get_db
-from app.services.docker_ipd_runner import DockerRunConfig
-from app.services.ipd_leaderboard import compute_ipd_leaderboard
+from app.services.ipd_leaderboard import ipd_leaderboard_rows
+from app.services.ipd_tournament import IpdTournament, pending_ipd_duels
 
 router = APIRouter(prefix="/env", tags=["env"])
 
 
 @router.get("/ipd/leaderboard")
-def ipd_leaderboard(db: Session = Depends(get_db)):
+def ipd_leaderboard(db: Session = Depends(get_db), tournament: IpdTournament = Depends(get_ipd_tournament)):
     """IPD leaderboard.
 
     Score definition (requested): for each submitted bot, score is the average
     score across matches against every other submitted bot.
 
-    MVP implementation: we cache directional duels (A->B and B->A) for the current
-    code snapshots, and compute each bot's mean score.
+    Duels are cached per code snapshot and played by the background
+    tournament (see services.ipd_tournament); this endpoint only reads the
+    current standings plus how many duels are still queued or running.
+
+    With settings.ipd_leaderboard_mode = "rating" the tournament samples
+    duels instead of playing the full round-robin, and rows are ranked by
+    rating (each row always carries `rating` and `rating_rd`).
+
+    A duel lost to a bot crashing, timing out or returning an invalid action
+    is a forfeit: the failing bot scores 0 and its opponent 600 (3 points per
+    round, see ipd_leaderboard.FORFEIT_WIN_SCORE). Snapshots that keep failing
+    are quarantined (`quarantined`, listed last) until their code changes.
     """
 
-    cfg = DockerRunConfig(image=settings.runner_image)
-    return compute_ipd_leaderboard(db, cfg=cfg, limit=50)
+    return {
+        "mode": tournament.mode,
+        "rows": ipd_leaderboard_rows(db, limit=50, mode=tournament.mode),
+        "pending_duels": pending_ipd_duels(db),
+    }
@@ -1,47 +1,153 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_match_queue
+from app.api.responses import json_response
 from app.db.session import get_db
 from app.models.match import Match
-from app.models.match_step import MatchStep
-from app.schemas.match import MatchOut, MatchStepOut
+from app.models.match_replay import MatchReplay
+from app.schemas.match import MatchOut, MatchQueueOut, MatchStepOut, MatchStepsOut, MatchSummaryOut
+from app.services.match_json import dumps, match_json
+from app.services.match_queue import MatchQueue, match_queue_stats
+from app.services.match_replay import iter_replay_steps, replay_summary
 
 router = APIRouter(prefix="/matches", tags=["matches"])
 
 
-@router.get("/{match_id}", response_model=MatchOut)
-def matches_get(match_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    m = db.scalar(select(Match).where(Match.id == match_id, Match.user_id == user.id))
+@router.get("/queue", response_model=MatchQueueOut)
+def matches_queue(
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+    match_queue: MatchQueue = Depends(get_match_queue),
+):
+    """Depth of the test-match queue and how long matches wait before a worker starts them."""
+
+    return MatchQueueOut(workers=match_queue.workers, **match_queue_stats(db))
+
+
+def _own_match(db: Session, match_id: int, user_id: int) -> Match:
+    m = db.scalar(select(Match).where(Match.id == match_id, Match.user_id == user_id))
     if m is None:
         raise HTTPException(status_code=404, detail="match_not_found")
+    return m
+
+
+@router.get("/{match_id}", response_model=MatchOut)
+def matches_get(
+    match_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+    accept_encoding: str | None = Header(default=None),
+):
+    """A match with its full replay (see MatchOut).
+
+    The body is rendered straight from the stored columns by match_json
+    rather than through MatchOut, and compressed when the client accepts
+    gzip or brotli; long replays are mostly repeated history.
+    """
+
+    body = match_json(db, match_id, user.id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="match_not_found")
+    return json_response(body, accept_encoding=accept_encoding)
+
+
+@router.get("/{match_id}/steps", response_model=MatchStepsOut)
+def matches_steps(
+    match_id: int,
+    from_round: int = Query(default=1, alias="from", ge=1),
+    to_round: int | None = Query(default=None, alias="to", ge=1),
+    limit: int = Query(default=50, ge=1, le=200),
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """Steps of rounds `from`..`to` (inclusive; `to` defaults to the last stored round).
+
+    JSON pages hold at most `limit` steps; request the next one with
+    from=next_from until next_from is null. With format=ndjson the whole
+    range is streamed instead, one step per line, without `limit`.
+    """
+
+    m = _own_match(db, match_id, user.id)
+    replay = db.get(MatchReplay, m.id)
 
-    steps = list(db.scalars(select(MatchStep).where(MatchStep.match_id == m.id).order_by(MatchStep.round.asc())))
-    return MatchOut(
+    if format == "ndjson":
+        steps = iter_replay_steps(replay, from_round=from_round, to_round=to_round)
+        return StreamingResponse(
+            (dumps(s) + b"\n" for s in steps),
+            media_type="application/x-ndjson",
+        )
+
+    rounds = replay.rounds if replay is not None else 0
+    end = rounds if to_round is None else min(to_round, rounds)
+    last = min(from_round + limit - 1, end)
+    steps = list(iter_replay_steps(replay, from_round=from_round, to_round=last))
+    return MatchStepsOut(
+        match_id=m.id,
+        status=m.status,
+        rounds=rounds,
+        steps=[MatchStepOut(**s) for s in steps],
+        next_from=last + 1 if last < end else None,
+    )
+
+
+@router.get("/{match_id}/summary", response_model=MatchSummaryOut)
+def matches_summary(match_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    """Final scores and cooperation rates of a match, without its steps."""
+
+    m = _own_match(db, match_id, user.id)
+    return MatchSummaryOut(
         id=m.id,
         env_id=m.env_id,
         bot_id=m.bot_id,
-        bot_code_hash=m.bot_code_hash,
         opponent_name=m.opponent_name,
         seed=m.seed,
         status=m.status,
-        started_at=m.started_at,
-        finished_at=m.finished_at,
         error_log=m.error_log,
-        steps=[
-            MatchStepOut(
-                round=s.round,
-                obs_a=s.obs_a,
-                act_a=s.act_a,
-                obs_b=s.obs_b,
-                act_b=s.act_b,
-                reward_a=s.reward_a,
-                reward_b=s.reward_b,
-                cum_a=s.cum_a,
-                cum_b=s.cum_b,
-            )
-            for s in steps
-        ],
+        **replay_summary(db.get(MatchReplay, m.id)),
     )
 
+
+@router.get("/{match_id}/stream")
+async def matches_stream(
+    match_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+    match_queue: MatchQueue = Depends(get_match_queue),
+    last_event_id: int | None = Header(default=None),
+):
+    """Server-Sent Events feed of a match's rounds as they are played.
+
+    Each round is an `event: round` message (id = round number, data = the
+    round record: round, act_a, act_b, reward_a, reward_b, cum_a, cum_b);
+    the stream ends with an `event: end` message carrying the final status.
+    Rounds already played are sent first, so it works for any match state;
+    a reconnecting client resumes after its Last-Event-ID. Runs on the
+    event loop, so an open stream does not hold a threadpool worker.
+    """
+
+    m = await run_in_threadpool(db.scalar, select(Match.id).where(Match.id == match_id, Match.user_id == user.id))
+    if m is None:
+        raise HTTPException(status_code=404, detail="match_not_found")
+
+    async def events():
+        async for record in match_queue.follow(match_id, after_round=last_event_id or 0):
+            if record is None:
+                yield ": keep-alive\n\n"
+            elif record["event"] == "round":
+                yield f"id: {record['round']}\nevent: round\ndata: {json.dumps(record)}\n\n"
+            else:
+                yield f"event: end\ndata: {json.dumps(record)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -17,6 +19,43 @@ class Settings(BaseSettings):
 
     # Sandbox runner
     runner_image: str = "botarena-runner:latest"
+    # Directory holding the `runner` package, as seen by the sandbox's python.
+    runner_root: str = "/app"
+    # Warm container pool (0 disables it; every match then pays a cold `docker run`).
+    runner_pool_size: int = 2
+    runner_pool_max_matches: int = 100
+    runner_pool_health_interval_seconds: float = 30.0
+    # Global cap on concurrent sandboxes; 0 = derive from host cpus/memory and the
+    # per-container DockerRunConfig limits so the host is never oversubscribed.
+    runner_max_concurrency: int = 0
+    # Part of that cap reserved for asyncio callers (submit preflights), which
+    # wait on their own asyncio.Semaphore; 0 = a quarter of it, at least one.
+    runner_async_concurrency: int = 0
+
+    # Background IPD tournament (runs leaderboard duels off the request path)
+    ipd_tournament_enabled: bool = True
+    ipd_tournament_poll_seconds: float = 30.0
+    ipd_tournament_workers: int = 4
+    ipd_tournament_batch_size: int = 20
+    # Seed budget per duel: pairs where a bot uses `random` are replayed with
+    # derived seeds (in the same sandbox run) until the winner is settled.
+    # 1 = always a single seed.
+    ipd_duel_max_seeds: int = 5
+    # "round_robin": every submitted bot plays every other one (exact averages,
+    # O(N^2) duels). "rating": sampled Glicko-style rating, opponents chosen by
+    # uncertainty until each bot's rating deviation is below the target.
+    ipd_leaderboard_mode: Literal["round_robin", "rating"] = "round_robin"
+    ipd_rating_target_rd: float = 75.0
+    # Test matches (POST /bots/{id}/run-test) are queued and played by this
+    # many background workers (capped like the tournament by sandbox capacity).
+    match_queue_enabled: bool = True
+    match_queue_workers: int = 2
+    match_queue_poll_seconds: float = 5.0
+
+    # Submit-time preflight: a short sandbox match against a built-in opponent
+    # that must load and play cleanly before a bot may enter the tournament.
+    ipd_preflight_enabled: bool = True
+    ipd_preflight_rounds: int = 10
 
 
 settings = Settings()
@@ -5,6 +5,8 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.models.bot import Bot
+from app.services.code_hash import code_hash_py
+from app.services.ipd_leaderboard import forget_ipd_bot, invalidate_ipd_duels
 
 
 def list_bots(db: Session, user_id: int) -> list[Bot]:
@@ -18,7 +20,15 @@ def get_bot(db: Session, user_id: int, bot_id: int) -> Bot | None:
 def create_bot(
     db: Session, *, user_id: int, env_id: str, name: str, description: str | None, code: str
 ) -> Bot:
-    bot = Bot(user_id=user_id, env_id=env_id, name=name, description=description, code=code, submitted=False)
+    bot = Bot(
+        user_id=user_id,
+        env_id=env_id,
+        name=name,
+        description=description,
+        code=code,
+        code_hash=code_hash_py(code),
+        submitted=False,
+    )
     db.add(bot)
     try:
         db.commit()
@@ -33,8 +43,13 @@ def update_bot_code(db: Session, *, user_id: int, bot_id: int, code: str) -> Bot
     bot = get_bot(db, user_id, bot_id)
     if bot is None:
         raise ValueError("bot_not_found")
+    code_hash = code_hash_py(code)
+    changed = code_hash != bot.code_hash
     bot.code = code
+    bot.code_hash = code_hash
     db.add(bot)
+    if changed:
+        invalidate_ipd_duels(db, bot)
     db.commit()
     db.refresh(bot)
     return bot
@@ -44,6 +59,7 @@ def delete_bot(db: Session, *, user_id: int, bot_id: int) -> None:
     bot = get_bot(db, user_id, bot_id)
     if bot is None:
         raise ValueError("bot_not_found")
+    forget_ipd_bot(db, bot)
     db.delete(bot)
     db.commit()
 
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import json
 from dataclasses import dataclass
-from typing import Any, Callable, Literal
+from typing import Any, Callable, Iterable, Iterator, Literal
 
 Action = Literal["C", "D"]
 
@@ -114,3 +114,80 @@ def run_policies(
 
     return RunResult(steps=steps, cum_a=cum_a, cum_b=cum_b)
 
+
+def replay_steps(acts_a: str, acts_b: str) -> list[dict[str, Any]]:
+    """Rebuild the full per-round transcript from compact action strings.
+
+    The sandbox harness only reports one action character per round for each
+    bot; rewards and running scores are derived here, observations by
+    iter_steps.
+    """
+
+    if len(acts_a) != len(acts_b):
+        raise ValueError("action_length_mismatch")
+
+    rounds: list[dict[str, Any]] = []
+    cum_a = 0
+    cum_b = 0
+    for r, (act_a, act_b) in enumerate(zip(acts_a, acts_b), start=1):
+        if not is_valid_action(act_a) or not is_valid_action(act_b):
+            raise ValueError("invalid_action")
+        ra, rb = payoff(act_a, act_b)  # type: ignore[arg-type]
+        cum_a += ra
+        cum_b += rb
+        rounds.append(
+            {"round": r, "act_a": act_a, "act_b": act_b, "reward_a": ra, "reward_b": rb, "cum_a": cum_a, "cum_b": cum_b}
+        )
+    return list(iter_steps(rounds))
+
+
+def iter_steps(
+    rounds: Iterable[dict[str, Any]], *, prefix_a: str = "", prefix_b: str = ""
+) -> Iterator[dict[str, Any]]:
+    """Full steps for consecutive round records, with the observations the bots saw.
+
+    A record holds round, act_a, act_b, reward_a, reward_b, cum_a and cum_b;
+    `prefix_a`/`prefix_b` are the actions of the rounds before the first
+    record. Observations are player-centric: `obs_b["history"]` holds
+    `[act_b, act_a]` pairs. Steps are built one at a time, so a caller that
+    streams them never holds the expanded transcript, whose observations
+    grow with the square of the number of rounds. Each step has history
+    lists of its own, but the pairs in them are shared with later steps:
+    treat them as read-only.
+    """
+
+    hist_a: list[list[Action]] = [[a, b] for a, b in zip(prefix_a, prefix_b)]  # type: ignore[misc]
+    hist_b: list[list[Action]] = [[b, a] for a, b in zip(prefix_a, prefix_b)]  # type: ignore[misc]
+    for rec in rounds:
+        r = rec["round"]
+        yield {
+            "round": r,
+            "obs_a": observation(round_num=r, history=hist_a[:]),
+            "act_a": rec["act_a"],
+            "obs_b": observation(round_num=r, history=hist_b[:]),
+            "act_b": rec["act_b"],
+            "reward_a": rec["reward_a"],
+            "reward_b": rec["reward_b"],
+            "cum_a": rec["cum_a"],
+            "cum_b": rec["cum_b"],
+        }
+        hist_a.append([rec["act_a"], rec["act_b"]])
+        hist_b.append([rec["act_b"], rec["act_a"]])
+
+
+def pack_actions(acts: str) -> bytes:
+    """Bit-pack an action string: bit i (LSB first) of the result is set if round i+1 was "D"."""
+
+    out = bytearray((len(acts) + 7) // 8)
+    for i, act in enumerate(acts):
+        if act == "D":
+            out[i >> 3] |= 1 << (i & 7)
+        elif act != "C":
+            raise ValueError("invalid_action")
+    return bytes(out)
+
+
+def unpack_actions(data: bytes, rounds: int) -> str:
+    """Inverse of pack_actions for a match of `rounds` rounds."""
+
+    return "".join("D" if data[i >> 3] >> (i & 7) & 1 else "C" for i in range(rounds))
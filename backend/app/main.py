@@ -1,12 +1,50 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.api.routers import auth, bots, env, health, matches
+from app.db.session import SessionLocal
+from app.services.docker_ipd_runner import DockerRunConfig
+from app.services.ipd_tournament import IpdTournament
+from app.services.match_queue import MatchQueue
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tournament: IpdTournament = app.state.ipd_tournament
+    match_queue: MatchQueue = app.state.match_queue
+    if settings.ipd_tournament_enabled:
+        tournament.start()
+    if settings.match_queue_enabled:
+        match_queue.start()
+    try:
+        yield
+    finally:
+        match_queue.stop()
+        tournament.stop()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="botarena", version="0.1.0")
+    app = FastAPI(title="botarena", version="0.1.0", lifespan=lifespan)
+
+    app.state.ipd_tournament = IpdTournament(
+        session_factory=SessionLocal,
+        cfg=DockerRunConfig(image=settings.runner_image),
+        poll_interval_s=settings.ipd_tournament_poll_seconds,
+        workers=settings.ipd_tournament_workers,
+        batch_size=settings.ipd_tournament_batch_size,
+        mode=settings.ipd_leaderboard_mode,
+        target_rd=settings.ipd_rating_target_rd,
+        max_seeds=settings.ipd_duel_max_seeds,
+    )
+    app.state.match_queue = MatchQueue(
+        session_factory=SessionLocal,
+        cfg=DockerRunConfig(image=settings.runner_image),
+        workers=settings.match_queue_workers,
+        poll_interval_s=settings.match_queue_poll_seconds,
+    )
 
     origins = [o.strip() for o in settings.cors_origins.split(",") if o.strip()]
     if origins:
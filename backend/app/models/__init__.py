@@ -1,7 +1,11 @@
 from app.models.bot import Bot
+from app.models.bot_preflight import BotPreflight
+from app.models.ipd_bot_stats import IpdBotStats
 from app.models.ipd_duel import IpdDuel
+from app.models.ipd_duel_job import IpdDuelJob
+from app.models.ipd_result_cache import IpdResultCache
 from app.models.match import Match
-from app.models.match_step import MatchStep
+from app.models.match_replay import MatchReplay
 from app.models.user import User
 
-__all__ = ["User", "Bot", "IpdDuel", "Match", "MatchStep"]
+__all__ = ["User", "Bot", "BotPreflight", "IpdBotStats", "IpdDuel", "IpdDuelJob", "IpdResultCache", "Match", "MatchReplay"]
@@ -17,6 +17,8 @@ class Bot(Base):
 
     env_id: Mapped[str] = mapped_column(String(50), nullable=False, index=True)
     code: Mapped[str] = mapped_column(Text, nullable=False)
+    # Canonical AST hash of `code` (see services.code_hash); kept in sync on every write.
+    code_hash: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
     submitted: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default="false")
 
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, Text, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class BotPreflight(Base):
+    """Outcome of the submit-time smoke run for one code snapshot.
+
+    Keyed by code hash and runner build like ipd_result_cache, plus the
+    number of rounds played, so resubmitting (or another bot with the same
+    code) does not start another sandbox.
+    """
+
+    __tablename__ = "bot_preflights"
+    __table_args__ = (UniqueConstraint("code_hash", "harness_version", "rounds", name="uq_bot_preflights_key"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    code_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Docker image id of the runner that ran the preflight.
+    harness_version: Mapped[str] = mapped_column(String(128), nullable=False)
+    # settings.ipd_preflight_rounds at the time of the run.
+    rounds: Mapped[int] = mapped_column(Integer, nullable=False, server_default="10")
+
+    ok: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    # Harness failure category (e.g. "load_failed", "step_timeout") and log if not ok.
+    failure: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    error_log: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    # Module load time, and mean / worst reply time over the preflight rounds.
+    startup_ms: Mapped[float] = mapped_column(Float, nullable=False, server_default="0")
+    avg_step_ms: Mapped[float] = mapped_column(Float, nullable=False, server_default="0")
+    max_step_ms: Mapped[float] = mapped_column(Float, nullable=False, server_default="0")
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
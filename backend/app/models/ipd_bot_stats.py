@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Boolean, DateTime, Float, ForeignKey, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class IpdBotStats(Base):
+    """Running totals of one bot's IPD duels for one code snapshot.
+
+    Updated in the same transaction as every duel insert, so the leaderboard
+    never has to aggregate `ipd_duels`; also holds the snapshot's rating for
+    the sampled rating mode. Rows for a bot's previous code hashes
+    are dropped when its code changes.
+    """
+
+    __tablename__ = "ipd_bot_stats"
+
+    bot_id: Mapped[int] = mapped_column(ForeignKey("bots.id", ondelete="CASCADE"), primary_key=True)
+    code_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+
+    score_sum: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    exec_ms_sum: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    duels: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+
+    # Glicko rating and rating deviation (see services.ipd_rating).
+    rating: Mapped[float] = mapped_column(Float, nullable=False, server_default="1500")
+    rating_rd: Mapped[float] = mapped_column(Float, nullable=False, server_default="350")
+
+    # Duels this snapshot forfeited; a quarantined snapshot gets no new duels
+    # (see services.ipd_leaderboard.QUARANTINE_AFTER_FORFEITS).
+    forfeits: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0", default=0)
+    quarantined: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default="false", default=False)
+
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False
+    )
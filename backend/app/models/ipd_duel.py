@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlalchemy import CheckConstraint, DateTime, ForeignKey, Integer, String, UniqueConstraint, func
+from sqlalchemy import Boolean, CheckConstraint, DateTime, Float, ForeignKey, Integer, String, UniqueConstraint, func
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.base import Base
@@ -33,4 +33,19 @@ class IpdDuel(Base):
     exec_ms_1: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
     exec_ms_2: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
 
+    # Adaptive multi-seed evaluation: seeds played, and mean / standard deviation
+    # of (score1 - score2) across them. score1/score2 are then mean scores.
+    samples: Mapped[int] = mapped_column(Integer, nullable=False, server_default="1", default=1)
+    score_diff_mean: Mapped[float] = mapped_column(Float, nullable=False, server_default="0", default=0.0)
+    score_diff_sd: Mapped[float] = mapped_column(Float, nullable=False, server_default="0", default=0.0)
+
+    # Set once either bot's code has changed since the duel was played; such
+    # duels are kept for history but no longer count towards the leaderboard.
+    obsolete: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default="false", default=False)
+
+    # Duels lost to bot misbehaviour: the harness' failure category and which
+    # side caused it ("bot1", "bot2" or "both"); scored as a forfeit.
+    failure: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    fault: Mapped[str | None] = mapped_column(String(8), nullable=True)
+
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
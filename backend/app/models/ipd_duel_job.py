@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Integer, String, Text, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class IpdDuelJob(Base):
+    """A planned duel for one (pair, code hashes) snapshot, run by the background tournament."""
+
+    __tablename__ = "ipd_duel_jobs"
+    __table_args__ = (
+        UniqueConstraint("bot1_id", "bot2_id", "bot1_hash", "bot2_hash", name="uq_ipd_duel_jobs_pair_hash"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    bot1_id: Mapped[int] = mapped_column(ForeignKey("bots.id", ondelete="CASCADE"), nullable=False, index=True)
+    bot2_id: Mapped[int] = mapped_column(ForeignKey("bots.id", ondelete="CASCADE"), nullable=False, index=True)
+    bot1_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    bot2_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+
+    # "queued" | "running" | "done" | "failed" | "stale" | "cancelled"
+    # ("failed": the sandbox kept failing until the attempts ran out)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, index=True, server_default="queued")
+    # Higher runs first; duels of a just-edited bot jump the queue.
+    priority: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0", default=0)
+    error_log: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Times the job was claimed; a queued job is not claimed before retry_after.
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0", default=0)
+    retry_after: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Integer, String, UniqueConstraint, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class IpdResultCache(Base):
+    """Outcome of one sandbox match, keyed by content rather than by bot.
+
+    A match is fully determined by the two code hashes (bot A, bot B), the
+    seed (and seed budget) and the runner build, so any pair of bots with these hashes can
+    reuse it. Rows are never served across runner builds.
+    """
+
+    __tablename__ = "ipd_result_cache"
+    __table_args__ = (
+        UniqueConstraint("hash_a", "hash_b", "seed", "max_seeds", "harness_version", name="uq_ipd_result_cache_key"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    hash_a: Mapped[str] = mapped_column(String(64), nullable=False)
+    hash_b: Mapped[str] = mapped_column(String(64), nullable=False)
+    seed: Mapped[int] = mapped_column(Integer, nullable=False)
+    # Seed budget of the adaptive multi-seed evaluation the result came from.
+    max_seeds: Mapped[int] = mapped_column(Integer, nullable=False, server_default="1")
+    # Docker image id of the runner that played the match.
+    harness_version: Mapped[str] = mapped_column(String(128), nullable=False)
+
+    score_a: Mapped[int] = mapped_column(Integer, nullable=False)
+    score_b: Mapped[int] = mapped_column(Integer, nullable=False)
+    exec_ms_a: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    exec_ms_b: Mapped[int] = mapped_column(Integer, nullable=False, server_default="0")
+    samples: Mapped[int] = mapped_column(Integer, nullable=False, server_default="1")
+    score_diff_mean: Mapped[float] = mapped_column(Float, nullable=False, server_default="0")
+    score_diff_sd: Mapped[float] = mapped_column(Float, nullable=False, server_default="0")
+
+    # Set for matches lost to bot misbehaviour: failure category and the side
+    # at fault ("a", "b" or "both"); the scores are then unused.
+    failure: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    fault: Mapped[str | None] = mapped_column(String(8), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -22,16 +22,21 @@ class Match(Base):
     opponent_name: Mapped[str] = mapped_column(String(100), nullable=False)
     seed: Mapped[int] = mapped_column(Integer, nullable=False)
 
-    # "running" | "completed" | "failed"
+    # "queued" | "running" | "completed" | "failed"
     status: Mapped[str] = mapped_column(String(30), nullable=False, index=True)
 
+    # Set when the match is requested; started_at is (re)set when a worker picks it up.
+    queued_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Refreshed by the process playing the match; a running match whose
+    # heartbeat stops is put back in the queue (see services.match_queue).
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     error_log: Mapped[str | None] = mapped_column(Text, nullable=True)
 
     owner = relationship("User")
     bot = relationship("Bot")
 
-    steps = relationship("MatchStep", back_populates="match", cascade="all, delete-orphan")
+    replay = relationship("MatchReplay", back_populates="match", uselist=False, cascade="all, delete-orphan")
 
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from sqlalchemy import ForeignKey, Integer, LargeBinary
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+from app.db.base import Base
+
+
+class MatchReplay(Base):
+    """The whole transcript of one match, stored column-wise in a single row.
+
+    Actions are bit-packed (see app.env.ipd.pack_actions), rewards take one
+    byte per round and cumulative scores are little-endian uint32 arrays.
+    Observations are not stored; they are rebuilt from the actions on read
+    (see services.match_replay).
+    """
+
+    __tablename__ = "match_replays"
+
+    match_id: Mapped[int] = mapped_column(ForeignKey("matches.id", ondelete="CASCADE"), primary_key=True)
+    rounds: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    acts_a: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    acts_b: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    rewards_a: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    rewards_b: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    cum_a: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    cum_b: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    match = relationship("Match", back_populates="replay")
@@ -27,10 +27,47 @@ class MatchOut(BaseModel):
     finished_at: datetime | None
     error_log: str | None
     steps: list[MatchStepOut]
+    queued_at: datetime | None = None
+    # 1 = next to run; None unless status is "queued".
+    queue_position: int | None = None
+
+
+class MatchStepsOut(BaseModel):
+    match_id: int
+    status: str
+    # Rounds stored so far; grows while the match is running.
+    rounds: int
+    steps: list[MatchStepOut]
+    # `from` of the next page; None once the requested range is exhausted.
+    next_from: int | None
+
+
+class MatchSummaryOut(BaseModel):
+    id: int
+    env_id: str
+    bot_id: int
+    opponent_name: str
+    seed: int
+    status: str
+    error_log: str | None
+    rounds: int
+    score_a: int
+    score_b: int
+    # Share of rounds played "C"; None before the first round.
+    coop_rate_a: float | None
+    coop_rate_b: float | None
 
 
 class RunTestOut(BaseModel):
     match_id: int
-    cum_a: int
-    cum_b: int
+    status: str
+    queue_position: int | None
+
+
+class MatchQueueOut(BaseModel):
+    queued: int
+    running: int
+    workers: int
+    oldest_wait_s: float
+    avg_wait_s: float
 
@@ -16,9 +16,14 @@ def code_hash_py(code: str) -> str:
     - literal values
     - control flow
 
-    Raises SyntaxError if code is invalid.
+    Code that does not parse (e.g. a saved draft) is hashed by its raw
+    source instead: the hash still changes with every edit, and the syntax
+    error surfaces when the sandbox loads the bot (run-test, preflight).
     """
 
-    tree = ast.parse(code)
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return hashlib.sha256(code.encode("utf-8", "surrogatepass")).hexdigest()
     canonical = ast.dump(tree, include_attributes=False)
     return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
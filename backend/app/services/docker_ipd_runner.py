@@ -1,9 +1,21 @@
 from __future__ import annotations
 
+import asyncio
 import base64
 import json
+import os
+import secrets
+import select
+import statistics
 import subprocess
-from dataclasses import dataclass
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field, replace
+from typing import Callable
+
+from app.core.config import settings
+from app.services.runner_pool import RunnerPool, RunnerWorkerError, runner_module_cmd
 
 
 @dataclass(frozen=True)
@@ -19,32 +31,66 @@ class DockerRunConfig:
 
 @dataclass(frozen=True)
 class DockerIpdResult:
-    steps: list[dict]
     cum_a: int
     cum_b: int
+    # Compact transcript: one action character per round for each bot.
+    acts_a: str = ""
+    acts_b: str = ""
+    rewards_a: list[int] = field(default_factory=list)
+    rewards_b: list[int] = field(default_factory=list)
+    seed: int | None = None
     exec_ms_a: float = 0.0
     exec_ms_b: float = 0.0
     avg_exec_ms_a: float = 0.0
     avg_exec_ms_b: float = 0.0
+    # Time from spawning each bot worker until it reported its module loaded.
+    startup_ms_a: float = 0.0
+    startup_ms_b: float = 0.0
+    # Slowest single reply of each bot.
+    max_step_ms_a: float = 0.0
+    max_step_ms_b: float = 0.0
     error_log: str | None = None
+    # Adaptive multi-seed evaluation: number of seeds played and the mean /
+    # sample standard deviation of (cum_a - cum_b) across them. With more
+    # than one sample, cum_a/cum_b are the (rounded) mean scores while the
+    # transcript is the first seed's.
+    samples: int = 1
+    score_diff_mean: float = 0.0
+    score_diff_sd: float = 0.0
+    # For matches lost to bot misbehaviour: the harness' error category
+    # (e.g. "load_failed", "step_timeout") and who caused it ("a", "b", "both").
+    failure: str | None = None
+    fault: str | None = None
+
+    def swapped(self) -> DockerIpdResult:
+        """The same match seen with bot A and bot B exchanged."""
+        return replace(
+            self,
+            cum_a=self.cum_b,
+            cum_b=self.cum_a,
+            acts_a=self.acts_b,
+            acts_b=self.acts_a,
+            rewards_a=self.rewards_b,
+            rewards_b=self.rewards_a,
+            exec_ms_a=self.exec_ms_b,
+            exec_ms_b=self.exec_ms_a,
+            avg_exec_ms_a=self.avg_exec_ms_b,
+            avg_exec_ms_b=self.avg_exec_ms_a,
+            startup_ms_a=self.startup_ms_b,
+            startup_ms_b=self.startup_ms_a,
+            max_step_ms_a=self.max_step_ms_b,
+            max_step_ms_b=self.max_step_ms_a,
+            score_diff_mean=-self.score_diff_mean,
+            fault={"a": "b", "b": "a"}.get(self.fault or "", self.fault),
+        )
 
 
 def _b64(s: str) -> str:
     return base64.b64encode(s.encode("utf-8")).decode("ascii")
 
 
-def run_ipd_in_docker(*, cfg: DockerRunConfig, bot_a_code: str, bot_b_code: str, seed: int) -> DockerIpdResult:
-    payload = {
-        "bot_a_b64": _b64(bot_a_code),
-        "bot_b_b64": _b64(bot_b_code),
-        "seed": int(seed),
-    }
-
-    cmd = [
-        "docker",
-        "run",
-        "--rm",
-        "-i",
+def _docker_args(cfg: DockerRunConfig) -> list[str]:
+    return [
         "--network",
         "none",
         "--read-only",
@@ -62,44 +108,511 @@ def run_ipd_in_docker(*, cfg: DockerRunConfig, bot_a_code: str, bot_b_code: str,
         "no-new-privileges",
         "--cap-drop",
         "ALL",
-        cfg.image,
-        "python",
-        "-I",
-        "-c",
-        "import sys,runpy; sys.path.insert(0,'/app'); runpy.run_module('runner.harness', run_name='__main__')",
     ]
 
+
+_MEMORY_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def _memory_bytes(spec: str) -> int:
+    # Docker-style sizes: "256m", "1g", "512000".
+    spec = spec.strip().lower()
+    unit = spec[-1] if spec and spec[-1].isalpha() else ""
+    return int(float(spec[: len(spec) - len(unit)]) * _MEMORY_UNITS[unit])
+
+
+def sandbox_capacity(cfg: DockerRunConfig) -> int:
+    """How many sandboxes with `cfg`'s cpus/memory limits fit on this host at once."""
+
+    by_cpu = int((os.cpu_count() or 1) // max(float(cfg.cpus), 0.01))
+    try:
+        host_mem = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        by_mem = int(host_mem // max(_memory_bytes(cfg.memory), 1))
+    except (ValueError, OSError, KeyError):
+        by_mem = by_cpu
+    cap = min(by_cpu, by_mem)
+    if settings.runner_max_concurrency > 0:
+        cap = min(cap, settings.runner_max_concurrency)
+    return max(cap, 1)
+
+
+_HARNESS_VERSION_TTL_S = 60.0
+_harness_versions: dict[str, tuple[float, str]] = {}
+_harness_versions_lock = threading.Lock()
+
+
+def harness_version(cfg: DockerRunConfig) -> str:
+    """Identity of the runner build behind `cfg.image` (its Docker image id).
+
+    Match results are cached under this value, so rebuilding the runner image
+    invalidates them. Returns "" when it cannot be determined; callers must
+    then bypass the cache.
+    """
+
+    now = time.monotonic()
+    with _harness_versions_lock:
+        hit = _harness_versions.get(cfg.image)
+        if hit is not None and now - hit[0] < _HARNESS_VERSION_TTL_S:
+            return hit[1]
+
     try:
         p = subprocess.run(
-            cmd,
-            input=json.dumps(payload).encode("utf-8"),
+            ["docker", "image", "inspect", "--format", "{{.Id}}", cfg.image],
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=cfg.timeout_seconds,
+            stderr=subprocess.DEVNULL,
+            timeout=10,
             check=False,
         )
-    except subprocess.TimeoutExpired:
-        return DockerIpdResult(steps=[], cum_a=0, cum_b=0, error_log="docker_timeout")
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    version = (p.stdout or b"").decode("utf-8", errors="replace").strip() if p.returncode == 0 else ""
+    if version:
+        with _harness_versions_lock:
+            _harness_versions[cfg.image] = (now, version)
+    return version
+
+
+def _slot_shares() -> tuple[int, int]:
+    # (threaded, asyncio) shares of the global sandbox cap, sized from the
+    # configured runner's limits. Each kind of caller waits fairly on its own
+    # semaphore; with a cap of 1 both get one slot (two sandboxes at most).
+    cap = sandbox_capacity(DockerRunConfig(image=settings.runner_image))
+    if settings.runner_async_concurrency > 0:
+        async_share = min(settings.runner_async_concurrency, cap)
+    else:
+        async_share = max(cap // 4, 1)
+    return max(cap - async_share, 1), async_share
+
+
+_slots: threading.BoundedSemaphore | None = None
+_async_slots: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+_slots_lock = threading.Lock()
+
+
+def _sandbox_slots() -> threading.BoundedSemaphore:
+    # Cap on sandboxes run from threads (run-test, tournament workers).
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(_slot_shares()[0])
+        return _slots
+
+
+def _async_sandbox_slots() -> asyncio.Semaphore:
+    # Cap on sandboxes run from coroutines; one semaphore per event loop,
+    # since an asyncio.Semaphore is bound to the loop it is awaited on.
+    loop = asyncio.get_running_loop()
+    with _slots_lock:
+        slots = _async_slots.get(loop)
+        if slots is None:
+            slots = _async_slots[loop] = asyncio.Semaphore(_slot_shares()[1])
+        return slots
+
+
+_pools: dict[DockerRunConfig, RunnerPool] = {}
+_pools_lock = threading.Lock()
 
-    if p.returncode != 0:
-        err = (p.stderr or b"").decode("utf-8", errors="replace")[:65536]
-        out = (p.stdout or b"").decode("utf-8", errors="replace")[:65536]
-        return DockerIpdResult(steps=[], cum_a=0, cum_b=0, error_log=f"docker_failed rc={p.returncode}\n{err}\n{out}")
 
+def _get_pool(cfg: DockerRunConfig) -> RunnerPool | None:
+    if settings.runner_pool_size <= 0:
+        return None
+    with _pools_lock:
+        pool = _pools.get(cfg)
+        if pool is None:
+            pool = RunnerPool(
+                cfg,
+                docker_args=_docker_args(cfg),
+                size=settings.runner_pool_size,
+                max_matches=settings.runner_pool_max_matches,
+                health_interval_s=settings.runner_pool_health_interval_seconds,
+            )
+            _pools[cfg] = pool
+        return pool
+
+
+def _parse_output(stdout: bytes, stderr: bytes = b"") -> DockerIpdResult:
     try:
-        body = json.loads((p.stdout or b"{}").decode("utf-8"))
+        body = json.loads((stdout or b"{}").decode("utf-8"))
+        if body.get("error_log"):
+            fault = body.get("fault")
+            return DockerIpdResult(
+                cum_a=0,
+                cum_b=0,
+                error_log=str(body["error_log"]),
+                failure=str(body["error"]) if body.get("error") and fault in ("a", "b", "both") else None,
+                fault=fault if fault in ("a", "b", "both") else None,
+            )
+        if "steps" in body:
+            # Older runner images report full per-round steps.
+            legacy = list(body["steps"] or [])
+            body["acts_a"] = "".join(str(s["act_a"]) for s in legacy)
+            body["acts_b"] = "".join(str(s["act_b"]) for s in legacy)
+            body["rewards_a"] = [int(s["reward_a"]) for s in legacy]
+            body["rewards_b"] = [int(s["reward_b"]) for s in legacy]
+        cums_a = [int(body["cum_a"])]
+        cums_b = [int(body["cum_b"])]
+        if body.get("samples"):
+            cums_a = [int(x) for x in body["samples"]["cum_a"]]
+            cums_b = [int(x) for x in body["samples"]["cum_b"]]
+        diffs = [a - b for a, b in zip(cums_a, cums_b)]
         return DockerIpdResult(
-            steps=list(body.get("steps") or []),
-            cum_a=int(body["cum_a"]),
-            cum_b=int(body["cum_b"]),
+            cum_a=round(statistics.fmean(cums_a)),
+            cum_b=round(statistics.fmean(cums_b)),
+            acts_a=str(body.get("acts_a") or ""),
+            acts_b=str(body.get("acts_b") or ""),
+            rewards_a=[int(x) for x in body.get("rewards_a") or []],
+            rewards_b=[int(x) for x in body.get("rewards_b") or []],
+            seed=int(body["seed"]) if body.get("seed") is not None else None,
             exec_ms_a=float(body.get("exec_ms_a") or 0.0),
             exec_ms_b=float(body.get("exec_ms_b") or 0.0),
             avg_exec_ms_a=float(body.get("avg_exec_ms_a") or 0.0),
             avg_exec_ms_b=float(body.get("avg_exec_ms_b") or 0.0),
-            error_log=body.get("error_log"),
+            startup_ms_a=float(body.get("startup_ms_a") or 0.0),
+            startup_ms_b=float(body.get("startup_ms_b") or 0.0),
+            max_step_ms_a=float(body.get("max_step_ms_a") or 0.0),
+            max_step_ms_b=float(body.get("max_step_ms_b") or 0.0),
+            samples=len(diffs),
+            score_diff_mean=statistics.fmean(diffs),
+            score_diff_sd=statistics.stdev(diffs) if len(diffs) > 1 else 0.0,
         )
     except Exception as e:  # noqa: BLE001
-        out = (p.stdout or b"").decode("utf-8", errors="replace")[:65536]
-        err = (p.stderr or b"").decode("utf-8", errors="replace")[:65536]
-        return DockerIpdResult(steps=[], cum_a=0, cum_b=0, error_log=f"invalid_runner_output: {e}\n{err}\n{out}")
+        out = (stdout or b"").decode("utf-8", errors="replace")[:65536]
+        err = (stderr or b"").decode("utf-8", errors="replace")[:65536]
+        return DockerIpdResult(cum_a=0, cum_b=0, error_log=f"invalid_runner_output: {e}\n{err}\n{out}")
+
+
+def run_ipd_in_docker(
+    *,
+    cfg: DockerRunConfig,
+    bot_a_code: str,
+    bot_b_code: str,
+    seed: int,
+    max_seeds: int = 1,
+    rounds: int | None = None,
+    on_round: Callable[[dict], None] | None = None,
+    on_start: Callable[[], None] | None = None,
+) -> DockerIpdResult:
+    """Play one match in the sandbox.
+
+    With `max_seeds` > 1 the harness may replay it with derived seeds (all in
+    this one invocation) until the pair's winner is statistically settled;
+    see DockerIpdResult.samples. The timeout scales with `max_seeds`.
+    `rounds` plays only the first that many rounds (e.g. for a preflight).
+    With `on_round`, the harness streams each round of the (first) match as
+    it is played and `on_round` is called with the harness' round record
+    (round, act_a/act_b, reward_a/reward_b, cum_a/cum_b) from this thread.
+    `on_start` is called once a sandbox slot is held, i.e. when the time spent
+    waiting for one is over and the match itself starts.
+    """
+
+    with _sandbox_slots():
+        if on_start is not None:
+            on_start()
+        return _run_ipd(
+            cfg=cfg,
+            bot_a_code=bot_a_code,
+            bot_b_code=bot_b_code,
+            seed=seed,
+            max_seeds=max_seeds,
+            rounds=rounds,
+            on_round=on_round,
+        )
+
+
+def _stream_process(
+    cmd: list[str], data: bytes, timeout_s: float, on_line: Callable[[bytes], None]
+) -> tuple[int, bytes, bytes]:
+    """Like subprocess.run(), but hands each stdout line to `on_line` as it arrives.
+
+    Returns (returncode, last stdout line, stderr); raises
+    subprocess.TimeoutExpired after `timeout_s`.
+    """
+
+    p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert p.stdin is not None and p.stdout is not None and p.stderr is not None
+    try:
+        p.stdin.write(data)
+        p.stdin.close()
+    except (BrokenPipeError, OSError):
+        pass
+    deadline = time.monotonic() + timeout_s
+    out_fd, err_fd = p.stdout.fileno(), p.stderr.fileno()
+    buf, err, last = b"", b"", b""
+    open_fds = {out_fd, err_fd}
+    try:
+        while open_fds:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise subprocess.TimeoutExpired(cmd, timeout_s)
+            ready, _, _ = select.select(list(open_fds), [], [], left)
+            for fd in ready:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    open_fds.discard(fd)
+                elif fd == err_fd:
+                    err = (err + chunk)[-65536:]
+                else:
+                    buf += chunk
+                    while b"\n" in buf:
+                        line, _, buf = buf.partition(b"\n")
+                        last = line
+                        on_line(line)
+        if buf:
+            last = buf
+        return p.wait(timeout=max(deadline - time.monotonic(), 0.1)), last, err
+    finally:
+        if p.poll() is None:
+            p.kill()
+            p.wait()
+        p.stdout.close()
+        p.stderr.close()
 
+
+def _match_request(
+    *, cfg: DockerRunConfig, bot_a_code: str, bot_b_code: str, seed: int, max_seeds: int, rounds: int | None, stream: bool
+) -> tuple[bytes, float]:
+    # Harness input and the wall-clock budget for it.
+    payload = {
+        "bot_a_b64": _b64(bot_a_code),
+        "bot_b_b64": _b64(bot_b_code),
+        "seed": int(seed),
+    }
+    if max_seeds > 1:
+        payload["max_seeds"] = int(max_seeds)
+    if rounds is not None:
+        payload["rounds"] = int(rounds)
+    if stream:
+        payload["stream"] = True
+    return json.dumps(payload).encode("utf-8"), float(cfg.timeout_seconds * max(max_seeds, 1))
+
+
+def _harness_cmd(cfg: DockerRunConfig, *, name: str | None = None) -> list[str]:
+    # A one-off sandbox running a single harness invocation.
+    return [
+        "docker",
+        "run",
+        "--rm",
+        "-i",
+        *(["--name", name] if name else []),
+        *_docker_args(cfg),
+        cfg.image,
+        *runner_module_cmd("runner.harness"),
+    ]
+
+
+def _harness_result(returncode: int, stdout: bytes, stderr: bytes) -> DockerIpdResult:
+    # One harness invocation's result, the same whether it ran in a warm
+    # container (rc from the response line) or a cold `docker run`.
+    if returncode != 0:
+        # Bot failures exit non-zero but still print a result body naming the culprit.
+        failed = _parse_output(stdout)
+        if failed.failure is not None:
+            return failed
+        err = stderr.decode("utf-8", errors="replace")[:65536]
+        out = stdout.decode("utf-8", errors="replace")[:65536]
+        return DockerIpdResult(cum_a=0, cum_b=0, error_log=f"docker_failed rc={returncode}\n{err}\n{out}")
+    return _parse_output(stdout, stderr)
+
+
+def _response_rc(line: bytes) -> int:
+    # Harness exit code carried by a runner.server response; an unreadable
+    # line is left for _parse_output to report.
+    try:
+        return int(json.loads(line).get("rc", 0))
+    except (ValueError, TypeError, AttributeError):
+        return 0
+
+
+def _run_ipd(
+    *,
+    cfg: DockerRunConfig,
+    bot_a_code: str,
+    bot_b_code: str,
+    seed: int,
+    max_seeds: int,
+    rounds: int | None,
+    on_round: Callable[[dict], None] | None = None,
+) -> DockerIpdResult:
+    data, timeout_s = _match_request(
+        cfg=cfg,
+        bot_a_code=bot_a_code,
+        bot_b_code=bot_b_code,
+        seed=seed,
+        max_seeds=max_seeds,
+        rounds=rounds,
+        stream=on_round is not None,
+    )
+
+    pool = _get_pool(cfg)
+    if pool is not None:
+        try:
+            out = pool.run(data, timeout_s=timeout_s, on_event=on_round)
+        except RunnerWorkerError as e:
+            # Same strings as a cold run that timed out or whose container died.
+            error_log = "docker_timeout" if str(e) == "worker_timeout" else f"docker_failed {e}"
+            return DockerIpdResult(cum_a=0, cum_b=0, error_log=error_log)
+        if out is not None:
+            return _harness_result(_response_rc(out), out, b"")
+
+    # Cold path: no warm container available (or the pool is disabled).
+    cmd = _harness_cmd(cfg)
+    try:
+        if on_round is None:
+            p = subprocess.run(
+                cmd,
+                input=data,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=timeout_s,
+                check=False,
+            )
+            returncode, stdout, stderr = p.returncode, p.stdout or b"", p.stderr or b""
+        else:
+
+            def on_line(line: bytes) -> None:
+                if line.startswith(b'{"event"'):
+                    on_round(json.loads(line))
+
+            returncode, stdout, stderr = _stream_process(cmd, data, timeout_s, on_line)
+    except subprocess.TimeoutExpired:
+        return DockerIpdResult(cum_a=0, cum_b=0, error_log="docker_timeout")
+
+    return _harness_result(returncode, stdout, stderr)
+
+
+# The final result line can carry a long error log.
+_ASYNC_LINE_LIMIT = 4 * 1024 * 1024
+
+
+async def run_ipd_in_docker_async(
+    *,
+    cfg: DockerRunConfig,
+    bot_a_code: str,
+    bot_b_code: str,
+    seed: int,
+    max_seeds: int = 1,
+    rounds: int | None = None,
+    on_round: Callable[[dict], None] | None = None,
+) -> DockerIpdResult:
+    """run_ipd_in_docker for async endpoints: a waiting match holds no thread.
+
+    Always plays in a fresh sandbox started with asyncio.create_subprocess_exec
+    (the warm RunnerPool talks to its containers over blocking pipes).
+    stdout is parsed line by line as it arrives; `on_round` is called on the
+    event loop. The timeout is enforced with asyncio.wait_for. On timeout,
+    or when the awaiting task is cancelled (e.g. the client disconnected),
+    the container is killed by name before returning "docker_timeout" or
+    re-raising; killing only the docker CLI would leave it running.
+
+    Sandbox slots for coroutines are a share of the global cap with their
+    own asyncio.Semaphore (see runner_async_concurrency), waited on in FIFO
+    order for at most one match's time budget; "sandbox_busy" if none freed up.
+    """
+
+    slots = _async_sandbox_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), cfg.timeout_seconds * max(max_seeds, 1))
+    except asyncio.TimeoutError:
+        return DockerIpdResult(cum_a=0, cum_b=0, error_log="sandbox_busy")
+    try:
+        return await _run_ipd_async(
+            cfg=cfg,
+            bot_a_code=bot_a_code,
+            bot_b_code=bot_b_code,
+            seed=seed,
+            max_seeds=max_seeds,
+            rounds=rounds,
+            on_round=on_round,
+        )
+    finally:
+        slots.release()
+
+
+async def _run_ipd_async(
+    *,
+    cfg: DockerRunConfig,
+    bot_a_code: str,
+    bot_b_code: str,
+    seed: int,
+    max_seeds: int,
+    rounds: int | None,
+    on_round: Callable[[dict], None] | None,
+) -> DockerIpdResult:
+    data, timeout_s = _match_request(
+        cfg=cfg,
+        bot_a_code=bot_a_code,
+        bot_b_code=bot_b_code,
+        seed=seed,
+        max_seeds=max_seeds,
+        rounds=rounds,
+        stream=on_round is not None,
+    )
+    name = f"ipd-{secrets.token_hex(8)}"
+    proc = await asyncio.create_subprocess_exec(
+        *_harness_cmd(cfg, name=name),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=_ASYNC_LINE_LIMIT,
+    )
+    try:
+        returncode, stdout, stderr = await asyncio.wait_for(_communicate_async(proc, data, on_round), timeout_s)
+    except asyncio.TimeoutError:
+        await _kill_sandbox(proc, name)
+        return DockerIpdResult(cum_a=0, cum_b=0, error_log="docker_timeout")
+    except BaseException:
+        # Cancelled (or failed) mid-match: the sandbox must not outlive us.
+        await asyncio.shield(_kill_sandbox(proc, name))
+        raise
+    return _harness_result(returncode, stdout, stderr)
+
+
+async def _communicate_async(
+    proc: asyncio.subprocess.Process, data: bytes, on_round: Callable[[dict], None] | None
+) -> tuple[int, bytes, bytes]:
+    """Returns (returncode, last stdout line, stderr), handing round records to `on_round` on the way."""
+
+    assert proc.stdin is not None and proc.stdout is not None and proc.stderr is not None
+
+    async def read_stderr() -> bytes:
+        err = b""
+        while chunk := await proc.stderr.read(65536):
+            err = (err + chunk)[-65536:]
+        return err
+
+    err_task = asyncio.ensure_future(read_stderr())
+    try:
+        try:
+            proc.stdin.write(data)
+            await proc.stdin.drain()
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        last = b""
+        while line := await proc.stdout.readline():
+            line = line.rstrip(b"\n")
+            if not line:
+                continue
+            last = line
+            if on_round is not None and line.startswith(b'{"event"'):
+                on_round(json.loads(line))
+        return await proc.wait(), last, await err_task
+    finally:
+        err_task.cancel()
+
+
+async def _kill_sandbox(proc: asyncio.subprocess.Process, name: str) -> None:
+    if proc.returncode is not None:
+        return
+    try:
+        killer = await asyncio.create_subprocess_exec(
+            "docker", "kill", name, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        await asyncio.wait_for(killer.wait(), 10)
+    except (OSError, asyncio.TimeoutError):
+        pass
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        pass
+    await proc.wait()
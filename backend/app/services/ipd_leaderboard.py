@@ -1,15 +1,54 @@
 from __future__ import annotations
 
 import hashlib
+from dataclasses import dataclass
+from typing import Callable
 
-from sqlalchemy import and_, case, func, or_, select
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, delete, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
 
+from app.env.ipd import ROUNDS
 from app.models.bot import Bot
+from app.models.ipd_bot_stats import IpdBotStats
 from app.models.ipd_duel import IpdDuel
+from app.models.ipd_result_cache import IpdResultCache
 from app.models.user import User
-from app.services.code_hash import code_hash_py
-from app.services.docker_ipd_runner import DockerRunConfig, run_ipd_in_docker
+from app.services.docker_ipd_runner import DockerIpdResult, DockerRunConfig, run_ipd_in_docker
+from app.services.ipd_rating import INITIAL_RATING, INITIAL_RD, add_to_stats, rate_duel
+
+
+# Bot failures the harness attributes to one side (or both). They depend only
+# on the code, so they are stored as ordinary duel results instead of being
+# retried; anything else (Docker errors, unparsable runner output) fails the
+# duel, and the tournament retries it (see ipd_tournament.MAX_ATTEMPTS).
+BOT_FAILURES = frozenset(
+    {
+        "load_failed",
+        "step_timeout",
+        "match_timeout",
+        "invalid_action",
+        "invalid_reply",
+        "act_failed",
+        "bot_exited",
+    }
+)
+
+# Bot failures that recur whenever the same code is run again. Only these are
+# kept in the result cache and count towards quarantine; the others (timeouts,
+# a bot process that died) can be caused by host load, so the match is played
+# once more and only a repeat is recorded as a forfeit (see play_duel).
+DETERMINISTIC_FAILURES = frozenset({"load_failed", "invalid_action", "invalid_reply", "act_failed"})
+
+# Forfeit rule: in a failed duel the bot(s) at fault score 0 and a blameless
+# opponent scores FORFEIT_WIN_SCORE, what full mutual cooperation would have
+# earned it. Execution time is not counted for either side.
+FORFEIT_WIN_SCORE = 3 * ROUNDS
+
+# A snapshot is quarantined (left out of new duels until its code changes)
+# after this many forfeits, or after the first one if its code does not load.
+QUARANTINE_AFTER_FORFEITS = 2
 
 
 def _stable_seed(a: str, b: str) -> int:
@@ -17,115 +56,406 @@ def _stable_seed(a: str, b: str) -> int:
     return int.from_bytes(h[:4], "big") & 0x7FFFFFFF
 
 
-def ensure_ipd_duel(*, db: Session, cfg: DockerRunConfig, bot_x: Bot, bot_y: Bot) -> IpdDuel:
-    """Ensure a duel exists for the (unordered) pair.
+@dataclass(frozen=True)
+class DuelSpec:
+    """Everything needed to play one duel, detached from any DB session."""
 
-    We store the duel as (bot1_id < bot2_id) and run exactly one sandbox match,
-    with history normalized per-bot ([my_action, opp_action]).
-    """
+    bot1_id: int
+    bot2_id: int
+    bot1_hash: str
+    bot2_hash: str
+    code1: str
+    code2: str
+    seed: int
+    # True if bot2 plays the sandbox's side A (see duel_spec).
+    swapped: bool = False
+    # Upper bound on seeds for adaptive multi-seed evaluation (1 = single run).
+    max_seeds: int = 1
 
+
+def duel_spec(bot_x: Bot, bot_y: Bot, *, max_seeds: int = 1) -> DuelSpec:
     if bot_x.id == bot_y.id:
         raise ValueError("same_bot")
 
     # order by id for stability
-    if bot_x.id < bot_y.id:
-        b1, b2 = bot_x, bot_y
-        flip = False
-    else:
-        b1, b2 = bot_y, bot_x
-        flip = True
+    b1, b2 = (bot_x, bot_y) if bot_x.id < bot_y.id else (bot_y, bot_x)
+    # The match itself is played in hash order (lower hash is side A) and
+    # seeded from the hashes alone, so its outcome depends only on the code
+    # and can be shared by any pair of bots with the same two hashes.
+    ha, hb = sorted((b1.code_hash, b2.code_hash))
+    return DuelSpec(
+        bot1_id=b1.id,
+        bot2_id=b2.id,
+        bot1_hash=b1.code_hash,
+        bot2_hash=b2.code_hash,
+        code1=b1.code,
+        code2=b2.code,
+        seed=_stable_seed(ha, hb),
+        swapped=b1.code_hash > b2.code_hash,
+        max_seeds=max_seeds,
+    )
 
-    h1 = code_hash_py(b1.code)
-    h2 = code_hash_py(b2.code)
 
-    existing = db.scalar(
-        select(IpdDuel)
-        .where(
-            IpdDuel.bot1_id == b1.id,
-            IpdDuel.bot2_id == b2.id,
-            IpdDuel.bot1_hash == h1,
-            IpdDuel.bot2_hash == h2,
+def play_duel(*, cfg: DockerRunConfig, spec: DuelSpec, on_start: Callable[[], None] | None = None) -> DockerIpdResult:
+    """Run the sandbox match for `spec`. Safe to call from worker threads.
+
+    The result is oriented as bot1 = A, bot2 = B regardless of how the
+    match was played. A bot failure that is not deterministic (see
+    DETERMINISTIC_FAILURES) is given one more run, so it takes up to twice
+    the sandbox time; `on_start` (see run_ipd_in_docker) is called at the
+    start of each run.
+    """
+
+    code_a, code_b = (spec.code2, spec.code1) if spec.swapped else (spec.code1, spec.code2)
+    for _ in range(2):
+        result = run_ipd_in_docker(
+            cfg=cfg, bot_a_code=code_a, bot_b_code=code_b, seed=spec.seed, max_seeds=spec.max_seeds, on_start=on_start
         )
-        .limit(1)
+        if not is_bot_failure(result) or result.failure in DETERMINISTIC_FAILURES:
+            break
+    return result.swapped() if spec.swapped else result
+
+
+def _cache_key(spec: DuelSpec, version: str):
+    ha, hb = (spec.bot2_hash, spec.bot1_hash) if spec.swapped else (spec.bot1_hash, spec.bot2_hash)
+    return and_(
+        IpdResultCache.hash_a == ha,
+        IpdResultCache.hash_b == hb,
+        IpdResultCache.seed == spec.seed,
+        IpdResultCache.max_seeds == spec.max_seeds,
+        IpdResultCache.harness_version == version,
     )
-    if existing is not None:
-        return existing
 
-    seed = _stable_seed(h1, h2)
-    result = run_ipd_in_docker(cfg=cfg, bot_a_code=b1.code, bot_b_code=b2.code, seed=seed)
-    if result.error_log:
-        raise RuntimeError(f"ipd_duel_failed: {result.error_log}")
 
-    duel = IpdDuel(
-        bot1_id=b1.id,
-        bot2_id=b2.id,
-        bot1_hash=h1,
-        bot2_hash=h2,
-        seed=seed,
+def cached_duel_result(db: Session, spec: DuelSpec, *, version: str) -> DockerIpdResult | None:
+    """A previously played match with the same code hashes, seed and runner build, if any."""
+
+    if not version:
+        return None
+    row = db.scalar(select(IpdResultCache).where(_cache_key(spec, version)).limit(1))
+    if row is None or (row.failure is not None and row.failure not in DETERMINISTIC_FAILURES):
+        return None
+    result = DockerIpdResult(
+        cum_a=row.score_a,
+        cum_b=row.score_b,
+        seed=row.seed,
+        exec_ms_a=float(row.exec_ms_a),
+        exec_ms_b=float(row.exec_ms_b),
+        samples=row.samples,
+        score_diff_mean=row.score_diff_mean,
+        score_diff_sd=row.score_diff_sd,
+        error_log=row.failure,
+        failure=row.failure,
+        fault=row.fault,
+    )
+    return result.swapped() if spec.swapped else result
+
+
+def cache_duel_result(db: Session, spec: DuelSpec, result: DockerIpdResult, *, version: str) -> None:
+    """Remember a match for `spec` (no commit); see cached_duel_result.
+
+    Deterministic bot failures are remembered too, so a broken pair costs one
+    sandbox run; timeouts are not, the next run may well finish.
+    """
+
+    if not version or (result.error_log and result.failure not in DETERMINISTIC_FAILURES):
+        return
+    played = result.swapped() if spec.swapped else result
+    table = IpdResultCache.__table__
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    # Another worker may cache the same match meanwhile; its row is as good as ours.
+    stmt = insert(table).on_conflict_do_nothing(
+        index_elements=[table.c.hash_a, table.c.hash_b, table.c.seed, table.c.max_seeds, table.c.harness_version]
+    )
+    db.connection().execute(
+        stmt,
+        {
+            "hash_a": spec.bot2_hash if spec.swapped else spec.bot1_hash,
+            "hash_b": spec.bot1_hash if spec.swapped else spec.bot2_hash,
+            "seed": spec.seed,
+            "max_seeds": spec.max_seeds,
+            "harness_version": version,
+            "score_a": int(played.cum_a),
+            "score_b": int(played.cum_b),
+            "exec_ms_a": int(played.exec_ms_a),
+            "exec_ms_b": int(played.exec_ms_b),
+            "samples": played.samples,
+            "score_diff_mean": played.score_diff_mean,
+            "score_diff_sd": played.score_diff_sd,
+            "failure": played.failure if played.error_log else None,
+            "fault": played.fault if played.error_log else None,
+        },
+    )
+
+
+def is_bot_failure(result: DockerIpdResult) -> bool:
+    return bool(result.error_log) and result.failure in BOT_FAILURES and result.fault in ("a", "b", "both")
+
+
+def duel_from_result(spec: DuelSpec, result: DockerIpdResult) -> IpdDuel:
+    """The IpdDuel for a sandbox result; bot failures become forfeits (see FORFEIT_WIN_SCORE).
+
+    Any other error raises RuntimeError: nothing is recorded, and the
+    tournament queues the job again (see ipd_tournament.record_duel_results).
+    """
+
+    if result.error_log and not is_bot_failure(result):
+        raise RuntimeError(f"ipd_duel_failed: {result.error_log}")
+    if result.error_log:
+        fault = {"a": "bot1", "b": "bot2", "both": "both"}[result.fault]
+        return IpdDuel(
+            bot1_id=spec.bot1_id,
+            bot2_id=spec.bot2_id,
+            bot1_hash=spec.bot1_hash,
+            bot2_hash=spec.bot2_hash,
+            seed=spec.seed,
+            score1=0 if fault in ("bot1", "both") else FORFEIT_WIN_SCORE,
+            score2=0 if fault in ("bot2", "both") else FORFEIT_WIN_SCORE,
+            exec_ms_1=0,
+            exec_ms_2=0,
+            failure=result.failure,
+            fault=fault,
+        )
+    return IpdDuel(
+        bot1_id=spec.bot1_id,
+        bot2_id=spec.bot2_id,
+        bot1_hash=spec.bot1_hash,
+        bot2_hash=spec.bot2_hash,
+        seed=spec.seed,
         score1=int(result.cum_a),
         score2=int(result.cum_b),
         exec_ms_1=int(result.exec_ms_a),
         exec_ms_2=int(result.exec_ms_b),
+        samples=result.samples,
+        score_diff_mean=result.score_diff_mean,
+        score_diff_sd=result.score_diff_sd,
+    )
+
+
+def find_ipd_duel(db: Session, spec: DuelSpec) -> IpdDuel | None:
+    return db.scalar(
+        select(IpdDuel)
+        .where(
+            IpdDuel.bot1_id == spec.bot1_id,
+            IpdDuel.bot2_id == spec.bot2_id,
+            IpdDuel.bot1_hash == spec.bot1_hash,
+            IpdDuel.bot2_hash == spec.bot2_hash,
+        )
+        .limit(1)
     )
-    db.add(duel)
-    db.commit()
-    db.refresh(duel)
-    return duel
 
 
-def compute_ipd_leaderboard(db: Session, *, cfg: DockerRunConfig, limit: int = 50):
-    bots = list(db.scalars(select(Bot).where(Bot.env_id == "ipd", Bot.submitted.is_(True)).order_by(Bot.id.asc())))
+def _add_to_stats(db: Session, duel: IpdDuel, n: int = 1) -> None:
+    # Add (n=1) or remove (n=-1) both sides of `duel` from the running totals.
+    for bot_id, code_hash, score, exec_ms in (
+        (duel.bot1_id, duel.bot1_hash, duel.score1, duel.exec_ms_1),
+        (duel.bot2_id, duel.bot2_hash, duel.score2, duel.exec_ms_2),
+    ):
+        add_to_stats(db, bot_id, code_hash, score_sum=n * score, exec_ms_sum=n * exec_ms, duels=n)
 
-    # Ensure duels exist for current code snapshots
-    for i in range(len(bots)):
-        for j in range(i + 1, len(bots)):
-            ensure_ipd_duel(db=db, cfg=cfg, bot_x=bots[i], bot_y=bots[j])
 
-    rows = []
-    for b in bots:
-        bh = code_hash_py(b.code)
+def _count_forfeits(db: Session, duel: IpdDuel) -> None:
+    # Charge a failed duel to the snapshot(s) at fault and quarantine repeat
+    # offenders; a timeout counts as a forfeit but never quarantines by itself.
+    for side, bot_id, code_hash in (("bot1", duel.bot1_id, duel.bot1_hash), ("bot2", duel.bot2_id, duel.bot2_hash)):
+        if duel.fault not in (side, "both"):
+            continue
+        add_to_stats(db, bot_id, code_hash, forfeits=1)
+        if duel.failure not in DETERMINISTIC_FAILURES:
+            continue
+        # Decided by the database on the incremented count, not on a value read earlier.
+        quarantine = update(IpdBotStats).where(IpdBotStats.bot_id == bot_id, IpdBotStats.code_hash == code_hash)
+        if duel.failure != "load_failed":
+            quarantine = quarantine.where(IpdBotStats.forfeits >= QUARANTINE_AFTER_FORFEITS)
+        db.connection().execute(quarantine.values(quarantined=True, updated_at=func.now()))
 
-        # Collect scores and exec times from both sides of the undirected duel.
-        # When b is bot1: use score1/exec_ms_1, when b is bot2: use score2/exec_ms_2.
-        score_expr = case(
-            (IpdDuel.bot1_id == b.id, IpdDuel.score1),
-            else_=IpdDuel.score2,
-        )
-        exec_expr = case(
-            (IpdDuel.bot1_id == b.id, IpdDuel.exec_ms_1 / 200.0),
-            else_=IpdDuel.exec_ms_2 / 200.0,
-        )
 
-        hash_ok = or_(
-            and_(IpdDuel.bot1_id == b.id, IpdDuel.bot1_hash == bh),
-            and_(IpdDuel.bot2_id == b.id, IpdDuel.bot2_hash == bh),
-        )
+def _is_current(db: Session, duel: IpdDuel) -> bool:
+    """Whether `duel` was played with both bots' current code."""
 
-        q = (
-            select(
-                func.avg(score_expr).label("avg_score"),
-                func.avg(exec_expr).label("avg_exec_ms"),
-                func.count(IpdDuel.id).label("duels"),
-            )
-            .where(or_(IpdDuel.bot1_id == b.id, IpdDuel.bot2_id == b.id))
-            .where(hash_ok)
-        )
-        r = db.execute(q).mappings().one()
-
-        creator = db.scalar(select(User.username).where(User.id == b.user_id))
-
-        opponents = max(len(bots) - 1, 0)
-        rows.append(
-            {
-                "bot_id": int(b.id),
-                "bot_name": str(b.name),
-                "creator": str(creator or ""),
-                "avg_score": float(r["avg_score"] or 0.0),
-                "avg_exec_ms": float(r["avg_exec_ms"] or 0.0),
-                "duels": int(r["duels"] or 0),
-                "opponents": int(opponents),
-            }
+    rows = db.execute(select(Bot.id, Bot.code_hash).where(Bot.id.in_((duel.bot1_id, duel.bot2_id)))).tuples()
+    hashes = dict(rows.all())
+    return hashes.get(duel.bot1_id) == duel.bot1_hash and hashes.get(duel.bot2_id) == duel.bot2_hash
+
+
+def record_ipd_duel(db: Session, duel: IpdDuel) -> bool:
+    """Add `duel` and fold it into both bots' ipd_bot_stats, without committing.
+
+    Every duel insert must go through here so the stats stay in step with
+    `ipd_duels` (they share the caller's transaction); both snapshots'
+    ratings are updated too. A duel that finishes after one of its bots
+    changed code is stored as obsolete and not counted. Forfeits (see
+    duel_from_result) are charged to the failing snapshot, which is
+    quarantined once it keeps failing.
+
+    Returns False, leaving the transaction usable, if the same (pair, hashes)
+    duel was already recorded by someone else.
+    """
+
+    duel.obsolete = not _is_current(db, duel)
+    try:
+        with db.begin_nested():
+            db.add(duel)
+            db.flush()
+    except IntegrityError:
+        return False
+    if not duel.obsolete:
+        _add_to_stats(db, duel)
+        rate_duel(db, duel)
+        if duel.fault:
+            _count_forfeits(db, duel)
+    db.flush()
+    return True
+
+
+def _duels_of(bot: Bot):
+    own_hash = case((IpdDuel.bot1_id == bot.id, IpdDuel.bot1_hash), else_=IpdDuel.bot2_hash)
+    return select(IpdDuel).where(or_(IpdDuel.bot1_id == bot.id, IpdDuel.bot2_id == bot.id)), own_hash
+
+
+def invalidate_ipd_duels(db: Session, bot: Bot) -> None:
+    """Bring duels and stats in line with `bot`'s current code_hash (no commit).
+
+    Duels played with any other hash of the bot are marked obsolete (kept for
+    history) and taken out of both sides' totals. Obsolete duels played with
+    the current hash, i.e. the code was reverted, count again if the opponent
+    still has the same code too.
+    """
+
+    db.flush()
+    q, own_hash = _duels_of(bot)
+    for duel in db.scalars(q.where(IpdDuel.obsolete.is_(False), own_hash != bot.code_hash)):
+        duel.obsolete = True
+        _add_to_stats(db, duel, -1)
+    for duel in db.scalars(q.where(IpdDuel.obsolete.is_(True), own_hash == bot.code_hash)):
+        if _is_current(db, duel):
+            duel.obsolete = False
+            _add_to_stats(db, duel)
+    db.flush()
+    db.execute(delete(IpdBotStats).where(IpdBotStats.bot_id == bot.id, IpdBotStats.code_hash != bot.code_hash))
+
+
+def forget_ipd_bot(db: Session, bot: Bot) -> None:
+    """Take a bot that is about to be deleted out of its opponents' totals (no commit)."""
+
+    q, _ = _duels_of(bot)
+    for duel in db.scalars(q.where(IpdDuel.obsolete.is_(False))):
+        duel.obsolete = True
+        _add_to_stats(db, duel, -1)
+    db.flush()
+
+
+def quarantined_bot_ids(db: Session) -> set[int]:
+    """Bots whose current code is quarantined for failing duels."""
+
+    q = select(IpdBotStats.bot_id).join(
+        Bot, and_(Bot.id == IpdBotStats.bot_id, Bot.code_hash == IpdBotStats.code_hash)
+    )
+    return set(db.scalars(q.where(IpdBotStats.quarantined.is_(True))))
+
+
+def current_duel_pairs(db: Session, *, involving: Bot | None = None) -> set[tuple[int, int]]:
+    """(bot1_id, bot2_id) of every duel played with both submitted bots' current code."""
+
+    b1 = aliased(Bot)
+    b2 = aliased(Bot)
+    q = (
+        select(IpdDuel.bot1_id, IpdDuel.bot2_id)
+        .join(b1, and_(b1.id == IpdDuel.bot1_id, b1.code_hash == IpdDuel.bot1_hash))
+        .join(b2, and_(b2.id == IpdDuel.bot2_id, b2.code_hash == IpdDuel.bot2_hash))
+        .where(b1.env_id == "ipd", b1.submitted.is_(True), b2.env_id == "ipd", b2.submitted.is_(True))
+    )
+    if involving is not None:
+        q = q.where(or_(IpdDuel.bot1_id == involving.id, IpdDuel.bot2_id == involving.id))
+    return set(db.execute(q).tuples())
+
+
+def missing_ipd_pairs(db: Session, bots: list[Bot], *, involving: Bot | None = None) -> list[tuple[Bot, Bot]]:
+    """Return the pairs among `bots` that have no duel for their current code.
+
+    One query loads the (bot1_id, bot2_id) keys of every duel whose hashes
+    match both bots' current code_hash (i.e. the current snapshot); the
+    round-robin is then diffed against that set in memory. Pairs are returned
+    as (lower id, higher id), matching how duels are stored. With `involving`,
+    only that bot's pairs are considered.
+    """
+
+    have = current_duel_pairs(db, involving=involving)
+    ordered = sorted(bots, key=lambda b: b.id)
+    return [
+        (x, y)
+        for i, x in enumerate(ordered)
+        for y in ordered[i + 1 :]
+        if (x.id, y.id) not in have and (involving is None or involving.id in (x.id, y.id))
+    ]
+
+
+def ipd_leaderboard_rows(db: Session, *, limit: int = 50, mode: str = "round_robin") -> list[dict]:
+    """Leaderboard rows for submitted IPD bots.
+
+    One query: submitted bots outer-joined to the running totals in
+    ipd_bot_stats for their current code_hash, sorted and limited in the
+    database, so the cost does not grow with the number of duels. In
+    "rating" mode rows are ranked by a conservative rating estimate
+    (rating - 2 * rating_rd) instead of the average score. Quarantined
+    bots are listed last.
+    """
+
+    submitted = and_(Bot.env_id == "ipd", Bot.submitted.is_(True))
+    pool = aliased(Bot)
+    n_bots = (
+        select(func.count(pool.id)).where(pool.env_id == "ipd", pool.submitted.is_(True)).scalar_subquery()
+    )
+
+    duels = func.coalesce(IpdBotStats.duels, 0)
+    avg_score = func.coalesce(IpdBotStats.score_sum * 1.0 / func.nullif(IpdBotStats.duels, 0), 0.0)
+    avg_exec_ms = func.coalesce(
+        IpdBotStats.exec_ms_sum / float(ROUNDS) / func.nullif(IpdBotStats.duels, 0), 0.0
+    )
+
+    rating = func.coalesce(IpdBotStats.rating, INITIAL_RATING)
+    rating_rd = func.coalesce(IpdBotStats.rating_rd, INITIAL_RD)
+    quarantined = func.coalesce(IpdBotStats.quarantined, False)
+    if mode == "rating":
+        order_by = (quarantined.asc(), (rating - 2 * rating_rd).desc(), avg_exec_ms.asc(), Bot.id.asc())
+    else:
+        order_by = (quarantined.asc(), avg_score.desc(), avg_exec_ms.asc(), Bot.id.asc())
+
+    q = (
+        select(
+            Bot.id.label("bot_id"),
+            Bot.name.label("bot_name"),
+            User.username.label("creator"),
+            avg_score.label("avg_score"),
+            avg_exec_ms.label("avg_exec_ms"),
+            duels.label("duels"),
+            (n_bots - 1).label("opponents"),
+            rating.label("rating"),
+            rating_rd.label("rating_rd"),
+            func.coalesce(IpdBotStats.forfeits, 0).label("forfeits"),
+            quarantined.label("quarantined"),
         )
+        .select_from(Bot)
+        .outerjoin(User, User.id == Bot.user_id)
+        .outerjoin(IpdBotStats, and_(IpdBotStats.bot_id == Bot.id, IpdBotStats.code_hash == Bot.code_hash))
+        .where(submitted)
+        .order_by(*order_by)
+        .limit(limit)
+    )
 
-    rows.sort(key=lambda x: (-x["avg_score"], x["avg_exec_ms"], -x["opponents"], x["bot_id"]))
-    return rows[:limit]
+    return [
+        {
+            "bot_id": int(r.bot_id),
+            "bot_name": str(r.bot_name),
+            "creator": str(r.creator or ""),
+            "avg_score": float(r.avg_score or 0.0),
+            "avg_exec_ms": float(r.avg_exec_ms or 0.0),
+            "duels": int(r.duels or 0),
+            "opponents": max(int(r.opponents or 0), 0),
+            "rating": float(r.rating),
+            "rating_rd": float(r.rating_rd),
+            "forfeits": int(r.forfeits or 0),
+            "quarantined": bool(r.quarantined),
+        }
+        for r in db.execute(q)
+    ]
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Callable, TypeVar
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.bot import Bot
+from app.models.bot_preflight import BotPreflight
+from app.services.docker_ipd_runner import (
+    DockerIpdResult,
+    DockerRunConfig,
+    harness_version,
+    run_ipd_in_docker_async,
+)
+from app.services.ipd_leaderboard import BOT_FAILURES, DETERMINISTIC_FAILURES
+
+PREFLIGHT_SEED = 1
+
+# Built-in opponent: tit-for-tat, so the bot sees both actions early on.
+PREFLIGHT_OPPONENT = (
+    "def act(observation, state):\n"
+    "    history = observation['history']\n"
+    "    return (history[-1][1] if history else 'C'), state\n"
+)
+
+
+def find_preflight(db: Session, code_hash: str, *, version: str, rounds: int) -> BotPreflight | None:
+    if not version:
+        return None
+    return db.scalar(
+        select(BotPreflight)
+        .where(
+            BotPreflight.code_hash == code_hash,
+            BotPreflight.harness_version == version,
+            BotPreflight.rounds == rounds,
+        )
+        .limit(1)
+    )
+
+
+T = TypeVar("T")
+
+
+async def _in_thread(func: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    # Database work on the request's session, off the event loop. Shielded:
+    # if the caller is cancelled (the client went away) we still wait for
+    # the thread, so the session is not closed while it is in use.
+    work = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+    try:
+        return await asyncio.shield(work)
+    except asyncio.CancelledError:
+        await asyncio.wait({work})
+        raise
+
+
+async def preflight_bot_async(db: Session, *, cfg: DockerRunConfig, bot: Bot) -> BotPreflight:
+    """Smoke-run `bot` before it may be submitted; cached per code hash, runner build and rounds.
+
+    The bot plays settings.ipd_preflight_rounds rounds against
+    PREFLIGHT_OPPONENT in the sandbox, which loads the module, checks that
+    `act` exists and enforces the harness' load and per-step time limits.
+    Any failure the harness blames on the bot makes the preflight not ok.
+    The outcome (with startup and step latency) is stored and committed,
+    except for failures that may not recur (timeouts, a dead bot process):
+    those are returned unsaved, so the next submit runs the bot again.
+    Raises RuntimeError ("ipd_preflight_failed") if the sandbox itself
+    failed; nothing is stored then.
+
+    Meant for async endpoints: the sandbox run is awaited, the short
+    database work runs in a thread.
+    """
+
+    rounds = settings.ipd_preflight_rounds
+    version = await asyncio.to_thread(harness_version, cfg)
+    cached = await _in_thread(find_preflight, db, bot.code_hash, version=version, rounds=rounds)
+    if cached is not None:
+        return cached
+
+    result = await run_ipd_in_docker_async(
+        cfg=cfg, bot_a_code=bot.code, bot_b_code=PREFLIGHT_OPPONENT, seed=PREFLIGHT_SEED, rounds=rounds
+    )
+    return await _in_thread(_store_preflight, db, bot=bot, version=version, rounds=rounds, result=result)
+
+
+def _store_preflight(
+    db: Session, *, bot: Bot, version: str, rounds: int, result: DockerIpdResult
+) -> BotPreflight:
+    bot_failed = result.failure in BOT_FAILURES and result.fault in ("a", "both")
+    if result.error_log and not bot_failed:
+        raise RuntimeError(f"ipd_preflight_failed: {result.error_log}")
+
+    preflight = BotPreflight(
+        code_hash=bot.code_hash,
+        harness_version=version,
+        rounds=rounds,
+        ok=not result.error_log,
+        failure=result.failure if bot_failed else None,
+        error_log=result.error_log[:65536] if result.error_log else None,
+        startup_ms=result.startup_ms_a,
+        avg_step_ms=result.avg_exec_ms_a,
+        max_step_ms=result.max_step_ms_a,
+    )
+    if not version or (bot_failed and result.failure not in DETERMINISTIC_FAILURES):
+        # Unknown runner build (nothing to key the cache on), or a failure
+        # the next run may not repeat.
+        return preflight
+    try:
+        with db.begin_nested():
+            db.add(preflight)
+            db.flush()
+    except IntegrityError:
+        # A concurrent submit of the same code got there first.
+        preflight = find_preflight(db, bot.code_hash, version=version, rounds=rounds)
+    db.commit()
+    return preflight
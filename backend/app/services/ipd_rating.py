@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import math
+
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models.bot import Bot
+from app.models.ipd_bot_stats import IpdBotStats
+from app.models.ipd_duel import IpdDuel
+
+# Glicko-1 constants (ratings on the familiar Elo scale).
+INITIAL_RATING = 1500.0
+INITIAL_RD = 350.0
+MIN_RD = 30.0
+_Q = math.log(10) / 400.0
+
+
+def _g(rd: float) -> float:
+    return 1.0 / math.sqrt(1.0 + 3.0 * _Q**2 * rd**2 / math.pi**2)
+
+
+def expected_outcome(rating: float, opp_rating: float, opp_rd: float) -> float:
+    return 1.0 / (1.0 + 10.0 ** (-_g(opp_rd) * (rating - opp_rating) / 400.0))
+
+
+def glicko_update(rating: float, rd: float, opp_rating: float, opp_rd: float, outcome: float) -> tuple[float, float]:
+    """One-game Glicko-1 update; `outcome` is in [0, 1] (1 = win, 0.5 = draw)."""
+
+    g = _g(opp_rd)
+    e = expected_outcome(rating, opp_rating, opp_rd)
+    d2 = 1.0 / (_Q**2 * g**2 * max(e * (1.0 - e), 1e-9))
+    denom = 1.0 / rd**2 + 1.0 / d2
+    new_rating = rating + (_Q / denom) * g * (outcome - e)
+    new_rd = max(math.sqrt(1.0 / denom), MIN_RD)
+    return new_rating, new_rd
+
+
+def duel_outcome(score: int, opp_score: int) -> float:
+    """A duel counts as a fractional win: the bot's share of the points both bots scored."""
+
+    total = score + opp_score
+    return 0.5 if total <= 0 else score / total
+
+
+def _stats_insert(db: Session, bot_id: int, code_hash: str, **deltas: int):
+    table = IpdBotStats.__table__
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    return insert(table).values(
+        {
+            "bot_id": bot_id,
+            "code_hash": code_hash,
+            "score_sum": 0,
+            "exec_ms_sum": 0,
+            "duels": 0,
+            "forfeits": 0,
+            "rating": INITIAL_RATING,
+            "rating_rd": INITIAL_RD,
+            **deltas,
+        }
+    )
+
+
+def add_to_stats(db: Session, bot_id: int, code_hash: str, **deltas: int) -> None:
+    """Add `deltas` to a snapshot's ipd_bot_stats counters, creating the row if missing (no commit).
+
+    One INSERT ... ON CONFLICT DO UPDATE on the session's connection, so
+    concurrent duels of the same snapshot cannot lose each other's
+    increments. An IpdBotStats already loaded in `db` is not refreshed
+    until the next commit.
+    """
+
+    table = IpdBotStats.__table__
+    stmt = _stats_insert(db, bot_id, code_hash, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.bot_id, table.c.code_hash],
+        set_={**{k: table.c[k] + v for k, v in deltas.items()}, "updated_at": func.now()},
+    )
+    db.connection().execute(stmt)
+
+
+def rate_duel(db: Session, duel: IpdDuel) -> None:
+    """Update both snapshots' ratings with the outcome of `duel` (no commit).
+
+    Both stats rows are locked (in key order, so two duels cannot deadlock)
+    for the read-compute-write of the Glicko update; on SQLite the write
+    lock of the transaction already serializes it.
+    """
+
+    keys = [(duel.bot1_id, duel.bot1_hash), (duel.bot2_id, duel.bot2_hash)]
+    conn = db.connection()
+    for bot_id, code_hash in keys:
+        conn.execute(_stats_insert(db, bot_id, code_hash).on_conflict_do_nothing())
+    rows = conn.execute(
+        select(IpdBotStats.bot_id, IpdBotStats.code_hash, IpdBotStats.rating, IpdBotStats.rating_rd)
+        .where(tuple_(IpdBotStats.bot_id, IpdBotStats.code_hash).in_(keys))
+        .order_by(IpdBotStats.bot_id, IpdBotStats.code_hash)
+        .with_for_update()
+    )
+    current = {(r.bot_id, r.code_hash): (r.rating, r.rating_rd) for r in rows}
+    (r1, rd1), (r2, rd2) = current[keys[0]], current[keys[1]]
+    new = {
+        keys[0]: glicko_update(r1, rd1, r2, rd2, duel_outcome(duel.score1, duel.score2)),
+        keys[1]: glicko_update(r2, rd2, r1, rd1, duel_outcome(duel.score2, duel.score1)),
+    }
+    for (bot_id, code_hash), (rating, rd) in new.items():
+        conn.execute(
+            update(IpdBotStats)
+            .where(IpdBotStats.bot_id == bot_id, IpdBotStats.code_hash == code_hash)
+            .values(rating=rating, rating_rd=rd, updated_at=func.now())
+        )
+
+
+def pick_rating_pairs(
+    bots: list[Bot],
+    ratings: dict[int, tuple[float, float]],
+    taken: set[tuple[int, int]],
+    *,
+    target_rd: float,
+) -> list[tuple[Bot, Bot]]:
+    """Choose the next round of duels for the sampled rating mode.
+
+    Bots are visited most-uncertain first; each still above `target_rd` is
+    paired with the unplayed opponent whose rating is closest to its own
+    (the most informative game), and every bot plays at most once per round.
+    `taken` holds (lower id, higher id) pairs that were already played or
+    planned. Pairs are returned as (lower id, higher id).
+    """
+
+    def rating(b: Bot) -> tuple[float, float]:
+        return ratings.get(b.id, (INITIAL_RATING, INITIAL_RD))
+
+    busy: set[int] = set()
+    pairs: list[tuple[Bot, Bot]] = []
+    for bot in sorted(bots, key=lambda b: (-rating(b)[1], b.id)):
+        r, rd = rating(bot)
+        if bot.id in busy or rd <= target_rd:
+            continue
+        candidates = [
+            o
+            for o in bots
+            if o.id != bot.id and o.id not in busy and (min(o.id, bot.id), max(o.id, bot.id)) not in taken
+        ]
+        if not candidates:
+            continue
+        opp = min(candidates, key=lambda o: (abs(rating(o)[0] - r), -rating(o)[1], o.id))
+        busy.update((bot.id, opp.id))
+        pairs.append((bot, opp) if bot.id < opp.id else (opp, bot))
+    return pairs
+
+
+def current_ratings(db: Session, bots: list[Bot]) -> dict[int, tuple[float, float]]:
+    """(rating, rd) of each bot's current code snapshot; bots without one are unrated."""
+
+    if not bots:
+        return {}
+    hashes = {b.id: b.code_hash for b in bots}
+    rows = db.execute(
+        select(IpdBotStats.bot_id, IpdBotStats.code_hash, IpdBotStats.rating, IpdBotStats.rating_rd).where(
+            IpdBotStats.bot_id.in_(hashes)
+        )
+    )
+    return {bot_id: (rating, rd) for bot_id, code_hash, rating, rd in rows if hashes[bot_id] == code_hash}
@@ -0,0 +1,511 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.models.bot import Bot
+from app.models.ipd_duel_job import IpdDuelJob
+from app.services.docker_ipd_runner import DockerIpdResult, DockerRunConfig, harness_version, sandbox_capacity
+from app.services.ipd_leaderboard import (
+    DuelSpec,
+    cache_duel_result,
+    cached_duel_result,
+    current_duel_pairs,
+    duel_from_result,
+    duel_spec,
+    find_ipd_duel,
+    missing_ipd_pairs,
+    play_duel,
+    quarantined_bot_ids,
+    record_ipd_duel,
+)
+from app.services.ipd_rating import current_ratings, pick_rating_pairs
+
+logger = logging.getLogger(__name__)
+
+# "queued" includes jobs waiting out the backoff before a retry.
+PENDING_STATUSES = ("queued", "running")
+# Jobs that never produced a result for their snapshot; re-queued if it becomes current again.
+RETRYABLE_STATUSES = ("stale", "cancelled")
+
+# A duel that fails for a reason other than its bots (sandbox errors, duel
+# timeouts; see duel_from_result) is queued again after RETRY_BACKOFF_S,
+# doubling per attempt, and marked "failed" after MAX_ATTEMPTS runs.
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF_S = 60.0
+
+# Priority of the duels planned for a bot right after it was submitted or edited.
+EDITED_BOT_PRIORITY = 1
+
+
+def _submitted_ipd_bots(db: Session) -> list[Bot]:
+    """Submitted IPD bots that can be planned, i.e. not quarantined."""
+
+    quarantined = quarantined_bot_ids(db)
+    bots = db.scalars(select(Bot).where(Bot.env_id == "ipd", Bot.submitted.is_(True)).order_by(Bot.id.asc()))
+    return [b for b in bots if b.id not in quarantined]
+
+
+def _current_jobs(db: Session):
+    """IpdDuelJob rows whose hashes match both bots' current, submitted code."""
+
+    b1 = aliased(Bot)
+    b2 = aliased(Bot)
+    return (
+        select(IpdDuelJob)
+        .join(b1, and_(b1.id == IpdDuelJob.bot1_id, b1.code_hash == IpdDuelJob.bot1_hash))
+        .join(b2, and_(b2.id == IpdDuelJob.bot2_id, b2.code_hash == IpdDuelJob.bot2_hash))
+        .where(b1.env_id == "ipd", b1.submitted.is_(True), b2.env_id == "ipd", b2.submitted.is_(True))
+    )
+
+
+def _enqueue(db: Session, pairs: list[tuple[Bot, Bot]], *, priority: int, bot_id: int | None = None) -> int:
+    """Queue a job for each (lower id, higher id) pair at its current hashes; return how many were queued.
+
+    Pairs that already have a job for the same code hashes are left alone,
+    except that stale/cancelled jobs go back to the queue (with a fresh set
+    of attempts) and queued jobs can be bumped to a higher priority. A
+    failed job, whose attempts ran out (see record_duel_results), is not
+    retried until one of the bots changes its code.
+    """
+
+    if not pairs:
+        return 0
+
+    q = _current_jobs(db)
+    if bot_id is not None:
+        q = q.where(or_(IpdDuelJob.bot1_id == bot_id, IpdDuelJob.bot2_id == bot_id))
+    existing = {(j.bot1_id, j.bot2_id, j.bot1_hash, j.bot2_hash): j for j in db.scalars(q)}
+    queued = 0
+    for x, y in pairs:
+        job = existing.get((x.id, y.id, x.code_hash, y.code_hash))
+        if job is None:
+            db.add(
+                IpdDuelJob(
+                    bot1_id=x.id,
+                    bot2_id=y.id,
+                    bot1_hash=x.code_hash,
+                    bot2_hash=y.code_hash,
+                    status="queued",
+                    priority=priority,
+                )
+            )
+            queued += 1
+        elif job.status in RETRYABLE_STATUSES:
+            job.status = "queued"
+            job.priority = priority
+            job.error_log = None
+            job.attempts = 0
+            job.retry_after = None
+            job.started_at = None
+            job.finished_at = None
+            queued += 1
+        elif job.status == "queued" and job.priority < priority:
+            job.priority = priority
+    return queued
+
+
+def _cancel_superseded_jobs(db: Session, bot_ids: list[int] | None = None) -> int:
+    """Cancel queued jobs whose bots have changed code since they were planned."""
+
+    b1 = aliased(Bot)
+    b2 = aliased(Bot)
+    superseded = (
+        select(IpdDuelJob.id)
+        .join(b1, b1.id == IpdDuelJob.bot1_id)
+        .join(b2, b2.id == IpdDuelJob.bot2_id)
+        .where(
+            IpdDuelJob.status == "queued",
+            or_(b1.code_hash != IpdDuelJob.bot1_hash, b2.code_hash != IpdDuelJob.bot2_hash),
+        )
+    )
+    if bot_ids is not None:
+        superseded = superseded.where(or_(IpdDuelJob.bot1_id.in_(bot_ids), IpdDuelJob.bot2_id.in_(bot_ids)))
+    n = db.execute(
+        update(IpdDuelJob)
+        .where(IpdDuelJob.id.in_(superseded.scalar_subquery()), IpdDuelJob.status == "queued")
+        .values(status="cancelled", finished_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return int(n or 0)
+
+
+def _cancel_quarantined_jobs(db: Session) -> int:
+    """Cancel queued jobs of bots that were quarantined since they were planned."""
+
+    quarantined = quarantined_bot_ids(db)
+    if not quarantined:
+        return 0
+    n = db.execute(
+        update(IpdDuelJob)
+        .where(
+            IpdDuelJob.status == "queued",
+            or_(IpdDuelJob.bot1_id.in_(quarantined), IpdDuelJob.bot2_id.in_(quarantined)),
+        )
+        .values(status="cancelled", finished_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return int(n or 0)
+
+
+def plan_ipd_duels(db: Session) -> int:
+    """Queue a job for every missing duel of the current snapshot; return how many were added.
+
+    This is the full re-plan run by the tournament on every pass; edits
+    and submissions go through the cheaper plan_bot_duels.
+    """
+
+    _cancel_superseded_jobs(db)
+    bots = _submitted_ipd_bots(db)
+    n = _enqueue(db, missing_ipd_pairs(db, bots), priority=0)
+    db.commit()
+    return n
+
+
+def plan_rating_duels(db: Session, *, target_rd: float) -> int:
+    """Queue the next round of duels for the sampled rating mode; return how many were added.
+
+    Opponents are picked from the current ratings (see pick_rating_pairs),
+    so nothing is planned while duels of the previous round are pending.
+    Every pair is played at most once per code snapshot.
+    """
+
+    _cancel_superseded_jobs(db)
+    if pending_ipd_duels(db):
+        db.commit()
+        return 0
+    bots = _submitted_ipd_bots(db)
+    taken = current_duel_pairs(db) | {
+        (j.bot1_id, j.bot2_id) for j in db.scalars(_current_jobs(db)) if j.status not in RETRYABLE_STATUSES
+    }
+    pairs = pick_rating_pairs(bots, current_ratings(db, bots), taken, target_rd=target_rd)
+    n = _enqueue(db, pairs, priority=0)
+    db.commit()
+    return n
+
+
+def plan_bot_duels(db: Session, bot: Bot, *, mode: str = "round_robin", target_rd: float = 75.0) -> int:
+    """Re-plan after `bot` was submitted or its code changed; return how many duels were queued.
+
+    Only the bot's own pairs are touched: its queued jobs for an older hash
+    are cancelled and its missing duels against every other submitted bot
+    are queued ahead of the regular backlog. In "rating" mode the bot
+    instead enters the next sampled round with a fresh (uncertain) rating.
+    """
+
+    _cancel_superseded_jobs(db, [bot.id])
+    if not bot.submitted or bot.env_id != "ipd":
+        db.commit()
+        return 0
+    if mode == "rating":
+        return plan_rating_duels(db, target_rd=target_rd)
+    pairs = missing_ipd_pairs(db, _submitted_ipd_bots(db), involving=bot)
+    n = _enqueue(db, pairs, priority=EDITED_BOT_PRIORITY, bot_id=bot.id)
+    db.commit()
+    return n
+
+
+def pending_ipd_duels(db: Session) -> int:
+    q = _current_jobs(db).where(IpdDuelJob.status.in_(PENDING_STATUSES)).subquery()
+    return int(db.scalar(select(func.count()).select_from(q)) or 0)
+
+
+def claim_next_job(db: Session) -> IpdDuelJob | None:
+    """Atomically move the next queued job (highest priority, then oldest) to "running" and return it.
+
+    Jobs waiting out a retry backoff are skipped; claiming counts an attempt.
+    """
+
+    while True:
+        now = datetime.now(timezone.utc)
+        job_id = db.scalar(
+            select(IpdDuelJob.id)
+            .where(
+                IpdDuelJob.status == "queued",
+                or_(IpdDuelJob.retry_after.is_(None), IpdDuelJob.retry_after <= now),
+            )
+            .order_by(IpdDuelJob.priority.desc(), IpdDuelJob.id.asc())
+            .limit(1)
+        )
+        if job_id is None:
+            return None
+        claimed = db.execute(
+            update(IpdDuelJob)
+            .where(IpdDuelJob.id == job_id, IpdDuelJob.status == "queued")
+            .values(status="running", started_at=now, attempts=IpdDuelJob.attempts + 1, retry_after=None)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(IpdDuelJob, job_id)
+        # Another worker got it first; try the next one.
+
+
+def requeue_stuck_jobs(db: Session, *, older_than: timedelta) -> int:
+    """Put "running" jobs back in the queue if their worker apparently died.
+
+    A job that has used up its attempts is marked failed instead.
+    """
+
+    now = datetime.now(timezone.utc)
+    stuck = and_(IpdDuelJob.status == "running", IpdDuelJob.started_at < now - older_than)
+    n = db.execute(
+        update(IpdDuelJob)
+        .where(stuck, IpdDuelJob.attempts < MAX_ATTEMPTS)
+        .values(status="queued", started_at=None)
+    ).rowcount
+    db.execute(
+        update(IpdDuelJob)
+        .where(stuck, IpdDuelJob.attempts >= MAX_ATTEMPTS)
+        .values(status="failed", error_log="ipd_duel_failed: worker_died", finished_at=now)
+    )
+    db.commit()
+    return int(n or 0)
+
+
+def _job_spec(db: Session, job: IpdDuelJob, *, max_seeds: int = 1) -> DuelSpec | None:
+    """DuelSpec for `job`, or None if a bot changed or was withdrawn after planning."""
+
+    bot1 = db.get(Bot, job.bot1_id)
+    bot2 = db.get(Bot, job.bot2_id)
+    if (
+        bot1 is None
+        or bot2 is None
+        or not (bot1.submitted and bot2.submitted)
+        or (bot1.code_hash, bot2.code_hash) != (job.bot1_hash, job.bot2_hash)
+    ):
+        return None
+    return duel_spec(bot1, bot2, max_seeds=max_seeds)
+
+
+def record_duel_results(
+    db: Session,
+    results: list[tuple[int, DuelSpec, DockerIpdResult | None, str | None]],
+    *,
+    version: str = "",
+) -> None:
+    """Persist a batch of finished duels and their job statuses in one transaction.
+
+    Each entry is (job_id, spec, result, error); `result` is None when the
+    duel never produced one (e.g. it timed out). Matches, including those
+    forfeited by a deterministic bot failure, are also added to the result
+    cache under runner build `version`; queued jobs of bots quarantined by this batch
+    are cancelled. A job whose duel failed goes back to the queue until it
+    has been attempted MAX_ATTEMPTS times (see RETRY_BACKOFF_S), then it is
+    marked failed.
+    """
+
+    now = datetime.now(timezone.utc)
+    forfeits = False
+    for job_id, spec, result, error in results:
+        job = db.get(IpdDuelJob, job_id)
+        if error is None and result is not None:
+            try:
+                duel = duel_from_result(spec, result)
+            except RuntimeError as e:
+                error = str(e)
+            else:
+                cache_duel_result(db, spec, result, version=version)
+                # False if someone else recorded the same snapshot meanwhile.
+                if record_ipd_duel(db, duel):
+                    forfeits = forfeits or duel.fault is not None
+        if job is not None:
+            if error is None:
+                job.status = "done"
+            elif job.attempts < MAX_ATTEMPTS:
+                job.status = "queued"
+                job.retry_after = now + timedelta(seconds=RETRY_BACKOFF_S * 2 ** max(job.attempts - 1, 0))
+            else:
+                job.status = "failed"
+            # A forfeit is a finished duel; keep the bot's error for its owner.
+            log = error if error is not None else (result.error_log if result is not None else None)
+            job.error_log = None if log is None else log[:65536]
+            job.finished_at = now
+    if forfeits:
+        db.flush()
+        _cancel_quarantined_jobs(db)
+    db.commit()
+
+
+class IpdTournament:
+    """Background round-robin for submitted IPD bots.
+
+    Duels are planned (as IpdDuelJob rows) when a bot is submitted or its code
+    changes, and executed here, off the request path. `mode` selects a full
+    round-robin or the sampled rating mode (rounds of adaptively chosen
+    duels until every rating deviation is below `target_rd`). The thread also
+    re-plans every `poll_interval_s` seconds so nothing is lost across
+    restarts or deletions.
+
+    Sandbox runs are fanned out over up to `workers` threads (never more than
+    the host fits, see sandbox_capacity); only this thread touches the DB, and
+    finished duels are committed `batch_size` at a time. Each (pair, hashes)
+    snapshot is played once: its job is claimed in a short transaction of its
+    own (claim_next_job), a claimed job whose duel is already recorded is
+    closed without a sandbox run, and matches already in the result cache
+    for the current runner build are not played again. Duels lost to the
+    sandbox are retried by a later pass once their backoff has passed (see
+    MAX_ATTEMPTS).
+    """
+
+    def __init__(
+        self,
+        *,
+        session_factory: Callable[[], Session],
+        cfg: DockerRunConfig,
+        poll_interval_s: float = 30.0,
+        workers: int = 1,
+        batch_size: int = 20,
+        mode: str = "round_robin",
+        target_rd: float = 75.0,
+        max_seeds: int = 1,
+    ):
+        self.session_factory = session_factory
+        self.cfg = cfg
+        self.poll_interval_s = poll_interval_s
+        self.workers = max(1, min(workers, sandbox_capacity(cfg)))
+        self.batch_size = max(1, batch_size)
+        self.mode = mode
+        self.target_rd = target_rd
+        self.max_seeds = max(1, max_seeds)
+        # Wall-clock budget per sandbox run, counted from when it holds a
+        # sandbox slot (waiting for one is bounded by the runs holding them);
+        # leaves room over the sandbox's own timeout for container start/stop.
+        self.duel_timeout_s = 3.0 * cfg.timeout_seconds * self.max_seeds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        # One pool for every pass. Runs that went past duel_timeout_s cannot be
+        # killed; they keep their worker (and count against `workers`) until
+        # they return, so threads never pile up.
+        self._pool: ThreadPoolExecutor | None = None
+        self._abandoned: set[Future] = set()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ipd-tournament", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        if self._pool is not None:
+            # Do not block on threads stuck past their duel timeout.
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._abandoned = set()
+
+    def notify(self) -> None:
+        """Wake the worker because new duels may have been planned."""
+        self._wake.set()
+
+    def plan(self, db: Session) -> int:
+        """Queue missing duels according to the leaderboard mode; return how many were added."""
+        if self.mode == "rating":
+            return plan_rating_duels(db, target_rd=self.target_rd)
+        return plan_ipd_duels(db)
+
+    def run_pending(self) -> int:
+        """Plan and run queued duels until none are left; return how many ran."""
+
+        ran = 0
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ipd-duel")
+        pool = self._pool
+        with self.session_factory() as db:
+            requeue_stuck_jobs(db, older_than=timedelta(seconds=10 * self.cfg.timeout_seconds))
+            self.plan(db)
+            version = harness_version(self.cfg)
+
+            inflight: dict[Future, tuple[int, DuelSpec]] = {}
+            # Job id -> when its current sandbox run got a slot (set from the pool threads).
+            running_since: dict[int, float] = {}
+            batch: list[tuple[int, DuelSpec, DockerIpdResult | None, str | None]] = []
+            exhausted = False
+            while True:
+                self._abandoned = {f for f in self._abandoned if not f.done()}
+                while not exhausted and not self._stop.is_set() and len(inflight) + len(self._abandoned) < self.workers:
+                    job = claim_next_job(db)
+                    if job is None:
+                        exhausted = True
+                        break
+                    spec = _job_spec(db, job, max_seeds=self.max_seeds)
+                    if spec is None:
+                        # A bot changed or was withdrawn after planning; its new snapshot gets its own job.
+                        job.status = "stale"
+                        job.finished_at = datetime.now(timezone.utc)
+                        db.commit()
+                        continue
+                    if find_ipd_duel(db, spec) is not None:
+                        # Already recorded, e.g. by the first run of a job that was requeued as stuck.
+                        job.status = "done"
+                        job.finished_at = datetime.now(timezone.utc)
+                        db.commit()
+                        continue
+                    cached = cached_duel_result(db, spec, version=version)
+                    if cached is not None:
+                        batch.append((job.id, spec, cached, None))
+                        ran += 1
+                        continue
+
+                    def on_start(job_id: int = job.id) -> None:
+                        running_since[job_id] = time.monotonic()
+
+                    fut = pool.submit(play_duel, cfg=self.cfg, spec=spec, on_start=on_start)
+                    inflight[fut] = (job.id, spec)
+
+                if not inflight:
+                    if batch:
+                        record_duel_results(db, batch, version=version)
+                        batch = []
+                    # The rating mode plans one round at a time from the ratings just recorded.
+                    if exhausted and not self._stop.is_set() and self.plan(db):
+                        exhausted = False
+                        continue
+                    break
+
+                done, _ = wait(inflight, timeout=1.0, return_when=FIRST_COMPLETED)
+                now = time.monotonic()
+                for fut in list(inflight):
+                    job_id, spec = inflight[fut]
+                    started = running_since.get(job_id)
+                    if fut in done:
+                        try:
+                            batch.append((job_id, spec, fut.result(), None))
+                        except Exception as e:  # noqa: BLE001
+                            batch.append((job_id, spec, None, f"ipd_duel_failed: {e}"))
+                    elif started is not None and now - started > self.duel_timeout_s:
+                        # The thread cannot be killed; its late result is simply dropped.
+                        batch.append((job_id, spec, None, "ipd_duel_failed: duel_timeout"))
+                        self._abandoned.add(fut)
+                    else:
+                        continue
+                    del inflight[fut]
+                    running_since.pop(job_id, None)
+                    ran += 1
+
+                if len(batch) >= self.batch_size or (not inflight and batch):
+                    record_duel_results(db, batch, version=version)
+                    batch = []
+        return ran
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            # Clear before the pass so a notify() that arrives mid-pass triggers another one.
+            self._wake.clear()
+            try:
+                self.run_pending()
+            except Exception:  # noqa: BLE001
+                logger.exception("ipd tournament: pass failed")
+            self._wake.wait(timeout=self.poll_interval_s)
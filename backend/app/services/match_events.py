@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import Callable
+
+Deliver = Callable[[dict], None]
+
+
+@dataclass
+class _LiveMatch:
+    rounds: list[dict] = field(default_factory=list)
+    subscribers: list[Deliver] = field(default_factory=list)
+
+
+class MatchEvents:
+    """In-process fan-out of the rounds of matches being played right now.
+
+    The worker playing a match publishes each round record as the harness
+    streams it; subscribers (SSE clients) get the rounds published so far and
+    then every new one, followed by a final {"event": "end", "status": ...}
+    record. Only matches played by this process are live here; everything
+    else is read from the database.
+
+    Records are handed to each subscriber's `deliver` callable on the
+    publishing (worker) thread, under the lock: it must not block, e.g.
+    schedule the record onto an event loop with call_soon_threadsafe.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._live: dict[int, _LiveMatch] = {}
+
+    def open(self, match_id: int) -> None:
+        with self._lock:
+            self._live.setdefault(match_id, _LiveMatch())
+
+    def publish(self, match_id: int, record: dict) -> None:
+        with self._lock:
+            live = self._live.get(match_id)
+            if live is None:
+                return
+            live.rounds.append(record)
+            for deliver in live.subscribers:
+                deliver(record)
+
+    def close(self, match_id: int, status: str) -> None:
+        """End the live match; call once its final status and steps are committed."""
+
+        with self._lock:
+            live = self._live.pop(match_id, None)
+            if live is not None:
+                for deliver in live.subscribers:
+                    deliver({"event": "end", "status": status})
+
+    def subscribe(self, match_id: int, deliver: Deliver) -> bool:
+        """Feed `deliver` the rounds so far and every new one; False if the match is not live here."""
+
+        with self._lock:
+            live = self._live.get(match_id)
+            if live is None:
+                return False
+            for record in live.rounds:
+                deliver(record)
+            live.subscribers.append(deliver)
+            return True
+
+    def unsubscribe(self, match_id: int, deliver: Deliver) -> None:
+        with self._lock:
+            live = self._live.get(match_id)
+            if live is not None and deliver in live.subscribers:
+                live.subscribers.remove(deliver)
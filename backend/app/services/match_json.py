@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.env.ipd import iter_steps
+from app.models.match import Match
+from app.models.match_replay import MatchReplay
+from app.services.match_queue import queue_position
+from app.services.match_replay import replay_rounds
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder below yields the same bytes, only slower
+    orjson = None  # type: ignore[assignment]
+
+_MATCH_COLUMNS = (
+    Match.id,
+    Match.env_id,
+    Match.bot_id,
+    Match.bot_code_hash,
+    Match.opponent_name,
+    Match.seed,
+    Match.status,
+    Match.started_at,
+    Match.finished_at,
+    Match.error_log,
+    Match.queued_at,
+)
+_REPLAY_COLUMNS = (
+    MatchReplay.rounds,
+    MatchReplay.acts_a,
+    MatchReplay.acts_b,
+    MatchReplay.rewards_a,
+    MatchReplay.rewards_b,
+    MatchReplay.cum_a,
+    MatchReplay.cum_b,
+)
+
+
+def dumps(obj: Any) -> bytes:
+    """JSON bytes exactly as FastAPI's JSONResponse renders `obj` (compact, UTF-8, no NaN)."""
+
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _iso(ts: datetime | None) -> str | None:
+    # Pydantic's JSON form of a datetime: ISO 8601, "Z" for UTC.
+    if ts is None:
+        return None
+    s = ts.isoformat()
+    return s[:-6] + "Z" if s.endswith("+00:00") else s
+
+
+def steps_json(replay: Any) -> bytes:
+    """The `steps` array of MatchOut for a replay (a MatchReplay or a row of its columns).
+
+    Serializes iter_steps' output. Every observation history is the previous
+    one plus one pair, so the histories are kept as growing JSON fragments
+    (only the new pair is encoded) and each step is a single %-format
+    instead of a dict tree walked by an encoder.
+    """
+
+    out = bytearray(b"[")
+    hist_a = bytearray()
+    hist_b = bytearray()
+    for step in iter_steps(replay_rounds(replay)):
+        obs_a = step["obs_a"]
+        obs_b = step["obs_b"]
+        if obs_a["history"]:
+            out += b","
+            hist_a += (b"," if hist_a else b"") + dumps(obs_a["history"][-1])
+            hist_b += (b"," if hist_b else b"") + dumps(obs_b["history"][-1])
+        out += (
+            b'{"round":%d,"obs_a":{"round":%d,"max_rounds":%d,"history":[%b]},"act_a":%b,'
+            b'"obs_b":{"round":%d,"max_rounds":%d,"history":[%b]},"act_b":%b,'
+            b'"reward_a":%d,"reward_b":%d,"cum_a":%d,"cum_b":%d}'
+        ) % (
+            *(step["round"], obs_a["round"], obs_a["max_rounds"], hist_a, dumps(step["act_a"])),
+            *(obs_b["round"], obs_b["max_rounds"], hist_b, dumps(step["act_b"])),
+            *(step["reward_a"], step["reward_b"], step["cum_a"], step["cum_b"]),
+        )
+    out += b"]"
+    return bytes(out)
+
+
+def match_json(db: Session, match_id: int, user_id: int) -> bytes | None:
+    """GET /matches/{id} rendered straight from column tuples; None if the user has no such match.
+
+    Byte-for-byte what FastAPI would send for the equivalent MatchOut.
+    """
+
+    m = db.execute(select(*_MATCH_COLUMNS).where(Match.id == match_id, Match.user_id == user_id)).one_or_none()
+    if m is None:
+        return None
+    replay = db.execute(select(*_REPLAY_COLUMNS).where(MatchReplay.match_id == match_id)).one_or_none()
+
+    first = dumps(
+        {
+            "id": m.id,
+            "env_id": m.env_id,
+            "bot_id": m.bot_id,
+            "bot_code_hash": m.bot_code_hash,
+            "opponent_name": m.opponent_name,
+            "seed": m.seed,
+            "status": m.status,
+            "started_at": _iso(m.started_at),
+            "finished_at": _iso(m.finished_at),
+            "error_log": m.error_log,
+        }
+    )
+    last = dumps({"queued_at": _iso(m.queued_at), "queue_position": queue_position(db, m)})
+    return b"".join((first[:-1], b',"steps":', steps_json(replay) if replay is not None else b"[]", b",", last[1:]))
@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.bot import Bot
+from app.models.match import Match
+from app.models.match_replay import MatchReplay
+from app.services.docker_ipd_runner import DockerRunConfig, run_ipd_in_docker, sandbox_capacity
+from app.services.match_events import MatchEvents
+from app.services.match_replay import replay_rounds, save_replay
+
+logger = logging.getLogger(__name__)
+
+BASELINE_OPPONENT = "always_cooperate"
+BASELINE_CODE = "def act(observation, state):\n    return 'C', state\n"
+
+# Streamed rounds are written to the match's replay this many at a time.
+STEP_BATCH_ROUNDS = 25
+
+# A running match whose heartbeat is this many intervals old is re-queued.
+STALE_AFTER_HEARTBEATS = 3
+
+
+def _as_utc(ts: datetime) -> datetime:
+    # SQLite hands back naive datetimes; they are stored as UTC.
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+
+def enqueue_test_match(db: Session, *, user_id: int, bot: Bot, seed: int) -> Match:
+    """Queue a sandbox test match of `bot` against the baseline opponent (commits)."""
+
+    match = Match(
+        env_id=bot.env_id,
+        user_id=user_id,
+        bot_id=bot.id,
+        bot_code_hash=bot.code_hash,
+        opponent_name=BASELINE_OPPONENT,
+        seed=seed,
+        status="queued",
+    )
+    db.add(match)
+    db.commit()
+    db.refresh(match)
+    return match
+
+
+def queue_position(db: Session, match: Match) -> int | None:
+    """1-based position of a queued match (1 = next to run), None once it left the queue."""
+
+    if match.status != "queued":
+        return None
+    ahead = db.scalar(select(func.count(Match.id)).where(Match.status == "queued", Match.id < match.id))
+    return int(ahead or 0) + 1
+
+
+def match_queue_stats(db: Session, *, window: timedelta = timedelta(minutes=15)) -> dict:
+    """Queue depth and wait times of test matches.
+
+    `oldest_wait_s` is how long the head of the queue has been waiting;
+    `avg_wait_s` averages queued -> started over matches started within `window`.
+    """
+
+    now = datetime.now(timezone.utc)
+    counts = dict(
+        db.execute(
+            select(Match.status, func.count(Match.id))
+            .where(Match.status.in_(("queued", "running")))
+            .group_by(Match.status)
+        )
+        .tuples()
+        .all()
+    )
+    oldest = db.scalar(select(func.min(Match.queued_at)).where(Match.status == "queued"))
+    recent = db.execute(
+        select(Match.queued_at, Match.started_at).where(
+            Match.status.in_(("running", "completed", "failed")), Match.started_at >= now - window
+        )
+    ).tuples()
+    waits = [max((_as_utc(s) - _as_utc(q)).total_seconds(), 0.0) for q, s in recent]
+    return {
+        "queued": int(counts.get("queued", 0)),
+        "running": int(counts.get("running", 0)),
+        "oldest_wait_s": (now - _as_utc(oldest)).total_seconds() if oldest is not None else 0.0,
+        "avg_wait_s": sum(waits) / len(waits) if waits else 0.0,
+    }
+
+
+def claim_next_match(db: Session) -> Match | None:
+    """Atomically move the oldest queued match to "running" and return it."""
+
+    while True:
+        match_id = db.scalar(select(Match.id).where(Match.status == "queued").order_by(Match.id.asc()).limit(1))
+        if match_id is None:
+            return None
+        now = datetime.now(timezone.utc)
+        claimed = db.execute(
+            update(Match)
+            .where(Match.id == match_id, Match.status == "queued")
+            .values(status="running", started_at=now, heartbeat_at=now)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(Match, match_id)
+        # Another worker got it first; try the next one.
+
+
+def heartbeat_matches(db: Session, match_ids: list[int]) -> None:
+    """Mark running matches as still being played by this process (commits)."""
+
+    if not match_ids:
+        return
+    db.execute(
+        update(Match)
+        .where(Match.id.in_(match_ids), Match.status == "running")
+        .values(heartbeat_at=datetime.now(timezone.utc))
+    )
+    db.commit()
+
+
+def requeue_stuck_matches(db: Session, *, older_than: timedelta) -> int:
+    """Put "running" matches back in the queue if no heartbeat came for `older_than`.
+
+    A match is only given up when the process playing it stopped
+    refreshing heartbeat_at, so how long a match runs (or waits for a
+    sandbox slot) does not matter.
+    """
+
+    cutoff = datetime.now(timezone.utc) - older_than
+    n = db.execute(
+        update(Match)
+        .where(Match.status == "running", func.coalesce(Match.heartbeat_at, Match.started_at) < cutoff)
+        .values(status="queued")
+    ).rowcount
+    db.commit()
+    return int(n or 0)
+
+
+def _finish(db: Session, match: Match, *, error_log: str | None = None) -> None:
+    # Commits together with whatever replay write is pending in `db`.
+    db.execute(
+        update(Match)
+        .where(Match.id == match.id)
+        .values(
+            status="failed" if error_log else "completed",
+            error_log=error_log,
+            finished_at=datetime.now(timezone.utc),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def run_test_match(db: Session, *, cfg: DockerRunConfig, match: Match, events: MatchEvents | None = None) -> None:
+    """Play a claimed test match in the sandbox and store its steps and status.
+
+    Rounds are streamed from the harness as they are played: each one is
+    published to `events` right away and committed to the match's replay
+    every STEP_BATCH_ROUNDS rounds, so the replay grows while the match runs.
+    The final replay and the match status are written with two Core
+    statements in one transaction.
+    """
+
+    bot = db.get(Bot, match.bot_id)
+    if bot is None or bot.code_hash != match.bot_code_hash:
+        # The code this match was queued for is gone; a new test picks up the new code.
+        _finish(db, match, error_log="bot_code_changed")
+        return
+
+    # A match re-queued after a crash starts its replay over.
+    db.execute(delete(MatchReplay).where(MatchReplay.match_id == match.id))
+    acts_a: list[str] = []
+    acts_b: list[str] = []
+    stored = 0
+
+    def flush_rounds() -> None:
+        nonlocal stored
+        if len(acts_a) > stored:
+            save_replay(db, match.id, "".join(acts_a), "".join(acts_b))
+            db.commit()
+            stored = len(acts_a)
+
+    def on_round(record: dict) -> None:
+        if events is not None:
+            events.publish(match.id, record)
+        acts_a.append(str(record["act_a"]))
+        acts_b.append(str(record["act_b"]))
+        if len(acts_a) - stored >= STEP_BATCH_ROUNDS:
+            flush_rounds()
+
+    result = run_ipd_in_docker(
+        cfg=cfg, bot_a_code=bot.code, bot_b_code=BASELINE_CODE, seed=match.seed, on_round=on_round
+    )
+    if result.error_log:
+        # Rounds played before the failure stay as a partial replay.
+        flush_rounds()
+        _finish(db, match, error_log=result.error_log)
+        return
+
+    save_replay(db, match.id, result.acts_a, result.acts_b)
+    _finish(db, match)
+
+
+class MatchQueue:
+    """Worker pool for test matches requested through POST /bots/{id}/run-test.
+
+    Requests only insert a "queued" Match row and return; up to `workers`
+    threads (never more than the host fits, see sandbox_capacity) claim
+    queued matches oldest first, play them and record the result, so no
+    HTTP worker is held for the duration of a sandbox run. Rounds of the
+    matches in play are relayed live through `events`. Workers also
+    poll every `poll_interval_s` seconds, which picks up matches queued by
+    other processes. A heartbeat thread refreshes the matches in play every
+    `heartbeat_s` seconds; idle workers put back in the queue matches whose
+    heartbeat stopped (their process died), see requeue_stuck_matches.
+    """
+
+    def __init__(
+        self,
+        *,
+        session_factory: Callable[[], Session],
+        cfg: DockerRunConfig,
+        workers: int = 2,
+        poll_interval_s: float = 5.0,
+        heartbeat_s: float = 10.0,
+    ) -> None:
+        self.session_factory = session_factory
+        self.cfg = cfg
+        self.workers = max(1, min(workers, sandbox_capacity(cfg)))
+        self.poll_interval_s = poll_interval_s
+        self.heartbeat_s = heartbeat_s
+        self.events = MatchEvents()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._playing: set[int] = set()
+        self._playing_lock = threading.Lock()
+        self._last_requeue = 0.0
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        self._last_requeue = 0.0
+        t = threading.Thread(target=self._heartbeat_loop, name="match-queue-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"match-queue-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout=5.0)
+        self._threads = []
+
+    def notify(self) -> None:
+        """Wake the workers because a match was queued."""
+        self._wake.set()
+
+    def run_next(self) -> bool:
+        """Claim and play the next queued match; False if the queue was empty."""
+
+        with self.session_factory() as db:
+            match = claim_next_match(db)
+            if match is None:
+                return False
+            with self._playing_lock:
+                self._playing.add(match.id)
+            self.events.open(match.id)
+            try:
+                run_test_match(db, cfg=self.cfg, match=match, events=self.events)
+            except Exception as e:  # noqa: BLE001
+                db.rollback()
+                _finish(db, match, error_log=f"match_failed: {e}")
+                raise
+            finally:
+                with self._playing_lock:
+                    self._playing.discard(match.id)
+                self.events.close(match.id, match.status)
+            return True
+
+    def requeue_stuck(self) -> int:
+        """Re-queue matches whose heartbeat stopped, at most once per heartbeat interval."""
+
+        now = time.monotonic()
+        with self._playing_lock:
+            if now - self._last_requeue < self.heartbeat_s:
+                return 0
+            self._last_requeue = now
+        with self.session_factory() as db:
+            return requeue_stuck_matches(db, older_than=timedelta(seconds=STALE_AFTER_HEARTBEATS * self.heartbeat_s))
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(timeout=self.heartbeat_s):
+            with self._playing_lock:
+                playing = sorted(self._playing)
+            try:
+                with self.session_factory() as db:
+                    heartbeat_matches(db, playing)
+            except Exception:  # noqa: BLE001
+                logger.exception("match queue: heartbeat failed")
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            # Clear before claiming so a notify() that arrives meanwhile is not lost.
+            self._wake.clear()
+            try:
+                if self.requeue_stuck():
+                    continue
+                if self.run_next():
+                    continue
+            except Exception:  # noqa: BLE001
+                logger.exception("match queue: match failed")
+                continue
+            self._wake.wait(timeout=self.poll_interval_s)
+
+    def _stored_rounds(self, match_id: int, after_round: int) -> tuple[str | None, list[dict]]:
+        with self.session_factory() as db:
+            status = db.scalar(select(Match.status).where(Match.id == match_id))
+            return status, replay_rounds(db.get(MatchReplay, match_id), after_round=after_round)
+
+    async def follow(
+        self, match_id: int, *, after_round: int = 0, poll_interval_s: float = 0.5, keepalive_s: float = 15.0
+    ) -> AsyncIterator[dict | None]:
+        """Round records of a match as they are played, then {"event": "end", "status": ...}.
+
+        While this process plays the match, rounds come straight from
+        `events`, handed from the worker thread to the event loop through an
+        asyncio.Queue; otherwise (queued, played elsewhere, or already
+        finished) they are read from the stored replay in the threadpool,
+        polling for new batches every `poll_interval_s`. Rounds up to
+        `after_round` are skipped. Yields None as a keep-alive after
+        `keepalive_s` without news.
+        """
+
+        loop = asyncio.get_running_loop()
+        sent = after_round
+        idle_since = time.monotonic()
+        while True:
+            q: asyncio.Queue[dict] = asyncio.Queue()
+
+            def deliver(record: dict) -> None:
+                try:
+                    loop.call_soon_threadsafe(q.put_nowait, record)
+                except RuntimeError:  # the loop is gone; the subscriber is unsubscribed by its finally
+                    pass
+
+            if self.events.subscribe(match_id, deliver):
+                try:
+                    while True:
+                        try:
+                            record = await asyncio.wait_for(q.get(), keepalive_s)
+                        except asyncio.TimeoutError:
+                            yield None
+                            continue
+                        if record.get("event") == "end":
+                            break
+                        if record["round"] > sent:
+                            sent = record["round"]
+                            yield record
+                finally:
+                    self.events.unsubscribe(match_id, deliver)
+                # The final status (and any round we missed) comes from the database.
+
+            status, steps = await run_in_threadpool(self._stored_rounds, match_id, sent)
+            for step in steps:
+                sent = step["round"]
+                yield {"event": "round", **step}
+            if status not in ("queued", "running"):
+                yield {"event": "end", "status": status}
+                return
+            if steps:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since >= keepalive_s:
+                idle_since = time.monotonic()
+                yield None
+            await asyncio.sleep(poll_interval_s)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import struct
+from functools import lru_cache
+from typing import Any, Iterator
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import Insert
+
+from app.env.ipd import iter_steps, pack_actions, payoff, unpack_actions
+from app.models.match_replay import MatchReplay
+
+
+def _pack_u32(values: list[int]) -> bytes:
+    return struct.pack(f"<{len(values)}I", *values)
+
+
+def _unpack_u32(data: bytes, start: int = 0, stop: int | None = None) -> tuple[int, ...]:
+    stop = len(data) // 4 if stop is None else stop
+    return struct.unpack_from(f"<{stop - start}I", data, 4 * start)
+
+
+def encode_replay(acts_a: str, acts_b: str) -> dict[str, Any]:
+    """MatchReplay column values for a transcript given as one action character per round."""
+
+    if len(acts_a) != len(acts_b):
+        raise ValueError("action_length_mismatch")
+    rewards_a: list[int] = []
+    rewards_b: list[int] = []
+    cum_a: list[int] = []
+    cum_b: list[int] = []
+    for act_a, act_b in zip(acts_a, acts_b):
+        ra, rb = payoff(act_a, act_b)  # type: ignore[arg-type]
+        rewards_a.append(ra)
+        rewards_b.append(rb)
+        cum_a.append((cum_a[-1] if cum_a else 0) + ra)
+        cum_b.append((cum_b[-1] if cum_b else 0) + rb)
+    return {
+        "rounds": len(acts_a),
+        "acts_a": pack_actions(acts_a),
+        "acts_b": pack_actions(acts_b),
+        "rewards_a": bytes(rewards_a),
+        "rewards_b": bytes(rewards_b),
+        "cum_a": _pack_u32(cum_a),
+        "cum_b": _pack_u32(cum_b),
+    }
+
+
+@lru_cache(maxsize=None)
+def _upsert_statement(dialect: str) -> Insert:
+    table = MatchReplay.__table__
+    stmt = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.match_id],
+        set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name != "match_id"},
+    )
+
+
+def save_replay(db: Session, match_id: int, acts_a: str, acts_b: str) -> None:
+    """Create or overwrite the replay of a match (no commit).
+
+    One INSERT ... ON CONFLICT DO UPDATE on the session's connection,
+    bypassing the unit of work, so it can share the transaction of the
+    Match status update. A MatchReplay already loaded in `db` is not
+    refreshed until the next commit.
+    """
+
+    values = {"match_id": match_id, **encode_replay(acts_a, acts_b)}
+    db.connection().execute(_upsert_statement(db.get_bind().dialect.name), values)
+
+
+def replay_rounds(
+    replay: MatchReplay | None, *, after_round: int = 0, to_round: int | None = None
+) -> list[dict[str, Any]]:
+    """Per-round records (round, actions, rewards, running scores) of rounds after_round+1..to_round, without observations."""
+
+    if replay is None:
+        return []
+    start = max(after_round, 0)
+    stop = replay.rounds if to_round is None else min(to_round, replay.rounds)
+    if start >= stop:
+        return []
+    acts_a = unpack_actions(replay.acts_a, stop)
+    acts_b = unpack_actions(replay.acts_b, stop)
+    cum_a = _unpack_u32(replay.cum_a, start, stop)
+    cum_b = _unpack_u32(replay.cum_b, start, stop)
+    return [
+        {
+            "round": i + 1,
+            "act_a": acts_a[i],
+            "act_b": acts_b[i],
+            "reward_a": replay.rewards_a[i],
+            "reward_b": replay.rewards_b[i],
+            "cum_a": cum_a[i - start],
+            "cum_b": cum_b[i - start],
+        }
+        for i in range(start, stop)
+    ]
+
+
+def iter_replay_steps(
+    replay: MatchReplay | None, *, from_round: int = 1, to_round: int | None = None
+) -> Iterator[dict[str, Any]]:
+    """Full steps of rounds from_round..to_round, one at a time (see iter_steps)."""
+
+    if replay is None:
+        return
+    start = max(from_round, 1) - 1
+    yield from iter_steps(
+        replay_rounds(replay, after_round=start, to_round=to_round),
+        prefix_a=unpack_actions(replay.acts_a, min(start, replay.rounds)),
+        prefix_b=unpack_actions(replay.acts_b, min(start, replay.rounds)),
+    )
+
+
+def replay_steps_of(replay: MatchReplay | None) -> list[dict[str, Any]]:
+    """Full steps as match_steps used to store them, observations rebuilt from the actions."""
+
+    return list(iter_replay_steps(replay))
+
+
+def replay_summary(replay: MatchReplay | None) -> dict[str, Any]:
+    """Rounds played, final scores and cooperation rates, read without unpacking the rounds."""
+
+    n = replay.rounds if replay is not None else 0
+    if replay is None or n == 0:
+        return {"rounds": 0, "score_a": 0, "score_b": 0, "coop_rate_a": None, "coop_rate_b": None}
+    # One bit per round is set for "D"; bits past the last round are zero.
+    defects_a = int.from_bytes(replay.acts_a, "little").bit_count()
+    defects_b = int.from_bytes(replay.acts_b, "little").bit_count()
+    return {
+        "rounds": n,
+        "score_a": _unpack_u32(replay.cum_a, n - 1, n)[0],
+        "score_b": _unpack_u32(replay.cum_b, n - 1, n)[0],
+        "coop_rate_a": (n - defects_a) / n,
+        "coop_rate_b": (n - defects_b) / n,
+    }
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import select
+import subprocess
+import threading
+import time
+import uuid
+from typing import TYPE_CHECKING, Callable
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    from app.services.docker_ipd_runner import DockerRunConfig
+
+logger = logging.getLogger(__name__)
+
+SERVER_MODULE = "runner.server"
+
+
+class RunnerWorkerError(RuntimeError):
+    pass
+
+
+def runner_module_cmd(module: str) -> list[str]:
+    """The sandbox command running `module` of the runner package.
+
+    Isolated python (-I) leaves the working directory off sys.path, so
+    settings.runner_root is added explicitly for `runner.*` imports.
+    """
+
+    return [
+        "python",
+        "-I",
+        "-c",
+        f"import sys,runpy; sys.path.insert(0,{settings.runner_root!r}); runpy.run_module({module!r}, run_name='__main__')",
+    ]
+
+
+class _Worker:
+    """One long-lived, locked-down runner container speaking the runner.server protocol."""
+
+    def __init__(self, cfg: DockerRunConfig, *, docker_args: list[str]):
+        self.name = f"botarena-runner-{uuid.uuid4().hex[:12]}"
+        self.matches = 0
+        self._buf = b""
+        self._proc = subprocess.Popen(
+            [
+                "docker",
+                "run",
+                "--rm",
+                "-i",
+                "--name",
+                self.name,
+                *docker_args,
+                cfg.image,
+                *runner_module_cmd(SERVER_MODULE),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def _readline(self, timeout_s: float) -> bytes:
+        assert self._proc.stdout is not None
+        fd = self._proc.stdout.fileno()
+        deadline = time.monotonic() + timeout_s
+        while b"\n" not in self._buf:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise RunnerWorkerError("worker_timeout")
+            r, _, _ = select.select([fd], [], [], left)
+            if not r:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise RunnerWorkerError("worker_exited")
+            self._buf += chunk
+        line, _, self._buf = self._buf.partition(b"\n")
+        return line
+
+    def request(
+        self, data: bytes, timeout_s: float, *, on_event: Callable[[dict], None] | None = None
+    ) -> bytes:
+        """Send one request; return its response line.
+
+        Event lines the server emits first (streamed rounds) are passed to
+        `on_event`; `timeout_s` covers the whole exchange.
+        """
+
+        assert self._proc.stdin is not None
+        try:
+            self._proc.stdin.write(data + b"\n")
+            self._proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise RunnerWorkerError("worker_exited") from e
+        deadline = time.monotonic() + timeout_s
+        while True:
+            line = self._readline(deadline - time.monotonic())
+            if not line.startswith(b'{"event"'):
+                return line
+            if on_event is not None:
+                on_event(json.loads(line))
+
+    def ping(self, timeout_s: float) -> bool:
+        try:
+            return json.loads(self.request(b'{"op": "ping"}', timeout_s)).get("pong") is True
+        except (RunnerWorkerError, ValueError):
+            return False
+
+    def close(self) -> None:
+        # Killing the docker client does not stop the container; remove it by name.
+        try:
+            self._proc.kill()
+        except Exception:
+            pass
+        try:
+            subprocess.run(
+                ["docker", "rm", "-f", self.name],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=False,
+            )
+        except OSError:
+            logger.warning("runner pool: could not remove container %s", self.name)
+
+
+class RunnerPool:
+    """Warm pool of pre-started sandbox containers.
+
+    Containers are started and health-checked by a background thread, handed
+    out one match at a time, and recycled after `max_matches` matches or on
+    any failure (including bot errors). Between matches the server inside
+    the container kills leftover processes and empties /tmp (see
+    runner.harness.reset_sandbox).
+    """
+
+    def __init__(
+        self,
+        cfg: DockerRunConfig,
+        *,
+        docker_args: list[str],
+        size: int,
+        max_matches: int,
+        health_interval_s: float,
+        start_timeout_s: float = 15.0,
+    ):
+        self.cfg = cfg
+        self.size = size
+        self.max_matches = max_matches
+        self.health_interval_s = health_interval_s
+        self.start_timeout_s = start_timeout_s
+        self._docker_args = docker_args
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._lock = threading.Lock()
+        self._total = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._maintain, name="runner-pool", daemon=True)
+        self._thread.start()
+
+    def run(
+        self, data: bytes, *, timeout_s: float | None = None, on_event: Callable[[dict], None] | None = None
+    ) -> bytes | None:
+        """Run one match payload on a warm container (within `timeout_s`, default cfg.timeout_seconds).
+
+        Streamed event lines are handed to `on_event` as they arrive.
+
+        Returns the raw response line, or None if no warm container is
+        available (the caller should fall back to a cold `docker run`).
+        Raises RunnerWorkerError if the container died or timed out mid-match.
+        """
+
+        try:
+            w = self._idle.get_nowait()
+        except queue.Empty:
+            self._wake.set()
+            return None
+
+        ok = False
+        try:
+            out = w.request(
+                data, float(self.cfg.timeout_seconds) if timeout_s is None else timeout_s, on_event=on_event
+            )
+            w.matches += 1
+            try:
+                ok = json.loads(out).get("rc") == 0
+            except ValueError:
+                ok = False
+            return out
+        finally:
+            if ok and w.matches < self.max_matches and not self._closed:
+                self._idle.put(w)
+            else:
+                self._retire(w)
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        while True:
+            try:
+                self._retire(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def _retire(self, w: _Worker) -> None:
+        with self._lock:
+            self._total -= 1
+        threading.Thread(target=w.close, daemon=True).start()
+        self._wake.set()
+
+    def _spawn(self) -> bool:
+        with self._lock:
+            if self._total >= self.size:
+                return True
+            self._total += 1
+        try:
+            w = _Worker(self.cfg, docker_args=self._docker_args)
+        except OSError:
+            logger.exception("runner pool: failed to start container")
+            with self._lock:
+                self._total -= 1
+            return False
+        if not w.ping(self.start_timeout_s):
+            logger.warning("runner pool: container %s failed its first health check", w.name)
+            self._retire(w)
+            return False
+        self._idle.put(w)
+        return True
+
+    def _health_check(self) -> None:
+        for _ in range(self._idle.qsize()):
+            try:
+                w = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if w.alive() and w.ping(5.0):
+                self._idle.put(w)
+            else:
+                self._retire(w)
+
+    def _maintain(self) -> None:
+        backoff = 1.0
+        last_check = time.monotonic()
+        while not self._closed:
+            while not self._closed and self._total < self.size:
+                if not self._spawn():
+                    # Docker unavailable or image broken: back off instead of spinning.
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 60.0)
+                    break
+                backoff = 1.0
+
+            if time.monotonic() - last_check >= self.health_interval_s:
+                self._health_check()
+                last_check = time.monotonic()
+
+            self._wake.wait(timeout=self.health_interval_s)
+            self._wake.clear()
@@ -5,14 +5,18 @@ from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session, sessionmaker
 
+from app.core.config import settings
 from app.db.base import Base
 from app.db.session import get_db
 from app.main import create_app
+from app.services.docker_ipd_runner import DockerRunConfig
+from app.services.ipd_tournament import IpdTournament
+from app.services.match_queue import MatchQueue
 from app import models  # noqa: F401
 
 
 @pytest.fixture()
-def client(tmp_path):
+def session_factory(tmp_path):
     # sqlite file per test to ensure isolation
     db_path = tmp_path / "test.db"
     db_url = f"sqlite:///{db_path}"
@@ -20,11 +24,33 @@ def client(tmp_path):
     engine = create_engine(db_url, connect_args={"check_same_thread": False})
     TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=Session)
     Base.metadata.create_all(bind=engine)
+    return TestingSessionLocal
 
+
+@pytest.fixture()
+def db(session_factory):
+    s = session_factory()
+    try:
+        yield s
+    finally:
+        s.close()
+
+
+@pytest.fixture()
+def client(session_factory, monkeypatch):
+    # Duels need Docker; tests only exercise planning, never the background worker.
+    monkeypatch.setattr(settings, "ipd_tournament_enabled", False)
+    monkeypatch.setattr(settings, "ipd_preflight_enabled", False)
+    # Tests drive the match queue by hand (MatchQueue.run_next).
+    monkeypatch.setattr(settings, "match_queue_enabled", False)
     app = create_app()
+    app.state.ipd_tournament = IpdTournament(
+        session_factory=session_factory, cfg=DockerRunConfig(image=settings.runner_image)
+    )
+    app.state.match_queue = MatchQueue(session_factory=session_factory, cfg=DockerRunConfig(image=settings.runner_image))
 
     def override_get_db():
-        db = TestingSessionLocal()
+        db = session_factory()
         try:
             yield db
         finally:
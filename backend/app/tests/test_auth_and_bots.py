@@ -1,3 +1,18 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.disconnect import cancel_on_disconnect
+from app.core.config import settings
+from app.services import ipd_preflight
+from app.services.code_hash import code_hash_py
+from app.services.docker_ipd_runner import DockerIpdResult
+from app.services.ipd_preflight import _in_thread
+
+
 def _register(client, username="alice", password="password123"):
     return client.post("/api/auth/register", json={"username": username, "password": password})
 
@@ -31,3 +46,109 @@ def test_create_bot_unique_per_user(client):
     assert r2.status_code == 409
     assert r2.json()["detail"] == "bot_name_taken"
 
+
+def test_unparsable_code_is_saved_as_a_draft(client):
+    _register(client, "alice", "password123")
+    token = _login(client, "alice", "password123").json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    payload = {"env_id": "ipd", "name": "broken", "code": "def act(observation, state:\n"}
+    r = client.post("/api/bots", json=payload, headers=headers)
+    assert r.status_code == 201
+    bot_id = r.json()["id"]
+
+    r = client.put(f"/api/bots/{bot_id}", json={"code": "def act(observation, state:\n    pass\n"}, headers=headers)
+    assert r.status_code == 200
+    # Each unparsable draft gets its own hash; the sandbox reports the syntax error.
+    assert code_hash_py("def act(observation, state:\n") != code_hash_py("def act(observation, state:\n    pass\n")
+    assert client.post(f"/api/bots/{bot_id}/run-test", headers=headers).status_code == 202
+
+
+def test_submit_runs_cached_preflight_and_rejects_failures(client, monkeypatch):
+    calls = []
+
+    async def fake_run(*, cfg, bot_a_code, bot_b_code, seed, rounds=None, max_seeds=1):
+        calls.append(rounds)
+        if "raise" in bot_a_code:
+            return DockerIpdResult(
+                cum_a=0, cum_b=0, error_log="Traceback: boom", failure="load_failed", fault="a"
+            )
+        if "sleep" in bot_a_code:
+            return DockerIpdResult(cum_a=0, cum_b=0, error_log="too slow", failure="step_timeout", fault="a")
+        return DockerIpdResult(cum_a=30, cum_b=30, startup_ms_a=12.0, avg_exec_ms_a=0.4, max_step_ms_a=1.5)
+
+    monkeypatch.setattr(settings, "ipd_preflight_enabled", True)
+    monkeypatch.setattr(ipd_preflight, "run_ipd_in_docker_async", fake_run)
+    monkeypatch.setattr(ipd_preflight, "harness_version", lambda cfg: "v1")
+
+    _register(client, "alice", "password123")
+    token = _login(client, "alice", "password123").json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    good = "def act(observation, state):\n    return 'C', state\n"
+    bad = "raise RuntimeError('boom')\n"
+    slow = "import time\ndef act(observation, state):\n    time.sleep(1)\n    return 'C', state\n"
+    ids = [
+        client.post("/api/bots", json={"env_id": "ipd", "name": n, "code": c}, headers=headers).json()["id"]
+        for n, c in (("good", good), ("twin", good), ("bad", bad), ("slow", slow))
+    ]
+
+    assert client.post(f"/api/bots/{ids[0]}/submit", headers=headers).json()["submitted"] is True
+    # Same code hash: the stored preflight is reused.
+    assert client.post(f"/api/bots/{ids[1]}/submit", headers=headers).status_code == 200
+    assert calls == [settings.ipd_preflight_rounds]
+
+    r = client.post(f"/api/bots/{ids[2]}/submit", headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"].startswith("preflight_failed: load_failed")
+    assert client.get(f"/api/bots/{ids[2]}", headers=headers).json()["submitted"] is False
+
+    # A timeout is rejected but not stored: the next submit runs the bot again.
+    for _ in range(2):
+        r = client.post(f"/api/bots/{ids[3]}/submit", headers=headers)
+        assert r.json()["detail"].startswith("preflight_failed: step_timeout")
+    assert calls == [settings.ipd_preflight_rounds] * 4
+
+    # Preflights are kept per number of rounds.
+    monkeypatch.setattr(settings, "ipd_preflight_rounds", 20)
+    assert client.post(f"/api/bots/{ids[1]}/submit", headers=headers).status_code == 200
+    assert calls[-1] == 20
+
+
+def test_preflight_is_cancelled_when_the_client_disconnects():
+    class DisconnectingRequest:
+        async def receive(self):
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+    cancelled = []
+
+    async def preflight():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(asyncio.wait_for(cancel_on_disconnect(DisconnectingRequest(), preflight()), 5))
+    assert (e.value.status_code, cancelled) == (499, [True])
+
+
+def test_cancelled_preflight_waits_for_its_database_work():
+    finished = threading.Event()
+
+    def db_work():
+        time.sleep(0.3)
+        finished.set()
+
+    async def cancel_midway():
+        task = asyncio.ensure_future(_in_thread(db_work))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The session is only given back once the thread is done with it.
+        return finished.is_set()
+
+    assert asyncio.run(cancel_midway())
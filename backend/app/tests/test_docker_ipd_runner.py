@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sys
+import weakref
+from pathlib import Path
+
+import pytest
+
+from app.core.config import settings
+from app.services import docker_ipd_runner
+from app.services.docker_ipd_runner import DockerRunConfig, run_ipd_in_docker, run_ipd_in_docker_async
+from app.services.runner_pool import RunnerWorkerError
+
+RUNNER_DIR = Path(__file__).resolve().parents[3] / "runner"
+
+TIT_FOR_TAT = (
+    "def act(observation, state):\n"
+    "    history = observation['history']\n"
+    "    return (history[-1][1] if history else 'C'), state\n"
+)
+DEFECT = "def act(observation, state):\n    return 'D', state\n"
+
+
+@pytest.fixture()
+def fake_docker(tmp_path, monkeypatch):
+    """A `docker` on PATH that runs the container's command locally (or hangs) and logs its arguments."""
+
+    def install(*, hang: bool = False) -> Path:
+        log = tmp_path / "docker.log"
+        script = tmp_path / "docker"
+        script.write_text(
+            f"#!{sys.executable}\n"
+            "import os, sys, time\n"
+            f"with open({str(log)!r}, 'a') as f:\n"
+            "    f.write(' '.join(sys.argv[1:]) + '\\n')\n"
+            "if sys.argv[1] == 'kill':\n"
+            "    sys.exit(0)\n"
+            f"if {hang!r}:\n"
+            "    time.sleep(60)\n"
+            "cmd = sys.argv[sys.argv.index('python') + 1 :]\n"
+            "os.execv(sys.executable, [sys.executable, *cmd])\n"
+        )
+        script.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+        monkeypatch.setattr(settings, "runner_root", str(RUNNER_DIR))
+        return log
+
+    return install
+
+
+def test_async_runner_streams_rounds(fake_docker):
+    fake_docker()
+    rounds = []
+    result = asyncio.run(
+        run_ipd_in_docker_async(
+            cfg=DockerRunConfig(image="runner"),
+            bot_a_code=TIT_FOR_TAT,
+            bot_b_code=DEFECT,
+            seed=1,
+            rounds=5,
+            on_round=rounds.append,
+        )
+    )
+    assert result.error_log is None
+    assert (result.acts_a, result.acts_b) == ("CDDDD", "DDDDD")
+    assert [r["round"] for r in rounds] == [1, 2, 3, 4, 5]
+    assert (rounds[-1]["cum_a"], rounds[-1]["cum_b"]) == (result.cum_a, result.cum_b)
+
+
+def _container_name(log: Path) -> str:
+    run = log.read_text().splitlines()[0].split()
+    return run[run.index("--name") + 1]
+
+
+def test_async_runner_kills_sandbox_on_timeout_and_cancel(fake_docker):
+    log = fake_docker(hang=True)
+    cfg = DockerRunConfig(image="runner", timeout_seconds=1)
+
+    result = asyncio.run(run_ipd_in_docker_async(cfg=cfg, bot_a_code=DEFECT, bot_b_code=DEFECT, seed=1))
+    assert result.error_log == "docker_timeout"
+    assert log.read_text().splitlines()[-1] == f"kill {_container_name(log)}"
+
+    async def cancel_midway():
+        task = asyncio.ensure_future(
+            run_ipd_in_docker_async(cfg=DockerRunConfig(image="runner"), bot_a_code=DEFECT, bot_b_code=DEFECT, seed=1)
+        )
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    log.unlink()
+    asyncio.run(asyncio.wait_for(cancel_midway(), 10))
+    assert log.read_text().splitlines()[-1] == f"kill {_container_name(log)}"
+
+
+def test_pooled_and_cold_runs_report_failures_alike(monkeypatch):
+    class FakePool:
+        def __init__(self, reply):
+            self.reply = reply
+
+        def run(self, data, *, timeout_s, on_event):
+            if isinstance(self.reply, Exception):
+                raise self.reply
+            return self.reply
+
+    def pooled(reply):
+        monkeypatch.setattr(docker_ipd_runner, "_get_pool", lambda cfg: FakePool(reply))
+        return run_ipd_in_docker(cfg=DockerRunConfig(image="runner"), bot_a_code=DEFECT, bot_b_code=DEFECT, seed=1)
+
+    # A cold `docker run` whose harness exits 2 (what runner.harness does on bad input).
+    cold = docker_ipd_runner._harness_result(2, b'{"error_log": "invalid_input"}', b"")
+    warm = pooled(b'{"error_log": "invalid_input", "rc": 2}')
+    assert cold.error_log.splitlines()[0] == warm.error_log.splitlines()[0] == "docker_failed rc=2"
+
+    bot = pooled(b'{"error_log": "invalid_action", "error": "invalid_action", "fault": "b", "rc": 6}')
+    assert (bot.error_log, bot.failure, bot.fault) == ("invalid_action", "invalid_action", "b")
+    assert pooled(RunnerWorkerError("worker_timeout")).error_log == "docker_timeout"
+
+
+def test_async_callers_queue_fairly_for_their_share_of_sandboxes(monkeypatch):
+    monkeypatch.setattr(settings, "runner_async_concurrency", 1)
+    monkeypatch.setattr(docker_ipd_runner, "_async_slots", weakref.WeakKeyDictionary())
+    started, running = [], []
+
+    async def fake_run(*, cfg, bot_a_code, **kwargs):
+        started.append(bot_a_code)
+        running.append(bot_a_code)
+        assert len(running) == 1
+        await asyncio.sleep(0.3)
+        running.remove(bot_a_code)
+        return docker_ipd_runner.DockerIpdResult(cum_a=1, cum_b=1)
+
+    monkeypatch.setattr(docker_ipd_runner, "_run_ipd_async", fake_run)
+
+    async def play(name, timeout_seconds=5):
+        cfg = DockerRunConfig(image="runner", timeout_seconds=timeout_seconds)
+        return await run_ipd_in_docker_async(cfg=cfg, bot_a_code=name, bot_b_code=DEFECT, seed=1)
+
+    async def main():
+        first = asyncio.ensure_future(play("first"))
+        await asyncio.sleep(0)
+        rest = [asyncio.ensure_future(play(f"bot{i}")) for i in range(3)]
+        busy = await play("impatient", timeout_seconds=0.1)
+        return busy, await asyncio.gather(first, *rest)
+
+    busy, results = asyncio.run(main())
+    assert busy.error_log == "sandbox_busy"
+    assert all(r.error_log is None for r in results)
+    # In the order the callers arrived.
+    assert started == ["first", "bot0", "bot1", "bot2"]
@@ -0,0 +1,152 @@
+import json
+import subprocess
+import sys
+import time
+
+import pytest
+
+from runner import harness
+
+RANDOM_BOT = (
+    "import random\n"
+    "def act(observation, state):\n"
+    "    return random.choice('CD'), state\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_zygote(monkeypatch):
+    monkeypatch.setattr(harness, "_zygote", None)
+    yield
+    if harness._zygote is not None:
+        harness._zygote.close()
+
+
+def write_bots(tmp_path, code_a: str, code_b: str) -> tuple[str, str]:
+    path_a, path_b = tmp_path / "bot_a.py", tmp_path / "bot_b.py"
+    path_a.write_text(code_a)
+    path_b.write_text(code_b)
+    return str(path_a), str(path_b)
+
+
+def test_zygote_and_cold_bots_draw_the_same_random_stream(tmp_path, monkeypatch):
+    paths = write_bots(tmp_path, RANDOM_BOT, RANDOM_BOT)
+
+    rc, forked, _ = harness._play(*paths, 7, rounds=50)
+    assert rc == 0
+    assert harness._zygote is not None and harness._zygote.alive()
+
+    def no_zygote():
+        raise OSError("zygote unavailable")
+
+    harness._zygote.close()
+    monkeypatch.setattr(harness, "_zygote", None)
+    monkeypatch.setattr(harness, "_Zygote", no_zygote)
+    rc, cold, _ = harness._play(*paths, 7, rounds=50)
+    assert rc == 0
+    assert harness._zygote is None
+
+    assert (forked["acts_a"], forked["acts_b"]) == (cold["acts_a"], cold["acts_b"])
+    assert "C" in forked["acts_a"] and "D" in forked["acts_a"]
+
+
+def test_bots_are_not_dumpable(tmp_path):
+    # PR_GET_DUMPABLE is 3; a dumpable bot would defect.
+    probe = (
+        "import ctypes\n"
+        "def act(observation, state):\n"
+        "    return ('C' if ctypes.CDLL(None).prctl(3, 0, 0, 0, 0) == 0 else 'D'), state\n"
+    )
+    rc, body, _ = harness._play(*write_bots(tmp_path, probe, probe), 1, rounds=1)
+    assert rc == 0
+    assert (body["acts_a"], body["acts_b"]) == ("C", "C")
+
+
+def test_worker_without_ready_line_falls_back_to_protocol_1(tmp_path, monkeypatch):
+    # A v1 worker: no ready line, and only full observations are understood.
+    worker = tmp_path / "v1_worker.py"
+    worker.write_text(
+        "import json, sys\n"
+        "for line in sys.stdin:\n"
+        "    msg = json.loads(line)\n"
+        "    act = 'C' if 'obs' in msg and msg['obs']['round'] == len(msg['obs']['history']) + 1 else 'D'\n"
+        "    print(json.dumps({'act': act, 'state': msg['state']}), flush=True)\n"
+    )
+
+    def spawn_v1(*, code_path, seed):
+        p = subprocess.Popen(
+            [sys.executable, str(worker)], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+        )
+        return harness._BotHandle(pid=p.pid, stdin=p.stdin, stdout_fd=p.stdout.fileno(), proc=p)
+
+    monkeypatch.setattr(harness, "_spawn_bot", spawn_v1)
+    rc, body, _ = harness._play(*write_bots(tmp_path, RANDOM_BOT, RANDOM_BOT), 1, rounds=5)
+    assert rc == 0
+    assert (body["acts_a"], body["acts_b"]) == ("CCCCC", "CCCCC")
+    # Each bot waited out the whole load timeout.
+    assert min(body["startup_ms_a"], body["startup_ms_b"]) >= harness.LOAD_TIMEOUT_MS
+
+
+def test_import_time_output_before_the_ready_line_is_discarded(tmp_path):
+    noisy = (
+        "print('loading...')\n"
+        "print('{\"act\": \"D\", \"state\": {}}')\n"
+        "def act(observation, state):\n"
+        "    return 'C', state\n"
+    )
+    path_a, _ = write_bots(tmp_path, noisy, noisy)
+    bot = harness._spawn_bot(code_path=path_a, seed=1)
+    try:
+        assert harness._wait_ready(bot, time.monotonic() + harness.LOAD_TIMEOUT_MS / 1000) is None
+        assert bot.protocol == 2
+    finally:
+        harness._kill(bot)
+
+    rc, body, _ = harness._play(*write_bots(tmp_path, noisy, noisy), 1, rounds=3)
+    assert rc == 0
+    assert (body["acts_a"], body["acts_b"]) == ("CCC", "CCC")
+    assert max(body["startup_ms_a"], body["startup_ms_b"]) < harness.LOAD_TIMEOUT_MS
+
+
+COOPERATE = "def act(observation, state):\n    return 'C', state\n"
+SLEEPY = "import time\ndef act(observation, state):\n    time.sleep(1)\n    return 'C', state\n"
+EXITING = "import os\ndef act(observation, state):\n    os._exit(0)\n"
+
+
+def test_slow_bot_times_out_on_its_own_deadline(tmp_path):
+    path_fast, path_slow = write_bots(tmp_path, COOPERATE, SLEEPY)
+    bots = [harness._spawn_bot(code_path=path_fast, seed=1), harness._spawn_bot(code_path=path_slow, seed=2)]
+    try:
+        for bot in bots:
+            assert harness._wait_ready(bot, time.monotonic() + harness.LOAD_TIMEOUT_MS / 1000) is None
+        sent_at = []
+        for bot in bots:
+            sent_at.append(time.monotonic())
+            bot.stdin.write(harness._step_message(bot, round_num=1, history=[], state={}))
+            bot.stdin.flush()
+            time.sleep(0.02)
+        lines, elapsed_ms = harness._read_replies(bots, sent_at, harness.MAX_STEP_MS / 1000)
+    finally:
+        for bot in bots:
+            harness._kill(bot)
+
+    assert json.loads(lines[0])["act"] == "C" and lines[1] is None
+    assert elapsed_ms[0] < harness.MAX_STEP_MS
+    # Counted from when the slow bot's own message was sent, not the first one.
+    assert harness.MAX_STEP_MS <= elapsed_ms[1] < 1000
+
+
+@pytest.mark.parametrize(
+    ("code_a", "code_b", "error", "fault"),
+    [
+        (SLEEPY, COOPERATE, "step_timeout", "a"),
+        (COOPERATE, SLEEPY, "step_timeout", "b"),
+        (SLEEPY, SLEEPY, "step_timeout", "both"),
+        (EXITING, EXITING, "bot_exited", "both"),
+        (COOPERATE, EXITING, "bot_exited", "b"),
+    ],
+)
+def test_failures_in_the_same_round_blame_the_right_bots(tmp_path, code_a, code_b, error, fault):
+    rc, body, _ = harness._play(*write_bots(tmp_path, code_a, code_b), 1, rounds=3)
+    assert rc == 4
+    assert (body["error"], body["fault"]) == (error, fault)
@@ -1,4 +1,4 @@
-from app.env.ipd import run_policies
+from app.env.ipd import pack_actions, replay_steps, run_policies, unpack_actions
 
 
 def test_ipd_all_c_vs_all_c_deterministic():
@@ -39,3 +39,20 @@ def test_ipd_state_must_be_jsonable():
     except TypeError:
         pass
 
+
+def test_replay_steps_rebuilds_player_centric_observations():
+    steps = replay_steps("CD", "DD")
+    assert [s["round"] for s in steps] == [1, 2]
+    assert steps[0]["obs_a"]["history"] == []
+    assert steps[1]["obs_a"]["history"] == [["C", "D"]]
+    assert steps[1]["obs_b"]["history"] == [["D", "C"]]
+    assert (steps[0]["reward_a"], steps[0]["reward_b"]) == (0, 5)
+    assert (steps[1]["cum_a"], steps[1]["cum_b"]) == (1, 6)
+
+
+def test_pack_actions_round_trip():
+    acts = "CDDCCCCCD" * 23
+    packed = pack_actions(acts)
+    assert len(packed) == (len(acts) + 7) // 8
+    assert unpack_actions(packed, len(acts)) == acts
+    assert pack_actions("") == b""
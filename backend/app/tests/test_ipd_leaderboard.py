@@ -0,0 +1,297 @@
+import json
+
+import pytest
+
+from app.crud.bots import update_bot_code
+from app.models.bot import Bot
+from app.models.ipd_bot_stats import IpdBotStats
+from app.models.ipd_duel import IpdDuel
+from app.models.ipd_result_cache import IpdResultCache
+from app.models.user import User
+from app.services import ipd_leaderboard
+from app.services.code_hash import code_hash_py
+from app.services.docker_ipd_runner import DockerIpdResult, DockerRunConfig, _parse_output
+from app.services.ipd_leaderboard import (
+    FORFEIT_WIN_SCORE,
+    cache_duel_result,
+    cached_duel_result,
+    duel_from_result,
+    duel_spec,
+    ipd_leaderboard_rows,
+    missing_ipd_pairs,
+    quarantined_bot_ids,
+    record_ipd_duel,
+)
+
+
+def _bot(db, user, name, code_hash, submitted=True):
+    b = Bot(
+        user_id=user.id,
+        env_id="ipd",
+        name=name,
+        code="def act(observation, state):\n    return 'C', state\n",
+        code_hash=code_hash,
+        submitted=submitted,
+    )
+    db.add(b)
+    db.commit()
+    return b
+
+
+def _duel(db, b1, b2, score1=600, score2=600, h1=None, h2=None):
+    d = IpdDuel(
+        bot1_id=b1.id,
+        bot2_id=b2.id,
+        bot1_hash=h1 or b1.code_hash,
+        bot2_hash=h2 or b2.code_hash,
+        seed=1,
+        score1=score1,
+        score2=score2,
+        exec_ms_1=200,
+        exec_ms_2=400,
+    )
+    record_ipd_duel(db, d)
+    db.commit()
+    return d
+
+
+def _user(db, username="alice"):
+    u = User(username=username, password_hash="x")
+    db.add(u)
+    db.commit()
+    return u
+
+
+def test_missing_pairs_ignores_stale_hashes(db):
+    u = _user(db)
+    a = _bot(db, u, "a", "ha")
+    b = _bot(db, u, "b", "hb")
+    c = _bot(db, u, "c", "hc")
+    _duel(db, a, b)
+    _duel(db, a, c, h2="old")  # c's code changed since this duel
+
+    pairs = missing_ipd_pairs(db, [c, b, a])
+    assert [(x.id, y.id) for x, y in pairs] == [(a.id, c.id), (b.id, c.id)]
+
+
+def test_leaderboard_rows_from_stats(db):
+    u = _user(db)
+    a = _bot(db, u, "a", "ha")
+    b = _bot(db, u, "b", "hb")
+    c = _bot(db, u, "c", "hc")
+    _bot(db, u, "draft", "hd", submitted=False)
+    _duel(db, a, b, score1=500, score2=300)
+    _duel(db, a, c, score1=100, score2=700)
+    _duel(db, b, c, score1=400, score2=400, h1="old")  # stale for b only
+
+    rows = ipd_leaderboard_rows(db, limit=10)
+    assert [r["bot_name"] for r in rows] == ["c", "a", "b"]
+    by_name = {r["bot_name"]: r for r in rows}
+    # The stale duel is obsolete for both sides.
+    assert by_name["c"]["avg_score"] == 700.0
+    assert by_name["c"]["duels"] == 1
+    assert by_name["a"]["avg_score"] == 300.0
+    assert by_name["a"]["avg_exec_ms"] == 1.0
+    assert by_name["b"]["duels"] == 1
+    assert by_name["b"]["avg_exec_ms"] == 2.0
+    assert by_name["b"]["creator"] == "alice"
+    assert all(r["opponents"] == 2 for r in rows)
+
+
+def test_stats_follow_duels_and_code_changes(db):
+    u = _user(db)
+    a = _bot(db, u, "a", "ha")
+    b = _bot(db, u, "b", "hb")
+    c = _bot(db, u, "c", "hc")
+    _duel(db, a, b, score1=500, score2=300)
+    _duel(db, a, c, score1=100, score2=700)
+
+    s = db.get(IpdBotStats, (a.id, "ha"))
+    assert (s.score_sum, s.exec_ms_sum, s.duels) == (600, 400, 2)
+
+    update_bot_code(db, user_id=u.id, bot_id=a.id, code="def act(observation, state):\n    return 'D', state\n")
+    assert db.query(IpdBotStats).filter(IpdBotStats.bot_id == a.id).count() == 0
+    # Both of a's duels are obsolete now, for its opponents too, but kept.
+    assert db.get(IpdBotStats, (c.id, "hc")).duels == 0
+    assert [d.obsolete for d in db.query(IpdDuel).order_by(IpdDuel.id)] == [True, True]
+
+    by_name = {r["bot_name"]: r for r in ipd_leaderboard_rows(db)}
+    assert by_name["a"]["duels"] == 0
+    assert by_name["a"]["avg_score"] == 0.0
+    assert by_name["b"]["duels"] == 0
+
+
+def test_reverted_code_revives_obsolete_duels(db):
+    u = _user(db)
+    coop = "def act(observation, state):\n    return 'C', state\n"
+    a = _bot(db, u, "a", code_hash_py(coop))
+    b = _bot(db, u, "b", "hb")
+    _duel(db, a, b, score1=500, score2=300)
+
+    update_bot_code(db, user_id=u.id, bot_id=a.id, code="def act(observation, state):\n    return 'D', state\n")
+    assert db.get(IpdBotStats, (b.id, "hb")).duels == 0
+
+    update_bot_code(db, user_id=u.id, bot_id=a.id, code=coop)
+    assert db.query(IpdDuel).one().obsolete is False
+    by_name = {r["bot_name"]: r for r in ipd_leaderboard_rows(db)}
+    assert (by_name["a"]["duels"], by_name["a"]["avg_score"]) == (1, 500.0)
+    assert (by_name["b"]["duels"], by_name["b"]["avg_score"]) == (1, 300.0)
+
+
+def test_result_cache_serves_reversed_pair(db):
+    u = _user(db)
+    x = _bot(db, u, "x", "hz")
+    y = _bot(db, u, "y", "ha")
+    spec = duel_spec(x, y)
+    assert spec.swapped  # x has the lower id but the higher hash
+
+    cache_duel_result(db, spec, DockerIpdResult(cum_a=500, cum_b=300, exec_ms_a=10, exec_ms_b=20), version="v1")
+    db.commit()
+
+    # Same code, opposite id order: bot1 now holds "ha".
+    p = _bot(db, u, "p", "ha")
+    q = _bot(db, u, "q", "hz")
+    other = duel_spec(p, q)
+    assert not other.swapped and other.seed == spec.seed
+    hit = cached_duel_result(db, other, version="v1")
+    assert (hit.cum_a, hit.cum_b, hit.exec_ms_a, hit.exec_ms_b) == (300, 500, 20.0, 10.0)
+
+    assert cached_duel_result(db, other, version="v2") is None
+    assert cached_duel_result(db, other, version="") is None
+
+    # The same match cached again (e.g. by a concurrent worker) keeps the first row.
+    cache_duel_result(db, other, DockerIpdResult(cum_a=1, cum_b=1), version="v2")
+    cache_duel_result(db, other, DockerIpdResult(cum_a=2, cum_b=2), version="v2")
+    cache_duel_result(db, spec, DockerIpdResult(cum_a=3, cum_b=3), version="v1")
+    db.commit()
+    assert db.query(IpdResultCache).count() == 2
+    assert cached_duel_result(db, other, version="v2").cum_a == 1
+
+
+def test_multi_seed_samples_are_stored_with_duel(db):
+    body = {
+        "format": "compact",
+        "seed": 7,
+        "cum_a": 400,
+        "cum_b": 420,
+        "samples": {"seeds": [7, 8, 9], "cum_a": [400, 460, 430], "cum_b": [420, 400, 400]},
+    }
+    result = _parse_output(json.dumps(body).encode("utf-8"))
+    assert (result.samples, result.cum_a, result.cum_b) == (3, 430, 407)
+    assert result.score_diff_mean == 70 / 3
+    assert round(result.score_diff_sd, 3) == 40.415
+
+    u = _user(db)
+    x = _bot(db, u, "x", "hz")
+    y = _bot(db, u, "y", "ha")
+    spec = duel_spec(x, y, max_seeds=5)
+    # x has the higher hash and played side B.
+    duel = duel_from_result(spec, result.swapped())
+    assert (duel.samples, duel.score1, duel.score2) == (3, 407, 430)
+    assert duel.score_diff_mean == -70 / 3
+
+
+def test_record_ipd_duel_tolerates_duplicate(db):
+    u = _user(db)
+    a = _bot(db, u, "a", "ha")
+    b = _bot(db, u, "b", "hb")
+    _duel(db, a, b, score1=500, score2=300)
+
+    dup = IpdDuel(bot1_id=a.id, bot2_id=b.id, bot1_hash="ha", bot2_hash="hb", seed=1, score1=1, score2=1)
+    assert record_ipd_duel(db, dup) is False
+    db.commit()
+    assert db.query(IpdDuel).count() == 1
+    assert db.get(IpdBotStats, (a.id, "ha")).duels == 1
+
+
+def test_bot_failure_is_a_cached_forfeit_and_quarantines(db):
+    u = _user(db)
+    x = _bot(db, u, "x", "hz")
+    y = _bot(db, u, "y", "ha")
+    z = _bot(db, u, "z", "hc")
+    spec = duel_spec(x, y)
+    assert spec.swapped
+    # y ("ha") is side A and fails to load; results come back oriented bot1 = A.
+    played = DockerIpdResult(cum_a=0, cum_b=0, error_log="boom", failure="load_failed", fault="a")
+    result = played.swapped()
+    assert result.fault == "b"
+
+    duel = duel_from_result(spec, result)
+    assert (duel.score1, duel.score2, duel.fault, duel.failure) == (FORFEIT_WIN_SCORE, 0, "bot2", "load_failed")
+    cache_duel_result(db, spec, result, version="v1")
+    assert record_ipd_duel(db, duel)
+    db.commit()
+
+    hit = cached_duel_result(db, spec, version="v1")
+    assert (hit.failure, hit.fault) == ("load_failed", "b")
+    assert quarantined_bot_ids(db) == {y.id}
+
+    rows = ipd_leaderboard_rows(db)
+    assert rows[-1]["bot_name"] == "y" and rows[-1]["quarantined"] and rows[-1]["forfeits"] == 1
+    assert rows[0]["bot_name"] == "x" and rows[0]["avg_score"] == FORFEIT_WIN_SCORE
+
+    # A timeout only quarantines once it keeps happening.
+    timeout = DockerIpdResult(cum_a=0, cum_b=0, error_log="t", failure="step_timeout", fault="b")
+    cache_duel_result(db, duel_spec(x, z), timeout, version="v1")
+    record_ipd_duel(db, duel_from_result(duel_spec(x, z), timeout))
+    record_ipd_duel(db, duel_from_result(duel_spec(y, z), timeout))
+    db.commit()
+    assert cached_duel_result(db, duel_spec(x, z), version="v1") is None
+    assert quarantined_bot_ids(db) == {y.id}
+    assert db.get(IpdBotStats, (z.id, "hc")).forfeits == 2
+
+    # A new snapshot starts with a clean record.
+    update_bot_code(db, user_id=u.id, bot_id=y.id, code="def act(observation, state):\n    return 'D', state\n")
+    assert quarantined_bot_ids(db) == set()
+
+
+def test_play_duel_reruns_a_timeout_once(db, monkeypatch):
+    u = _user(db)
+    spec = ipd_leaderboard.duel_spec(_bot(db, u, "a", "ha"), _bot(db, u, "b", "hb"))
+    timeout = DockerIpdResult(cum_a=0, cum_b=0, error_log="t", failure="step_timeout", fault="a")
+    calls = []
+
+    def run(**kw):
+        calls.append(kw)
+        return results.pop(0)
+
+    monkeypatch.setattr(ipd_leaderboard, "run_ipd_in_docker", run)
+    cfg = DockerRunConfig(image="runner")
+    results = [timeout, DockerIpdResult(cum_a=300, cum_b=300)]
+    assert ipd_leaderboard.play_duel(cfg=cfg, spec=spec).cum_a == 300
+    results = [timeout, timeout, DockerIpdResult(cum_a=300, cum_b=300)]
+    assert ipd_leaderboard.play_duel(cfg=cfg, spec=spec).failure == "step_timeout"
+    load = DockerIpdResult(cum_a=0, cum_b=0, error_log="x", failure="load_failed", fault="a")
+    results = [load, DockerIpdResult(cum_a=300, cum_b=300)]
+    assert ipd_leaderboard.play_duel(cfg=cfg, spec=spec).failure == "load_failed"
+    assert len(calls) == 5
+
+
+def test_infrastructure_errors_still_fail_the_duel(db):
+    u = _user(db)
+    spec = duel_spec(_bot(db, u, "a", "ha"), _bot(db, u, "b", "hb"))
+    with pytest.raises(RuntimeError, match="ipd_duel_failed"):
+        duel_from_result(spec, DockerIpdResult(cum_a=0, cum_b=0, error_log="docker_timeout"))
+
+
+def test_stats_increments_from_stale_sessions_add_up(db, session_factory):
+    u = _user(db)
+    a = _bot(db, u, "a", "ha")
+    b = _bot(db, u, "b", "hb")
+    c = _bot(db, u, "c", "hc")
+    d = _bot(db, u, "d", "hd")
+    _duel(db, a, b, score1=500)
+    assert db.get(IpdBotStats, (a.id, "ha")).score_sum == 500  # loaded, now stale below
+
+    other = session_factory()
+    try:
+        d2 = IpdDuel(bot1_id=a.id, bot2_id=c.id, bot1_hash="ha", bot2_hash="hc", seed=1, score1=100, score2=100)
+        record_ipd_duel(other, d2)
+        other.commit()
+    finally:
+        other.close()
+    _duel(db, a, d, score1=7)
+
+    db.expire_all()
+    s = db.get(IpdBotStats, (a.id, "ha"))
+    assert (s.score_sum, s.duels) == (607, 3)
@@ -0,0 +1,62 @@
+from app.models.bot import Bot
+from app.models.ipd_duel import IpdDuel
+from app.models.user import User
+from app.services.docker_ipd_runner import DockerIpdResult
+from app.services.ipd_leaderboard import duel_spec, ipd_leaderboard_rows
+from app.services.ipd_rating import INITIAL_RATING, INITIAL_RD, glicko_update, pick_rating_pairs
+from app.services.ipd_tournament import _job_spec, claim_next_job, plan_rating_duels, record_duel_results
+
+
+def _bots(db, n):
+    u = User(username="alice", password_hash="x")
+    db.add(u)
+    db.commit()
+    bots = [
+        Bot(user_id=u.id, env_id="ipd", name=f"b{i}", code="def act(o, s):\n    return 'C', s\n", code_hash=f"h{i}", submitted=True)
+        for i in range(n)
+    ]
+    db.add_all(bots)
+    db.commit()
+    return bots
+
+
+def test_glicko_update_moves_winner_up_and_shrinks_rd():
+    r, rd = glicko_update(INITIAL_RATING, INITIAL_RD, INITIAL_RATING, INITIAL_RD, 1.0)
+    assert r > INITIAL_RATING and rd < INITIAL_RD
+    r, rd = glicko_update(INITIAL_RATING, INITIAL_RD, INITIAL_RATING, INITIAL_RD, 0.5)
+    assert r == INITIAL_RATING and rd < INITIAL_RD
+
+
+def test_pick_rating_pairs_prefers_uncertain_bots_and_close_ratings(db):
+    a, b, c, d = _bots(db, 4)
+    ratings = {a.id: (1500.0, 50.0), b.id: (1800.0, 300.0), c.id: (1750.0, 200.0), d.id: (1200.0, 200.0)}
+
+    pairs = pick_rating_pairs([a, b, c, d], ratings, set(), target_rd=75.0)
+    # b (most uncertain) meets c (closest rating); a is already certain but can still be drawn as d's opponent.
+    assert [(x.id, y.id) for x, y in pairs] == [(b.id, c.id), (a.id, d.id)]
+
+    pairs = pick_rating_pairs([a, b, c, d], ratings, {(b.id, c.id)}, target_rd=75.0)
+    assert [(x.id, y.id) for x, y in pairs] == [(a.id, b.id), (c.id, d.id)]
+
+
+def test_rating_mode_plays_fewer_duels_and_ranks_by_strength(db):
+    bots = _bots(db, 12)
+    strength = {b.id: i for i, b in enumerate(bots)}
+
+    played = 0
+    while plan_rating_duels(db, target_rd=150.0):
+        batch = []
+        while (job := claim_next_job(db)) is not None:
+            spec = _job_spec(db, job)
+            s1, s2 = strength[spec.bot1_id], strength[spec.bot2_id]
+            score1, score2 = (500, 100) if s1 > s2 else (100, 500)
+            batch.append((job.id, spec, DockerIpdResult(cum_a=score1, cum_b=score2), None))
+        record_duel_results(db, batch)
+        played += len(batch)
+
+    assert played == db.query(IpdDuel).count()
+    assert played < 12 * 11 // 2
+    rows = ipd_leaderboard_rows(db, limit=12, mode="rating")
+    assert all(r["rating_rd"] <= 150.0 for r in rows)
+    assert rows[0]["bot_name"] == "b11"
+    assert rows[-1]["bot_name"] == "b0"
@@ -0,0 +1,283 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.crud.bots import update_bot_code
+from app.models.bot import Bot
+from app.models.ipd_duel import IpdDuel
+from app.models.ipd_duel_job import IpdDuelJob
+from app.models.user import User
+from app.services import ipd_tournament
+from app.services.code_hash import code_hash_py
+from app.services.docker_ipd_runner import DockerIpdResult, DockerRunConfig
+from app.services.ipd_leaderboard import duel_from_result, duel_spec, record_ipd_duel
+from app.services.ipd_tournament import (
+    MAX_ATTEMPTS,
+    RETRY_BACKOFF_S,
+    claim_next_job,
+    pending_ipd_duels,
+    plan_bot_duels,
+    plan_ipd_duels,
+    record_duel_results,
+)
+
+
+def _auth(client, username):
+    client.post("/api/auth/register", json={"username": username, "password": "password123"})
+    token = client.post("/api/auth/login", json={"username": username, "password": "password123"}).json()[
+        "access_token"
+    ]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _submitted_bot(client, headers, name, action="C"):
+    code = f"def act(observation, state):\n    return '{action}', state\n"
+    bot = client.post("/api/bots", json={"env_id": "ipd", "name": name, "code": code}, headers=headers).json()
+    r = client.post(f"/api/bots/{bot['id']}/submit", headers=headers)
+    assert r.status_code == 200
+    return bot
+
+
+def test_leaderboard_reports_pending_duels_without_running_them(client):
+    headers = _auth(client, "alice")
+    _submitted_bot(client, headers, "coop", "C")
+    _submitted_bot(client, headers, "defect", "D")
+    _submitted_bot(client, headers, "other", "C")
+
+    r = client.get("/api/env/ipd/leaderboard")
+    assert r.status_code == 200
+    body = r.json()
+    assert body["pending_duels"] == 3
+    assert {row["bot_name"] for row in body["rows"]} == {"coop", "defect", "other"}
+    assert all(row["duels"] == 0 for row in body["rows"])
+
+
+def test_code_change_replans_only_current_snapshot(client):
+    headers = _auth(client, "alice")
+    a = _submitted_bot(client, headers, "a", "C")
+    _submitted_bot(client, headers, "b", "D")
+    assert client.get("/api/env/ipd/leaderboard").json()["pending_duels"] == 1
+
+    r = client.put(
+        f"/api/bots/{a['id']}", json={"code": "def act(observation, state):\n    return 'D', state\n"}, headers=headers
+    )
+    assert r.status_code == 200
+    # The job for a's old code no longer counts; a new one was planned.
+    assert client.get("/api/env/ipd/leaderboard").json()["pending_duels"] == 1
+
+
+def test_record_duel_results_commits_batch(db):
+    u = User(username="alice", password_hash="x")
+    db.add(u)
+    db.commit()
+    bots = [
+        Bot(user_id=u.id, env_id="ipd", name=n, code="def act(o, s):\n    return 'C', s\n", code_hash=n, submitted=True)
+        for n in ("a", "b", "c")
+    ]
+    db.add_all(bots)
+    db.commit()
+    assert plan_ipd_duels(db) == 3
+
+    jobs = list(db.query(IpdDuelJob).order_by(IpdDuelJob.id))
+    by_id = {b.id: b for b in bots}
+    specs = [duel_spec(by_id[j.bot1_id], by_id[j.bot2_id]) for j in jobs]
+    record_duel_results(
+        db,
+        [
+            (jobs[0].id, specs[0], DockerIpdResult(cum_a=600, cum_b=600), None),
+            (jobs[1].id, specs[1], DockerIpdResult(cum_a=0, cum_b=0, error_log="invalid_action"), None),
+            (jobs[2].id, specs[2], None, "ipd_duel_failed: duel_timeout"),
+        ],
+    )
+
+    # Sandbox errors and timeouts are retried later.
+    jobs = list(db.query(IpdDuelJob).order_by(IpdDuelJob.id))
+    assert [j.status for j in jobs] == ["done", "queued", "queued"]
+    assert [j.retry_after is not None for j in jobs] == [False, True, True]
+    assert db.query(IpdDuel).count() == 1
+
+
+def test_failed_duels_are_retried_with_backoff_until_attempts_run_out(db):
+    u = User(username="alice", password_hash="x")
+    db.add(u)
+    db.commit()
+    a, b = (
+        Bot(user_id=u.id, env_id="ipd", name=n, code="def act(o, s):\n    return 'C', s\n", code_hash=n, submitted=True)
+        for n in ("a", "b")
+    )
+    db.add_all([a, b])
+    db.commit()
+    assert plan_ipd_duels(db) == 1
+
+    backoffs = []
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        job = claim_next_job(db)
+        assert (job.status, job.attempts) == ("running", attempt)
+        record_duel_results(db, [(job.id, duel_spec(a, b), None, "ipd_duel_failed: docker_timeout")])
+        if attempt == MAX_ATTEMPTS:
+            break
+        # Still pending, but not claimed before its backoff has passed.
+        assert (job.status, pending_ipd_duels(db)) == ("queued", 1)
+        assert claim_next_job(db) is None
+        backoffs.append((job.retry_after - job.finished_at).total_seconds())
+        job.retry_after = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.commit()
+
+    assert backoffs == [RETRY_BACKOFF_S * 2**i for i in range(MAX_ATTEMPTS - 1)]
+    assert (job.status, job.error_log, pending_ipd_duels(db)) == ("failed", "ipd_duel_failed: docker_timeout", 0)
+    assert claim_next_job(db) is None
+    # Not planned again for the same snapshot.
+    assert plan_ipd_duels(db) == 0
+
+
+def test_code_change_cancels_and_prioritizes_bot_duels(db):
+    coop = "def act(o, s):\n    return 'C', s\n"
+    defect = "def act(o, s):\n    return 'D', s\n"
+    u = User(username="alice", password_hash="x")
+    db.add(u)
+    db.commit()
+    a, b, c = (
+        Bot(user_id=u.id, env_id="ipd", name=n, code=coop, code_hash=code_hash_py(coop), submitted=True)
+        for n in ("a", "b", "c")
+    )
+    db.add_all([a, b, c])
+    db.commit()
+    assert plan_ipd_duels(db) == 3
+
+    update_bot_code(db, user_id=u.id, bot_id=c.id, code=defect)
+    assert plan_bot_duels(db, c) == 2
+    statuses = {(j.bot1_id, j.bot2_id, j.bot2_hash == c.code_hash): (j.status, j.priority) for j in db.query(IpdDuelJob)}
+    assert statuses == {
+        (a.id, b.id, False): ("queued", 0),
+        (a.id, c.id, False): ("cancelled", 0),
+        (b.id, c.id, False): ("cancelled", 0),
+        (a.id, c.id, True): ("queued", 1),
+        (b.id, c.id, True): ("queued", 1),
+    }
+    # c's new duels run before the older a-b job.
+    assert [claim_next_job(db).bot2_id for _ in range(2)] == [c.id, c.id]
+
+    # Reverting brings the cancelled jobs back instead of adding duplicates.
+    update_bot_code(db, user_id=u.id, bot_id=c.id, code=coop)
+    assert plan_bot_duels(db, c) == 2
+    assert db.query(IpdDuelJob).count() == 5
+    assert db.query(IpdDuelJob).filter(IpdDuelJob.status == "queued").count() == 3
+
+
+def test_forfeit_quarantines_bot_and_cancels_its_jobs(db):
+    u = User(username="alice", password_hash="x")
+    db.add(u)
+    db.commit()
+    a, b, c = (
+        Bot(user_id=u.id, env_id="ipd", name=n, code="def act(o, s):\n    return 'C', s\n", code_hash=n, submitted=True)
+        for n in ("a", "b", "c")
+    )
+    db.add_all([a, b, c])
+    db.commit()
+    assert plan_ipd_duels(db) == 3
+
+    job = db.query(IpdDuelJob).filter(IpdDuelJob.bot1_id == a.id, IpdDuelJob.bot2_id == b.id).one()
+    failed = DockerIpdResult(cum_a=0, cum_b=0, error_log="Traceback ...", failure="load_failed", fault="b")
+    record_duel_results(db, [(job.id, duel_spec(a, b), failed, None)])
+
+    assert (job.status, job.error_log) == ("done", "Traceback ...")
+    duel = db.query(IpdDuel).one()
+    assert (duel.score1, duel.score2, duel.fault) == (600, 0, "bot2")
+    statuses = {(j.bot1_id, j.bot2_id): j.status for j in db.query(IpdDuelJob)}
+    assert statuses == {(a.id, b.id): "done", (a.id, c.id): "queued", (b.id, c.id): "cancelled"}
+    # The quarantined bot is not planned again until its code changes.
+    assert plan_ipd_duels(db) == 0
+
+
+def test_waiting_for_a_sandbox_slot_does_not_time_out_the_duel(session_factory, monkeypatch):
+    with session_factory() as db:
+        u = User(username="alice", password_hash="x")
+        db.add(u)
+        db.commit()
+        code = "def act(o, s):\n    return 'C', s\n"
+        db.add_all(Bot(user_id=u.id, env_id="ipd", name=n, code=code, code_hash=n, submitted=True) for n in "ab")
+        db.commit()
+
+    def fake_play(*, cfg, spec, on_start):
+        time.sleep(1.3)  # queued behind other sandboxes, past one wait() round of run_pending
+        on_start()
+        return DockerIpdResult(cum_a=600, cum_b=600)
+
+    monkeypatch.setattr(ipd_tournament, "play_duel", fake_play)
+    monkeypatch.setattr(ipd_tournament, "harness_version", lambda cfg: "")
+    t = ipd_tournament.IpdTournament(session_factory=session_factory, cfg=DockerRunConfig(image="runner"))
+    t.duel_timeout_s = 0.5
+    assert t.run_pending() == 1
+    with session_factory() as db:
+        assert [j.status for j in db.query(IpdDuelJob)] == ["done"]
+
+
+def test_requeued_job_of_a_recorded_duel_is_not_played_again(session_factory, monkeypatch):
+    with session_factory() as db:
+        u = User(username="alice", password_hash="x")
+        db.add(u)
+        db.commit()
+        code = "def act(o, s):\n    return 'C', s\n"
+        db.add_all(Bot(user_id=u.id, env_id="ipd", name=n, code=code, code_hash=n, submitted=True) for n in "ab")
+        db.commit()
+        assert ipd_tournament.plan_ipd_duels(db) == 1
+        # The first run of the job recorded its duel, but the job was requeued as stuck meanwhile.
+        a, b = db.query(Bot).order_by(Bot.id).all()
+        assert record_ipd_duel(db, duel_from_result(duel_spec(a, b), DockerIpdResult(cum_a=600, cum_b=600)))
+        db.commit()
+
+    played = []
+
+    def fake_play(*, cfg, spec, on_start):
+        played.append(spec)
+        return DockerIpdResult(cum_a=600, cum_b=600)
+
+    monkeypatch.setattr(ipd_tournament, "play_duel", fake_play)
+    monkeypatch.setattr(ipd_tournament, "harness_version", lambda cfg: "")
+    t = ipd_tournament.IpdTournament(session_factory=session_factory, cfg=DockerRunConfig(image="runner"))
+    assert t.run_pending() == 0
+    assert played == []
+    with session_factory() as db:
+        assert [j.status for j in db.query(IpdDuelJob)] == ["done"]
+        assert db.query(IpdDuel).count() == 1
+
+
+def test_timed_out_duel_keeps_its_worker_until_it_returns(session_factory, monkeypatch):
+    with session_factory() as db:
+        u = User(username="alice", password_hash="x")
+        db.add(u)
+        db.commit()
+        code = "def act(o, s):\n    return 'C', s\n"
+        db.add_all(Bot(user_id=u.id, env_id="ipd", name=n, code=code, code_hash=n, submitted=True) for n in "abc")
+        db.commit()
+
+    release = threading.Event()
+    played = []
+
+    def fake_play(*, cfg, spec, on_start):
+        on_start()
+        played.append(spec)
+        if len(played) == 1:
+            release.wait(10)
+        return DockerIpdResult(cum_a=600, cum_b=600)
+
+    monkeypatch.setattr(ipd_tournament, "play_duel", fake_play)
+    monkeypatch.setattr(ipd_tournament, "harness_version", lambda cfg: "")
+    monkeypatch.setattr(ipd_tournament, "sandbox_capacity", lambda cfg: 8)
+    t = ipd_tournament.IpdTournament(session_factory=session_factory, cfg=DockerRunConfig(image="runner"), workers=2)
+    t.duel_timeout_s = 0.3
+    try:
+        # The hung duel times out and is queued for a retry; the other two run on the remaining worker.
+        assert t.run_pending() == 3
+        assert len(played) == 3 and len(t._abandoned) == 1
+        with session_factory() as db:
+            assert sorted(j.status for j in db.query(IpdDuelJob)) == ["done", "done", "queued"]
+            db.query(IpdDuelJob).update({"retry_after": None})
+            db.commit()
+        # Its retry waits for a worker: the hung thread still holds one, and no third is started.
+        pool = t._pool
+        assert t.run_pending() == 1
+        assert t._pool is pool and len(pool._threads) == 2
+    finally:
+        release.set()
+        t.stop()
@@ -0,0 +1,231 @@
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.env.ipd import replay_steps
+from app.models.match import Match
+from app.models.match_replay import MatchReplay
+from app.schemas.match import MatchOut, MatchStepOut
+from app.services import match_json, match_queue
+from app.services.docker_ipd_runner import DockerIpdResult
+from app.services.match_json import _iso
+from app.services.match_replay import replay_steps_of
+
+
+def _headers(client, username="alice"):
+    client.post("/api/auth/register", json={"username": username, "password": "password123"})
+    token = client.post("/api/auth/login", json={"username": username, "password": "password123"}).json()[
+        "access_token"
+    ]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _bot(client, headers, name="mybot"):
+    code = "def act(observation, state):\n    return 'D', state\n"
+    return client.post("/api/bots", json={"env_id": "ipd", "name": name, "code": code}, headers=headers).json()
+
+
+def test_run_test_is_queued_and_played_by_worker(client, monkeypatch):
+    def fake_run(*, cfg, bot_a_code, bot_b_code, seed, **kwargs):
+        return DockerIpdResult(cum_a=1000, cum_b=0, acts_a="D" * 200, acts_b="C" * 200, seed=seed)
+
+    monkeypatch.setattr(match_queue, "run_ipd_in_docker", fake_run)
+    headers = _headers(client)
+    bot = _bot(client, headers)
+
+    r1 = client.post(f"/api/bots/{bot['id']}/run-test", headers=headers)
+    r2 = client.post(f"/api/bots/{bot['id']}/run-test", headers=headers)
+    assert r1.status_code == 202
+    assert (r1.json()["status"], r1.json()["queue_position"]) == ("queued", 1)
+    assert r2.json()["queue_position"] == 2
+
+    m = client.get(f"/api/matches/{r2.json()['match_id']}", headers=headers).json()
+    assert (m["status"], m["queue_position"], m["steps"]) == ("queued", 2, [])
+    q = client.get("/api/matches/queue", headers=headers).json()
+    assert (q["queued"], q["running"]) == (2, 0)
+
+    queue = client.app.state.match_queue
+    assert queue.run_next() and queue.run_next()
+    assert not queue.run_next()
+
+    m = client.get(f"/api/matches/{r1.json()['match_id']}", headers=headers).json()
+    assert (m["status"], m["queue_position"], len(m["steps"])) == ("completed", None, 200)
+    assert (m["steps"][-1]["cum_a"], m["steps"][-1]["cum_b"]) == (1000, 0)
+    assert client.get("/api/matches/queue", headers=headers).json()["queued"] == 0
+
+
+def test_queued_match_fails_if_code_changed(client, monkeypatch):
+    monkeypatch.setattr(match_queue, "run_ipd_in_docker", lambda **kwargs: 1 / 0)
+    headers = _headers(client)
+    bot = _bot(client, headers)
+
+    match_id = client.post(f"/api/bots/{bot['id']}/run-test", headers=headers).json()["match_id"]
+    client.put(f"/api/bots/{bot['id']}", json={"code": "def act(observation, state):\n    return 'C', state\n"}, headers=headers)
+
+    assert client.app.state.match_queue.run_next()
+    m = client.get(f"/api/matches/{match_id}", headers=headers).json()
+    assert (m["status"], m["error_log"]) == ("failed", "bot_code_changed")
+
+
+def _fake_streaming_run(pause_after=None, started=None, go=None):
+    def fake_run(*, cfg, bot_a_code, bot_b_code, seed, on_round=None, **kwargs):
+        acts_a, acts_b = "D" * 200, "C" * 200
+        for s in replay_steps(acts_a, acts_b):
+            on_round({"event": "round", **{k: v for k, v in s.items() if not k.startswith("obs")}})
+            if s["round"] == pause_after:
+                started.set()
+                go.wait(5)
+        return DockerIpdResult(cum_a=1000, cum_b=0, acts_a=acts_a, acts_b=acts_b, seed=seed)
+
+    return fake_run
+
+
+def _sse_events(response):
+    events = []
+    for line in response.iter_lines():
+        if line.startswith("event: "):
+            events.append([line[len("event: ") :]])
+        elif line.startswith("data: "):
+            events[-1].append(json.loads(line[len("data: ") :]))
+    return events
+
+
+def test_stream_relays_live_rounds(client, monkeypatch):
+    started, go = threading.Event(), threading.Event()
+    monkeypatch.setattr(match_queue, "run_ipd_in_docker", _fake_streaming_run(30, started, go))
+    headers = _headers(client)
+    bot = _bot(client, headers)
+    match_id = client.post(f"/api/bots/{bot['id']}/run-test", headers=headers).json()["match_id"]
+
+    worker = threading.Thread(target=client.app.state.match_queue.run_next)
+    worker.start()
+    assert started.wait(5)
+    # 30 rounds played: the first batch is already stored while the match runs.
+    m = client.get(f"/api/matches/{match_id}", headers=headers).json()
+    assert (m["status"], len(m["steps"])) == ("running", match_queue.STEP_BATCH_ROUNDS)
+
+    with client.stream("GET", f"/api/matches/{match_id}/stream", headers=headers) as r:
+        assert r.headers["content-type"].startswith("text/event-stream")
+        go.set()
+        events = _sse_events(r)
+    worker.join()
+
+    rounds = [data["round"] for kind, data in events if kind == "round"]
+    assert rounds == list(range(1, 201))
+    assert events[-1] == ["end", {"event": "end", "status": "completed"}]
+    assert events[-2][1]["cum_a"] == 1000
+
+
+def test_stream_of_finished_match_reads_stored_rounds(client, monkeypatch):
+    monkeypatch.setattr(match_queue, "run_ipd_in_docker", _fake_streaming_run())
+    headers = _headers(client)
+    bot = _bot(client, headers)
+    match_id = client.post(f"/api/bots/{bot['id']}/run-test", headers=headers).json()["match_id"]
+    assert client.app.state.match_queue.run_next()
+
+    with client.stream("GET", f"/api/matches/{match_id}/stream", headers={**headers, "Last-Event-ID": "190"}) as r:
+        events = _sse_events(r)
+    assert [data["round"] for kind, data in events if kind == "round"] == list(range(191, 201))
+    assert events[-1][0] == "end"
+
+
+def test_steps_pages_ndjson_and_summary(client, monkeypatch):
+    def fake_run(*, cfg, bot_a_code, bot_b_code, seed, **kwargs):
+        return DockerIpdResult(cum_a=0, cum_b=0, acts_a="CCCD" * 50, acts_b="C" * 200, seed=seed)
+
+    monkeypatch.setattr(match_queue, "run_ipd_in_docker", fake_run)
+    headers = _headers(client)
+    bot = _bot(client, headers)
+    match_id = client.post(f"/api/bots/{bot['id']}/run-test", headers=headers).json()["match_id"]
+    assert client.app.state.match_queue.run_next()
+    full = client.get(f"/api/matches/{match_id}", headers=headers).json()["steps"]
+
+    pages, start = [], 1
+    while start is not None:
+        page = client.get(f"/api/matches/{match_id}/steps?from={start}&limit=64", headers=headers).json()
+        pages.append(page["steps"])
+        start = page["next_from"]
+    assert [len(p) for p in pages] == [64, 64, 64, 8]
+    assert [s for p in pages for s in p] == full
+
+    page = client.get(f"/api/matches/{match_id}/steps?from=101&to=110", headers=headers).json()
+    assert (page["rounds"], page["next_from"], page["steps"]) == (200, None, full[100:110])
+
+    r = client.get(f"/api/matches/{match_id}/steps?from=191&format=ndjson", headers=headers)
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in r.text.splitlines()] == full[190:]
+
+    summary = client.get(f"/api/matches/{match_id}/summary", headers=headers).json()
+    assert (summary["rounds"], summary["score_a"], summary["score_b"]) == (200, full[-1]["cum_a"], full[-1]["cum_b"])
+    assert (summary["coop_rate_a"], summary["coop_rate_b"]) == (0.75, 1.0)
+
+
+def test_match_body_is_byte_compatible_with_match_out(client, db, monkeypatch):
+    def failing_run(*, cfg, bot_a_code, bot_b_code, seed, on_round=None, **kwargs):
+        for rnd in range(1, 31):
+            on_round({"event": "round", "round": rnd, "act_a": "C", "act_b": "D"})
+        return DockerIpdResult(cum_a=0, cum_b=0, acts_a="", acts_b="", seed=seed, error_log='boom "é"\n\tß\x01')
+
+    headers = _headers(client)
+    bot = _bot(client, headers)
+    ids = [client.post(f"/api/bots/{bot['id']}/run-test", headers=headers).json()["match_id"] for _ in range(3)]
+    monkeypatch.setattr(match_queue, "run_ipd_in_docker", failing_run)
+    assert client.app.state.match_queue.run_next()
+    monkeypatch.setattr(
+        match_queue,
+        "run_ipd_in_docker",
+        lambda **kwargs: DockerIpdResult(cum_a=0, cum_b=0, acts_a="CCD" * 66 + "DD", acts_b="D" * 200, seed=1),
+    )
+    assert client.app.state.match_queue.run_next()
+
+    for encoder in (match_json.orjson, None):
+        monkeypatch.setattr(match_json, "orjson", encoder)
+        for match_id in ids:  # failed with a partial replay, completed, still queued
+            m = db.get(Match, match_id)
+            expected = MatchOut(
+                **{k: getattr(m, k) for k in MatchOut.model_fields if k not in ("steps", "queue_position")},
+                steps=[MatchStepOut(**s) for s in replay_steps_of(db.get(MatchReplay, match_id))],
+                queue_position=match_queue.queue_position(db, m),
+            )
+            r = client.get(f"/api/matches/{match_id}", headers={**headers, "Accept-Encoding": "identity"})
+            assert "content-encoding" not in r.headers
+            assert r.content == JSONResponse(expected.model_dump(mode="json")).body
+
+    failed = client.get(f"/api/matches/{ids[0]}", headers=headers).json()
+    assert (failed["status"], len(failed["steps"])) == ("failed", 30)
+
+    r = client.get(f"/api/matches/{ids[1]}", headers={**headers, "Accept-Encoding": "br;q=0, gzip"})
+    assert r.headers["content-encoding"] == "gzip"
+    assert len(r.json()["steps"]) == 200
+
+
+def test_match_json_datetimes_match_pydantic():
+    adapter = TypeAdapter(datetime)
+    for ts in (
+        datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        datetime(2026, 1, 2, 3, 4, 5, 120, tzinfo=timezone(timedelta(hours=2))),
+        datetime(2026, 1, 2, 3, 4, 5, 999999),
+    ):
+        assert _iso(ts) == adapter.dump_python(ts, mode="json")
+
+
+def test_only_matches_without_heartbeat_are_requeued(client, session_factory):
+    headers = _headers(client)
+    bot = _bot(client, headers)
+    ids = [client.post(f"/api/bots/{bot['id']}/run-test", headers=headers).json()["match_id"] for _ in range(2)]
+    with session_factory() as db:
+        alive, dead = match_queue.claim_next_match(db), match_queue.claim_next_match(db)
+        assert [alive.id, dead.id] == ids
+        # Both started long ago; only `alive` is still being played by its process.
+        long_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+        for m in (alive, dead):
+            m.started_at = m.heartbeat_at = long_ago
+        db.commit()
+        match_queue.heartbeat_matches(db, [alive.id])
+
+        assert match_queue.requeue_stuck_matches(db, older_than=timedelta(seconds=30)) == 1
+        db.expire_all()
+        assert (db.get(Match, alive.id).status, db.get(Match, dead.id).status) == ("running", "queued")
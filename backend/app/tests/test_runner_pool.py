@@ -0,0 +1,130 @@
+import base64
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from app.core.config import settings
+from app.services.docker_ipd_runner import DockerRunConfig
+from app.services.runner_pool import RunnerPool
+
+RUNNER_DIR = Path(__file__).resolve().parents[3] / "runner"
+
+COOPERATE = "def act(observation, state):\n    return 'C', state\n"
+BROKEN = "def act(observation, state):\n    return 'X', state\n"
+
+
+@pytest.fixture()
+def docker_log(tmp_path, monkeypatch):
+    """A `docker` on PATH that runs the container's command locally and logs its arguments."""
+
+    log = tmp_path / "docker.log"
+    script = tmp_path / "docker"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import os, sys\n"
+        f"with open({str(log)!r}, 'a') as f:\n"
+        "    f.write(' '.join(sys.argv[1:]) + '\\n')\n"
+        "if sys.argv[1] != 'run':\n"
+        "    sys.exit(0)\n"
+        "cmd = sys.argv[sys.argv.index('python') + 1 :]\n"
+        "os.execv(sys.executable, [sys.executable, *cmd])\n"
+    )
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(settings, "runner_root", str(RUNNER_DIR))
+    return log
+
+
+def _request(code_b: str = COOPERATE) -> bytes:
+    def b64(s: str) -> str:
+        return base64.b64encode(s.encode("utf-8")).decode("ascii")
+
+    return json.dumps({"bot_a_b64": b64(COOPERATE), "bot_b_b64": b64(code_b), "seed": 1, "rounds": 3}).encode()
+
+
+def _wait_for(cond, timeout_s: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def _containers(log: Path, command: str) -> list[str]:
+    # Container names from the logged `docker run --name X` / `docker rm -f X` calls.
+    names = []
+    for line in log.read_text().splitlines():
+        args = line.split()
+        if args[0] == command == "run":
+            names.append(args[args.index("--name") + 1])
+        elif args[0] == command == "rm":
+            names.append(args[-1])
+    return names
+
+
+@pytest.fixture()
+def make_pool(docker_log):
+    pools = []
+
+    def make(*, size: int = 1, health_interval_s: float = 60.0) -> RunnerPool:
+        p = RunnerPool(
+            DockerRunConfig(image="runner"),
+            docker_args=[],
+            size=size,
+            max_matches=2,
+            health_interval_s=health_interval_s,
+        )
+        pools.append(p)
+        _wait_for(lambda: p._idle.qsize() == size)
+        return p
+
+    yield make
+    for p in pools:
+        p.close()
+
+
+def _idle_name(pool: RunnerPool) -> str | None:
+    workers = list(pool._idle.queue)
+    return workers[0].name if len(workers) == 1 else None
+
+
+def _replaced(pool: RunnerPool, docker_log: Path, name: str) -> bool:
+    # `name` was removed and a different, healthy container is waiting instead.
+    return name in _containers(docker_log, "rm") and _idle_name(pool) not in (None, name)
+
+
+def test_pool_recycles_container_after_max_matches_and_refills(make_pool, docker_log):
+    pool = make_pool()
+    first = _idle_name(pool)
+    for i in range(2):
+        body = json.loads(pool.run(_request(), timeout_s=10))
+        assert (body["rc"], body["cum_a"], body["cum_b"]) == (0, 9, 9)
+        if i == 0:
+            assert _idle_name(pool) == first  # kept warm for the next match
+    # The second match used up max_matches: the container is removed and replaced.
+    _wait_for(lambda: _replaced(pool, docker_log, first))
+
+
+def test_pool_recycles_container_after_a_bot_failure(make_pool, docker_log):
+    pool = make_pool()
+    first = _idle_name(pool)
+    body = json.loads(pool.run(_request(BROKEN), timeout_s=10))
+    assert body["rc"] != 0 and body["fault"] == "b"
+    _wait_for(lambda: _replaced(pool, docker_log, first))
+
+
+def test_pool_replaces_dead_container_at_health_check(make_pool, docker_log):
+    pool = make_pool(health_interval_s=0.2)
+    worker = pool._idle.queue[0]
+    worker._proc.kill()
+    worker._proc.wait()
+
+    _wait_for(lambda: _replaced(pool, docker_log, worker.name))
+    assert json.loads(pool.run(_request(), timeout_s=10))["rc"] == 0
+
+
+def test_pool_without_idle_container_defers_to_cold_run(make_pool):
+    assert make_pool(size=0).run(_request(), timeout_s=10) is None
@@ -60,7 +60,50 @@ async function request<T>(
   return body as T
 }
 
+export type MatchRound = {
+  round: number
+  act_a: string
+  act_b: string
+  reward_a: number
+  reward_b: number
+  cum_a: number
+  cum_b: number
+}
+
+// Follow GET /matches/{id}/stream (Server-Sent Events). EventSource cannot
+// send our bearer token, so the stream is read with fetch instead.
+// Resolves with the final match status.
+async function streamMatch(matchId: number, onRound: (r: MatchRound) => void): Promise<string> {
+  const headers = new Headers()
+  const t = getToken()
+  if (t) headers.set('Authorization', `Bearer ${t}`)
+  const res = await fetch(`${API_BASE}/api/matches/${matchId}/stream`, { headers })
+  if (!res.ok || !res.body) throw new ApiError(res.status, `HTTP ${res.status}`, null)
+
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buf = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buf += decoder.decode(value, { stream: true })
+    let sep: number
+    while ((sep = buf.indexOf('\n\n')) >= 0) {
+      const message = buf.slice(0, sep)
+      buf = buf.slice(sep + 2)
+      const event = /^event: (.*)$/m.exec(message)?.[1]
+      const data = /^data: (.*)$/m.exec(message)?.[1]
+      if (!event || !data) continue
+      const record = JSON.parse(data)
+      if (event === 'round') onRound(record)
+      if (event === 'end') return record.status
+    }
+  }
+  return 'unknown'
+}
+
 export const api = {
+  streamMatch,
   async health() {
     return request<{ status: string }>('/api/health')
   },
@@ -115,7 +158,7 @@ export const api = {
     })
   },
   async runTest(botId: string) {
-    return request<{ match_id: number; cum_a: number; cum_b: number }>(
+    return request<{ match_id: number; status: string; queue_position: number | null }>(
       `/api/bots/${botId}/run-test`,
       { method: 'POST', auth: true }
     )
@@ -127,11 +170,23 @@ export const api = {
       opponent_name: string
       seed: number
       status: string
-      cum_a?: number
-      cum_b?: number
+      error_log: string | null
+      queue_position: number | null
       steps: Array<any>
     }>(`/api/matches/${matchId}`, { auth: true })
   },
+  async getMatchSummary(matchId: number) {
+    return request<{
+      id: number
+      status: string
+      error_log: string | null
+      rounds: number
+      score_a: number
+      score_b: number
+      coop_rate_a: number | null
+      coop_rate_b: number | null
+    }>(`/api/matches/${matchId}/summary`, { auth: true })
+  },
   async deleteBot(botId: number) {
     return request<{ ok: true }>(`/api/bots/${botId}`, {
       method: 'DELETE',
@@ -140,9 +195,23 @@ export const api = {
   },
   // bot versions removed in MVP refactor
   async ipdLeaderboard() {
-    return request<
-      Array<{ bot_id: number; bot_name: string; best_score: number; matches: number }>
-    >('/api/env/ipd/leaderboard')
+    return request<{
+      mode: 'round_robin' | 'rating'
+      rows: Array<{
+        bot_id: number
+        bot_name: string
+        creator: string
+        avg_score: number
+        avg_exec_ms: number
+        opponents: number
+        duels: number
+        rating: number
+        rating_rd: number
+        forfeits: number
+        quarantined: boolean
+      }>
+      pending_duels: number
+    }>('/api/env/ipd/leaderboard')
   },
   async submitBot(botId: string) {
     return request<{ id: number; env_id: string; submitted: boolean }>(
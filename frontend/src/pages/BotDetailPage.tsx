@@ -72,12 +72,24 @@ export default function BotDetailPage() {
             disabled={dirty}
             title={dirty ? 'Save your changes before running a test.' : ''}
             onClick={async () => {
-              setRunStatus('Running sandbox match vs always_cooperate...')
+              setRunStatus('Queueing sandbox match vs always_cooperate...')
               setRunResult(null)
               try {
-                const r = await api.runTest(botId)
-                setRunResult(r)
+                const { match_id, queue_position } = await api.runTest(botId)
+                setRunStatus(`Match #${match_id} queued (position ${queue_position ?? '?'})...`)
+                // The match runs in the background; follow its rounds live.
+                let last = { cum_a: 0, cum_b: 0 }
+                const status = await api.streamMatch(match_id, (r) => {
+                  last = r
+                  setRunStatus(`Match #${match_id}, round ${r.round}: you ${r.cum_a} vs baseline ${r.cum_b}`)
+                })
                 setRunStatus(null)
+                if (status === 'completed') {
+                  setRunResult({ match_id, cum_a: last.cum_a, cum_b: last.cum_b })
+                } else {
+                  const m = await api.getMatchSummary(match_id)
+                  setError(`Match #${match_id} failed: ${m.error_log || 'unknown error'}`)
+                }
               } catch (err: any) {
                 setRunStatus(null)
                 setError(String(err?.detail || err?.message || err))
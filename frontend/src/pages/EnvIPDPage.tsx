@@ -4,15 +4,31 @@ import { api } from '../lib/api'
 
 export default function EnvIPDPage() {
   const [rows, setRows] = useState<
-    Array<{ bot_id: number; bot_name: string; creator: string; avg_score: number; avg_exec_ms: number; opponents: number; duels: number }>
+    Array<{
+      bot_id: number
+      bot_name: string
+      creator: string
+      avg_score: number
+      avg_exec_ms: number
+      opponents: number
+      duels: number
+      rating: number
+      rating_rd: number
+      forfeits: number
+      quarantined: boolean
+    }>
   >([])
+  const [mode, setMode] = useState<'round_robin' | 'rating'>('round_robin')
+  const [pending, setPending] = useState(0)
   const [error, setError] = useState<string | null>(null)
 
   async function load() {
     setError(null)
     try {
       const r = await api.ipdLeaderboard()
-      setRows(r)
+      setMode(r.mode)
+      setRows(r.rows)
+      setPending(r.pending_duels)
     } catch (err: any) {
       setError(String(err?.detail || err?.message || err))
     }
@@ -60,8 +76,15 @@ export default function EnvIPDPage() {
       </section>
 
       <section style={{ display: 'grid', gap: 8 }}>
-        <h3 style={{ margin: 0 }}>Leaderboard (avg vs all submitted bots)</h3>
+        <h3 style={{ margin: 0 }}>
+          {mode === 'rating' ? 'Leaderboard (rating from sampled duels)' : 'Leaderboard (avg vs all submitted bots)'}
+        </h3>
         {error ? <div style={{ color: 'crimson' }}>{error}</div> : null}
+        {pending > 0 ? (
+          <div style={{ opacity: 0.7 }}>
+            {pending} duel{pending === 1 ? '' : 's'} pending — standings will update as they finish.
+          </div>
+        ) : null}
         {rows.length === 0 ? (
           <div style={{ opacity: 0.7 }}>No completed matches yet.</div>
         ) : (
@@ -72,9 +95,21 @@ export default function EnvIPDPage() {
                   #{idx + 1}
                 </span>{' '}
                 <Link to={`/bots/${r.bot_id}`}>{r.bot_name}</Link> by{' '}
-                <span style={{ opacity: 0.8 }}>{r.creator || 'unknown'}</span> — avg score:{' '}
+                <span style={{ opacity: 0.8 }}>{r.creator || 'unknown'}</span> —{' '}
+                {mode === 'rating' ? (
+                  <>
+                    rating: <b>{r.rating.toFixed(0)}</b> ± {(2 * r.rating_rd).toFixed(0)} ·{' '}
+                  </>
+                ) : null}
+                avg score:{' '}
                 <b>{r.avg_score.toFixed(2)}</b> · avg exec:{' '}
                 <b>{r.avg_exec_ms.toFixed(2)}ms</b> ({r.opponents} opponents, {r.duels} duels)
+                {r.quarantined ? (
+                  <span style={{ color: 'crimson' }}>
+                    {' '}
+                    · quarantined after {r.forfeits} forfeit{r.forfeits === 1 ? '' : 's'} (fix the code to re-enter)
+                  </span>
+                ) : null}
               </li>
             ))}
           </ul>
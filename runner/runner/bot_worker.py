@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import argparse
-import importlib.util
+import ctypes
 import json
 import random
 import sys
@@ -9,26 +9,53 @@ import traceback
 from types import ModuleType
 from typing import Any, Callable
 
+# Highest protocol this worker understands (see runner.harness.PROTOCOL_VERSION).
+PROTOCOL_VERSION = 2
+PR_SET_DUMPABLE = 4
+
+
+def set_undumpable() -> None:
+    """Mark this process (and children it forks) non-dumpable.
+
+    Everything in the sandbox runs as the same uid, so without this a bot
+    could ptrace, or read /proc/<pid>/mem and /proc/<pid>/fd of, the
+    harness, the zygote or its opponent. Non-dumpable processes are only
+    accessible with CAP_SYS_PTRACE, which the sandbox drops.
+    """
+
+    try:
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_DUMPABLE, 0, 0, 0, 0)
+    except (OSError, AttributeError):
+        pass
+
 
 def _load_module(path: str) -> ModuleType:
-    spec = importlib.util.spec_from_file_location("bot", path)
-    if spec is None or spec.loader is None:
-        raise RuntimeError("invalid_bot_module")
-    mod = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(mod)
+    # Compiled from source, bypassing __pycache__: cached bytecode is matched
+    # by mtime and size only, so in a reused sandbox a bot of the same size
+    # written in the same second (or a .pyc planted by the opponent) would run
+    # instead of this code.
+    with open(path, "rb") as f:
+        source = f.read()
+    mod = ModuleType("bot")
+    mod.__file__ = path
+    exec(compile(source, path, "exec"), mod.__dict__)
     return mod
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--code-path", required=True)
-    ap.add_argument("--seed", type=int, required=True)
-    args = ap.parse_args()
+def serve(*, code_path: str, seed: int) -> int:
+    """Load the bot at `code_path` and answer act() requests on stdin/stdout.
+
+    Shared by the standalone entrypoint below and by runner.zygote, which
+    calls it in a freshly forked child (so the seed is applied post-fork).
+    """
 
-    random.seed(int(args.seed))
+    set_undumpable()
+    random.seed(int(seed))
+    seeded = random.getstate()
+    rng_used = False
 
     try:
-        mod = _load_module(args.code_path)
+        mod = _load_module(code_path)
         act: Callable[[dict[str, Any], dict[str, Any]], tuple[str, dict[str, Any]]] = getattr(mod, "act")
         if not callable(act):
             raise RuntimeError("act_not_callable")
@@ -38,17 +65,40 @@ def main() -> int:
         sys.stdout.flush()
         return 2
 
+    # Tell the harness we are loaded (so it does not have to wait out its load
+    # timeout) and which protocol versions we can speak.
+    sys.stdout.write(json.dumps({"ready": True, "protocol": PROTOCOL_VERSION}) + "\n")
+    sys.stdout.flush()
+
     # Protocol: newline-delimited JSON on stdin, newline-delimited JSON responses on stdout.
+    # v1 messages carry the full observation; v2 messages carry only the
+    # previous round's [my_action, opp_action] and we keep the history here.
+    history: list[list[str]] = []
     for line in sys.stdin:
         line = line.strip()
         if not line:
             continue
         try:
             msg = json.loads(line)
-            obs = msg["obs"]
+            if "obs" in msg:
+                obs = msg["obs"]
+            else:
+                if msg.get("last") is not None:
+                    history.append(list(msg["last"]))
+                # Fresh copies each round, exactly like a freshly decoded v1 observation.
+                obs = {
+                    "round": msg["round"],
+                    "max_rounds": msg["max_rounds"],
+                    "history": [pair[:] for pair in history],
+                }
             state = msg["state"]
             action, new_state = act(obs, state)
-            sys.stdout.write(json.dumps({"act": action, "state": new_state}) + "\n")
+            reply = {"act": action, "state": new_state}
+            # Lets the harness skip extra seeds for bots that never drew a random number.
+            rng_used = rng_used or random.getstate() != seeded
+            if rng_used:
+                reply["rng"] = True
+            sys.stdout.write(json.dumps(reply) + "\n")
             sys.stdout.flush()
         except Exception:
             err = traceback.format_exc(limit=20)
@@ -59,6 +109,14 @@ def main() -> int:
     return 0
 
 
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--code-path", required=True)
+    ap.add_argument("--seed", type=int, required=True)
+    args = ap.parse_args()
+    return serve(code_path=args.code_path, seed=args.seed)
+
+
 if __name__ == "__main__":
     raise SystemExit(main())
 
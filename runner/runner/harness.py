@@ -1,13 +1,22 @@
 from __future__ import annotations
 
 import base64
+import hashlib
 import json
+import math
 import os
 import select
+import shutil
+import signal
+import socket
+import statistics
 import subprocess
 import sys
 import time
-from typing import Any, Literal
+from dataclasses import dataclass
+from typing import IO, Any, Callable, Literal
+
+from runner.bot_worker import set_undumpable
 
 Action = Literal["C", "D"]
 
@@ -15,6 +24,20 @@ ROUNDS = 200
 MAX_STEP_MS = 50  # per bot call wall-clock
 MAX_MATCH_MS = 15000
 MAX_LOG_BYTES = 64 * 1024
+# Highest harness<->bot_worker protocol we speak. v1 sends the full observation
+# every round; v2 sends only the previous round's [my, opp] pair and the worker
+# rebuilds the observation itself. Negotiated via the worker's ready line.
+PROTOCOL_VERSION = 2
+LOAD_TIMEOUT_MS = 1000  # per bot: module import until the worker reports ready
+# Adaptive multi-seed evaluation: at most this many seeds per invocation, and
+# two-sided 95% Student-t critical values by degrees of freedom (n - 1).
+MAX_SEEDS = 8
+_T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365}
+ZYGOTE_TIMEOUT_S = 5.0
+# Writable scratch space of the sandbox (the rest of its filesystem is read-only).
+SCRATCH_DIRS = ("/tmp", "/dev/shm")
+# Directory holding the `runner` package (/app in the sandbox image).
+RUNNER_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 PAYOFF: dict[tuple[Action, Action], tuple[int, int]] = {
     ("C", "C"): (3, 3),
@@ -38,56 +61,369 @@ def _ensure_jsonable(x: Any) -> None:
     json.dumps(x)
 
 
-def _readline_timeout(pipe, timeout_s: float) -> str | None:
-    r, _, _ = select.select([pipe], [], [], timeout_s)
-    if not r:
-        return None
-    line = pipe.readline()
-    if not line:
-        return ""
-    return line
-
-
 def _truncate(s: str, limit: int = MAX_LOG_BYTES) -> str:
     if len(s) <= limit:
         return s
     return s[:limit] + "\n...truncated..."
 
 
-def _bot_proc(*, code_path: str, seed: int) -> subprocess.Popen:
-    # Run isolated python (-I), no site packages, no user env.
-    # Python isolated mode (-I) doesn't reliably include WORKDIR on sys.path.
-    # We explicitly add /app so `runner.*` imports work inside the sandbox image.
-    return subprocess.Popen(
-        [
-            "python",
-            "-I",
-            "-u",
-            "-c",
-            (
-                "import sys,runpy; "
-                "sys.path.insert(0,'/app'); "
-                f"sys.argv=['runner.bot_worker','--code-path','{code_path}','--seed','{seed}']; "
-                "runpy.run_module('runner.bot_worker', run_name='__main__')"
-            ),
-        ],
+@dataclass
+class _BotHandle:
+    pid: int
+    stdin: IO[str]
+    stdout_fd: int
+    proc: subprocess.Popen | None = None
+    protocol: int = 1
+    _buf: bytes = b""
+
+    def readline(self, timeout_s: float) -> str | None:
+        """Read one response line; None on timeout, "" if the bot exited."""
+
+        lines, _ = _read_replies([self], [time.monotonic()], timeout_s)
+        return lines[0]
+
+    def take_line(self) -> str | None:
+        if b"\n" not in self._buf:
+            return None
+        line, _, self._buf = self._buf.partition(b"\n")
+        return line.decode("utf-8", errors="replace") + "\n"
+
+    def fill(self) -> bool:
+        # We read the raw fd into our own buffer so poll() never misses lines
+        # that a buffered file object has already pulled in.
+        chunk = os.read(self.stdout_fd, 65536)
+        if not chunk:
+            return False
+        self._buf += chunk
+        return True
+
+
+def _read_replies(
+    bots: list[_BotHandle], sent_at: list[float], timeout_s: float
+) -> tuple[list[str | None], list[float]]:
+    """Collect one line from each bot concurrently with a single poll loop.
+
+    Every bot has its own deadline (`sent_at[i] + timeout_s`), so a slow bot
+    cannot eat into the other's budget. Returns `(lines, elapsed_ms)`, where a
+    line is None on timeout and "" if the bot exited, and elapsed_ms is the
+    time from sending until that bot's reply (or deadline/exit).
+    """
+
+    lines: list[str | None] = [None] * len(bots)
+    elapsed_ms = [0.0] * len(bots)
+    pending: dict[int, int] = {}
+    poller = select.poll()
+
+    for i, bot in enumerate(bots):
+        line = bot.take_line()
+        if line is not None:
+            lines[i] = line
+            elapsed_ms[i] = (time.monotonic() - sent_at[i]) * 1000
+        else:
+            pending[bot.stdout_fd] = i
+            poller.register(bot.stdout_fd, select.POLLIN)
+
+    while pending:
+        now = time.monotonic()
+        for fd, i in list(pending.items()):
+            if now >= sent_at[i] + timeout_s:
+                elapsed_ms[i] = (now - sent_at[i]) * 1000
+                poller.unregister(fd)
+                del pending[fd]
+        if not pending:
+            break
+
+        wait_s = min(sent_at[i] + timeout_s for i in pending.values()) - now
+        for fd, _ in poller.poll(max(1, math.ceil(wait_s * 1000))):
+            i = pending[fd]
+            bot = bots[i]
+            alive = bot.fill()
+            line = bot.take_line()
+            if line is None and alive:
+                continue
+            lines[i] = "" if line is None else line
+            elapsed_ms[i] = (time.monotonic() - sent_at[i]) * 1000
+            poller.unregister(fd)
+            del pending[fd]
+
+    return lines, elapsed_ms
+
+
+def _python_module_cmd(module: str, *args: str) -> list[str]:
+    # Run isolated python (-I): no site packages, no user env. Isolated mode
+    # leaves the working directory off sys.path, so RUNNER_ROOT is added for
+    # `runner.*` imports; `args` end up in sys.argv[1:].
+    return [
+        sys.executable or "python",
+        "-I",
+        "-u",
+        "-c",
+        f"import sys,runpy; sys.path.insert(0,{RUNNER_ROOT!r}); runpy.run_module({module!r}, run_name='__main__')",
+        *args,
+    ]
+
+
+def _bot_proc(*, code_path: str, seed: int) -> _BotHandle:
+    # Fallback when the zygote is unavailable: one fresh interpreter per bot.
+    p = subprocess.Popen(
+        _python_module_cmd("runner.bot_worker", "--code-path", code_path, "--seed", str(seed)),
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
         text=True,
         bufsize=1,
+        start_new_session=True,
     )
+    assert p.stdin is not None and p.stdout is not None
+    return _BotHandle(pid=p.pid, stdin=p.stdin, stdout_fd=p.stdout.fileno(), proc=p)
+
+
+class _Zygote:
+    """Client for runner.zygote: a pre-imported worker that forks one child per bot."""
+
+    def __init__(self) -> None:
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self.proc = subprocess.Popen(
+                _python_module_cmd("runner.zygote", str(theirs.fileno())),
+                pass_fds=(theirs.fileno(),),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        finally:
+            theirs.close()
+        self.sock = ours
+        self.sock.settimeout(ZYGOTE_TIMEOUT_S)
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def spawn(self, *, code_path: str, seed: int) -> _BotHandle:
+        in_r, in_w = os.pipe()
+        out_r, out_w = os.pipe()
+        try:
+            req = json.dumps({"code_path": code_path, "seed": int(seed)}).encode("utf-8")
+            socket.send_fds(self.sock, [req], [in_r, out_w])
+            reply = json.loads(self.sock.recv(4096) or b"{}")
+            pid = int(reply["pid"])
+        except Exception:
+            os.close(in_w)
+            os.close(out_r)
+            raise
+        finally:
+            os.close(in_r)
+            os.close(out_w)
+        return _BotHandle(
+            pid=pid,
+            stdin=os.fdopen(in_w, "w", buffering=1, encoding="utf-8"),
+            stdout_fd=out_r,
+        )
 
+    def close(self) -> None:
+        try:
+            self.sock.close()
+            self.proc.kill()
+            self.proc.wait(timeout=1.0)
+        except Exception:
+            pass
+
+
+_zygote: _Zygote | None = None
+
+
+def _spawn_bot(*, code_path: str, seed: int) -> _BotHandle:
+    """Start a bot worker, preferring a fork from the (lazily started) zygote.
+
+    The zygote survives across matches when the harness runs under
+    runner.server, so warm containers only pay for a fork per bot.
+    """
+
+    global _zygote
+    try:
+        if _zygote is None or not _zygote.alive():
+            _zygote = _Zygote()
+        return _zygote.spawn(code_path=code_path, seed=seed)
+    except Exception:
+        if _zygote is not None:
+            _zygote.close()
+            _zygote = None
+        return _bot_proc(code_path=code_path, seed=seed)
+
+
+def _wait_ready(bot: _BotHandle, deadline: float) -> str | None:
+    """Wait for the worker's ready line; return an error line if loading failed.
+
+    Anything the bot prints to stdout at import time is discarded. Workers
+    that never report ready are given until `deadline` and then assumed loaded
+    (speaking protocol v1); otherwise the ready line sets `bot.protocol`.
+    The fallback therefore costs a v1 worker the full LOAD_TIMEOUT_MS per bot
+    and match. Worker and harness ship in the same runner image, so that
+    only happens while an older worker is paired with this harness.
+    """
+
+    while True:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            return None
+        line = bot.readline(left)
+        if line is None:
+            return None
+        if line == "":
+            return '{"error": "bot_exited"}'
+        line = line.strip()
+        if line.startswith('{"error"'):
+            return line
+        if line.startswith('{"ready"'):
+            try:
+                offered = int(json.loads(line).get("protocol") or 1)
+            except (ValueError, AttributeError):
+                offered = 1
+            bot.protocol = max(1, min(offered, PROTOCOL_VERSION))
+            return None
+
+
+def _step_message(
+    bot: _BotHandle, *, round_num: int, history: list[list[Action]], state: dict[str, Any]
+) -> str:
+    # `history` is the receiving bot's own [my_action, opp_action] list.
+    if bot.protocol >= 2:
+        last = history[-1] if history else None
+        return json.dumps({"round": round_num, "max_rounds": ROUNDS, "last": last, "state": state}) + "\n"
+    obs = observation(round_num=round_num, history=history)
+    return json.dumps({"obs": obs, "state": state}) + "\n"
+
+
+def _kill(bot: _BotHandle) -> None:
+    # Bots run in their own session; kill the whole group so nothing a bot
+    # spawned can outlive the match (matters when the container is reused).
+    try:
+        os.killpg(bot.pid, signal.SIGKILL)
+    except Exception:
+        pass
+    if bot.proc is not None:
+        try:
+            bot.proc.kill()
+            bot.proc.wait(timeout=1.0)
+        except Exception:
+            pass
+    try:
+        bot.stdin.close()
+    except Exception:
+        pass
+    if bot.proc is None:
+        try:
+            os.close(bot.stdout_fd)
+        except Exception:
+            pass
+
+
+def reset_sandbox() -> None:
+    """Kill every process but this one and the zygote, and empty SCRATCH_DIRS.
+
+    runner.server calls this between matches: killing the bots' process
+    groups misses anything that started a session of its own, and files a
+    bot wrote would be visible to the next match in the reused container.
+    Only acts as PID 1, i.e. as the container's main process, so running
+    the server outside a sandbox never kills the caller's processes.
+    """
+
+    if os.getpid() != 1:
+        return
+    keep = {1}
+    if _zygote is not None and _zygote.alive():
+        keep.add(_zygote.proc.pid)
+    killed = set()
+    for entry in os.listdir("/proc"):
+        if entry.isdigit() and int(entry) not in keep:
+            try:
+                os.kill(int(entry), signal.SIGKILL)
+                killed.add(int(entry))
+            except OSError:
+                pass
+    # Orphans are re-parented to PID 1: reap them until they are gone, so
+    # they do not count against pids_limit.
+    deadline = time.monotonic() + 1.0
+    while killed and time.monotonic() < deadline:
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+        killed = {pid for pid in killed if os.path.exists(f"/proc/{pid}")}
+        if killed:
+            time.sleep(0.005)
+    for scratch in SCRATCH_DIRS:
+        try:
+            entries = list(os.scandir(scratch))
+        except OSError:
+            continue
+        for e in entries:
+            try:
+                if e.is_dir(follow_symlinks=False):
+                    shutil.rmtree(e.path, ignore_errors=True)
+                else:
+                    os.unlink(e.path)
+            except OSError:
+                pass
+
+
+def _failure(rc: int, error: str, *, a: bool, b: bool, log: str | None = None) -> tuple[int, dict[str, Any]]:
+    """Error body for a match lost to bot misbehaviour, naming the culprit(s) in `fault`."""
+
+    fault = "both" if a and b else ("a" if a else "b")
+    return rc, {"error_log": _truncate(log or error), "error": error, "fault": fault}
+
+
+def _derived_seed(seed: int, k: int) -> int:
+    h = hashlib.sha256(f"{seed}:{k}".encode("utf-8")).digest()
+    return int.from_bytes(h[:4], "big") & 0x7FFFFFFF
+
+
+def _diff_is_settled(diffs: list[int]) -> bool:
+    """Whether the 95% confidence interval of the mean score difference excludes zero."""
+
+    n = len(diffs)
+    if n < 2:
+        return False
+    half_width = _T95.get(n - 1, 1.96) * statistics.stdev(diffs) / math.sqrt(n)
+    return abs(statistics.fmean(diffs)) > half_width
+
+
+def run_match(
+    payload: dict[str, Any], *, on_round: Callable[[dict[str, Any]], None] | None = None
+) -> tuple[int, dict[str, Any]]:
+    """Play one match described by `payload`; return (exit_code, result_body).
+
+    With `max_seeds` > 1 the pair is evaluated adaptively: if either bot drew
+    from `random`, the match is replayed with seeds derived from `seed` until
+    the confidence interval of the score difference excludes zero (i.e. the
+    winner of the pair is settled) or `max_seeds` runs were made. The body
+    describes the first run and adds `samples` with every run's seed and scores.
+
+    Only the first run decides whether more seeds are played: a bot that
+    draws from `random` only under other seeds, or whose play varies for
+    another reason (time, os.urandom, ...), is evaluated on one seed. The
+    transcript, exec/step timings and `on_round` events are the first
+    run's; later runs contribute their scores to `samples` and nothing else.
+
+    `rounds` (default ROUNDS) cuts the match short, e.g. for a submit-time
+    preflight; bots are still told the match lasts ROUNDS rounds.
+
+    `on_round` is called with a round record (see round_event) as each round
+    of the first run is played.
+    """
 
-def main() -> int:
     try:
-        payload = json.loads(sys.stdin.read() or "{}")
         bot_a_b64 = payload["bot_a_b64"]
         bot_b_b64 = payload["bot_b_b64"]
         seed = int(payload["seed"])
+        max_seeds = max(1, min(int(payload.get("max_seeds", 1)), MAX_SEEDS))
+        rounds = max(1, min(int(payload.get("rounds", ROUNDS)), ROUNDS))
     except Exception:
-        sys.stdout.write(json.dumps({"error_log": "invalid_input"}) + "\n")
-        return 2
+        return 2, {"error_log": "invalid_input"}
 
     os.makedirs("/tmp", exist_ok=True)
     path_a = "/tmp/bot_a.py"
@@ -97,32 +433,82 @@ def main() -> int:
         code_a = base64.b64decode(bot_a_b64.encode("ascii"), validate=True).decode("utf-8")
         code_b = base64.b64decode(bot_b_b64.encode("ascii"), validate=True).decode("utf-8")
     except Exception:
-        sys.stdout.write(json.dumps({"error_log": "invalid_base64"}) + "\n")
-        return 2
+        return 2, {"error_log": "invalid_base64"}
 
     with open(path_a, "w", encoding="utf-8") as f:
         f.write(code_a)
     with open(path_b, "w", encoding="utf-8") as f:
         f.write(code_b)
 
+    rc, body, rng_used = _play(path_a, path_b, seed, rounds=rounds, on_round=on_round)
+    if rc != 0 or max_seeds == 1:
+        return rc, body
+
+    seeds = [seed]
+    cums_a = [body["cum_a"]]
+    cums_b = [body["cum_b"]]
+    while rng_used and len(seeds) < max_seeds and not _diff_is_settled([a - b for a, b in zip(cums_a, cums_b)]):
+        s = _derived_seed(seed, len(seeds))
+        rc, extra, _ = _play(path_a, path_b, s, rounds=rounds)
+        if rc != 0:
+            return rc, extra
+        seeds.append(s)
+        cums_a.append(extra["cum_a"])
+        cums_b.append(extra["cum_b"])
+    body["samples"] = {"seeds": seeds, "cum_a": cums_a, "cum_b": cums_b}
+    return 0, body
+
+
+def round_event(r: int, act_a: str, act_b: str, ra: int, rb: int, cum_a: int, cum_b: int) -> dict[str, Any]:
+    """One streamed round: a JSONL record emitted before the final result body."""
+
+    return {
+        "event": "round",
+        "round": r,
+        "act_a": act_a,
+        "act_b": act_b,
+        "reward_a": ra,
+        "reward_b": rb,
+        "cum_a": cum_a,
+        "cum_b": cum_b,
+    }
+
+
+def _play(
+    path_a: str,
+    path_b: str,
+    seed: int,
+    *,
+    rounds: int = ROUNDS,
+    on_round: Callable[[dict[str, Any]], None] | None = None,
+) -> tuple[int, dict[str, Any], bool]:
+    """One match between the bots at `path_a`/`path_b`; returns (rc, body, any bot used its RNG)."""
+
     start = time.monotonic()
+    rng_used = False
 
-    p_a = _bot_proc(code_path=path_a, seed=seed)
-    p_b = _bot_proc(code_path=path_b, seed=seed + 1)
+    p_a = _spawn_bot(code_path=path_a, seed=seed)
+    t_spawn_b = time.monotonic()
+    p_b = _spawn_bot(code_path=path_b, seed=seed + 1)
 
     try:
         # If load fails, bot_worker prints a JSON error line then exits nonzero.
-        for p in (p_a, p_b):
-            line = _readline_timeout(p.stdout, 1.0)  # type: ignore[arg-type]
-            if line and line.strip().startswith('{"error"'):
-                err = line.strip()
-                sys.stdout.write(json.dumps({"error_log": _truncate(err)}) + "\n")
-                return 3
-
-        # Global history stores [act_a, act_b] for each round.
-        # We derive per-bot history from this.
-        history: list[list[Action]] = []
-        steps: list[dict[str, Any]] = []
+        startup_ms: list[float] = []
+        for p, t_spawn in ((p_a, start), (p_b, t_spawn_b)):
+            err = _wait_ready(p, t_spawn + LOAD_TIMEOUT_MS / 1000)
+            if err is not None:
+                return (*_failure(3, "load_failed", a=p is p_a, b=p is p_b, log=err), rng_used)
+            startup_ms.append((time.monotonic() - t_spawn) * 1000)
+
+        # Per-bot history, normalized to always be [my_action, opp_action].
+        hist_a: list[list[Action]] = []
+        hist_b: list[list[Action]] = []
+        # Compact transcript: one char per round per bot; observations can be
+        # rebuilt from these (see app.env.ipd.replay_steps in the backend).
+        acts_a: list[str] = []
+        acts_b: list[str] = []
+        rewards_a: list[int] = []
+        rewards_b: list[int] = []
         cum_a = 0
         cum_b = 0
         st_a: dict[str, Any] = {}
@@ -132,57 +518,58 @@ def main() -> int:
         # until we receive a response line (includes bot's Python runtime + IPC).
         exec_ms_a = 0.0
         exec_ms_b = 0.0
+        max_step_ms_a = 0.0
+        max_step_ms_b = 0.0
 
-        for r in range(1, ROUNDS + 1):
+        for r in range(1, rounds + 1):
             if (time.monotonic() - start) * 1000 > MAX_MATCH_MS:
-                sys.stdout.write(json.dumps({"error_log": "match_timeout"}) + "\n")
-                return 4
-
-            # Per-bot observation: normalize history to always be [my_action, opp_action]
-            hist_a = [pair[:] for pair in history]
-            hist_b = [[b, a] for (a, b) in history]
-            obs_a = observation(round_num=r, history=hist_a)
-            obs_b = observation(round_num=r, history=hist_b)
-            msg_a = json.dumps({"obs": obs_a, "state": st_a}) + "\n"
-            msg_b = json.dumps({"obs": obs_b, "state": st_b}) + "\n"
-
-            assert p_a.stdin is not None and p_b.stdin is not None
-
-            t0a = time.monotonic()
-            p_a.stdin.write(msg_a)
-            p_a.stdin.flush()
-            line_a = _readline_timeout(p_a.stdout, MAX_STEP_MS / 1000)  # type: ignore[arg-type]
-            exec_ms_a += (time.monotonic() - t0a) * 1000
-
-            t0b = time.monotonic()
-            p_b.stdin.write(msg_b)
-            p_b.stdin.flush()
-            line_b = _readline_timeout(p_b.stdout, MAX_STEP_MS / 1000)  # type: ignore[arg-type]
-            exec_ms_b += (time.monotonic() - t0b) * 1000
+                # Blame whoever used most of the budget.
+                return (*_failure(4, "match_timeout", a=exec_ms_a >= exec_ms_b, b=exec_ms_b >= exec_ms_a), rng_used)
+
+            msg_a = _step_message(p_a, round_num=r, history=hist_a, state=st_a)
+            msg_b = _step_message(p_b, round_num=r, history=hist_b, state=st_b)
+
+            # Send to both bots first, then collect both replies concurrently:
+            # a round costs about max(latency_a, latency_b), not the sum.
+            sent_at: list[float] = []
+            try:
+                for p, msg in ((p_a, msg_a), (p_b, msg_b)):
+                    sent_at.append(time.monotonic())
+                    p.stdin.write(msg)
+                    p.stdin.flush()
+            except (BrokenPipeError, OSError):
+                return (*_failure(4, "bot_exited", a=len(sent_at) == 1, b=len(sent_at) == 2), rng_used)
+            (line_a, line_b), (ms_a, ms_b) = _read_replies([p_a, p_b], sent_at, MAX_STEP_MS / 1000)
+            exec_ms_a += ms_a
+            exec_ms_b += ms_b
+            max_step_ms_a = max(max_step_ms_a, ms_a)
+            max_step_ms_b = max(max_step_ms_b, ms_b)
             if line_a is None or line_b is None:
-                sys.stdout.write(json.dumps({"error_log": "step_timeout"}) + "\n")
-                return 4
+                return (*_failure(4, "step_timeout", a=line_a is None, b=line_b is None), rng_used)
             if line_a == "" or line_b == "":
-                sys.stdout.write(json.dumps({"error_log": "bot_exited"}) + "\n")
-                return 4
+                return (*_failure(4, "bot_exited", a=line_a == "", b=line_b == ""), rng_used)
 
-            resp_a = json.loads(line_a)
-            resp_b = json.loads(line_b)
+            try:
+                resp_a = json.loads(line_a)
+            except ValueError:
+                return (*_failure(5, "invalid_reply", a=True, b=False), rng_used)
+            try:
+                resp_b = json.loads(line_b)
+            except ValueError:
+                return (*_failure(5, "invalid_reply", a=False, b=True), rng_used)
             if "error" in resp_a:
-                sys.stdout.write(json.dumps({"error_log": _truncate(resp_a.get("detail", "bot_a_error"))}) + "\n")
-                return 5
+                return (*_failure(5, "act_failed", a=True, b=False, log=resp_a.get("detail", "bot_a_error")), rng_used)
             if "error" in resp_b:
-                sys.stdout.write(json.dumps({"error_log": _truncate(resp_b.get("detail", "bot_b_error"))}) + "\n")
-                return 5
+                return (*_failure(5, "act_failed", a=False, b=True, log=resp_b.get("detail", "bot_b_error")), rng_used)
 
+            rng_used = rng_used or bool(resp_a.get("rng") or resp_b.get("rng"))
             act_a = resp_a.get("act")
             act_b = resp_b.get("act")
             st_a2 = resp_a.get("state")
             st_b2 = resp_b.get("state")
 
             if not is_valid_action(act_a) or not is_valid_action(act_b):
-                sys.stdout.write(json.dumps({"error_log": "invalid_action"}) + "\n")
-                return 6
+                return (*_failure(6, "invalid_action", a=not is_valid_action(act_a), b=not is_valid_action(act_b)), rng_used)
 
             _ensure_jsonable(st_a2)
             _ensure_jsonable(st_b2)
@@ -194,44 +581,55 @@ def main() -> int:
             cum_a += ra
             cum_b += rb
 
-            steps.append(
-                {
-                    "round": r,
-                    "obs_a": obs_a,
-                    "act_a": act_a,
-                    "obs_b": obs_b,
-                    "act_b": act_b,
-                    "reward_a": ra,
-                    "reward_b": rb,
-                    "cum_a": cum_a,
-                    "cum_b": cum_b,
-                }
-            )
-            history.append([act_a, act_b])
-
-        sys.stdout.write(
-            json.dumps(
-                {
-                    "steps": steps,
-                    "cum_a": cum_a,
-                    "cum_b": cum_b,
-                    "exec_ms_a": exec_ms_a,
-                    "exec_ms_b": exec_ms_b,
-                    "avg_exec_ms_a": exec_ms_a / ROUNDS,
-                    "avg_exec_ms_b": exec_ms_b / ROUNDS,
-                }
-            )
-            + "\n"
-        )
-        return 0
+            acts_a.append(act_a)
+            acts_b.append(act_b)
+            rewards_a.append(ra)
+            rewards_b.append(rb)
+            hist_a.append([act_a, act_b])
+            hist_b.append([act_b, act_a])
+            if on_round is not None:
+                on_round(round_event(r, act_a, act_b, ra, rb, cum_a, cum_b))
+
+        return 0, {
+            "format": "compact",
+            "seed": seed,
+            "acts_a": "".join(acts_a),
+            "acts_b": "".join(acts_b),
+            "rewards_a": rewards_a,
+            "rewards_b": rewards_b,
+            "cum_a": cum_a,
+            "cum_b": cum_b,
+            "exec_ms_a": exec_ms_a,
+            "exec_ms_b": exec_ms_b,
+            "avg_exec_ms_a": exec_ms_a / rounds,
+            "avg_exec_ms_b": exec_ms_b / rounds,
+            "max_step_ms_a": max_step_ms_a,
+            "max_step_ms_b": max_step_ms_b,
+            "startup_ms_a": startup_ms[0],
+            "startup_ms_b": startup_ms[1],
+        }, rng_used
     finally:
         for p in (p_a, p_b):
-            try:
-                p.kill()
-            except Exception:
-                pass
+            _kill(p)
+
+
+def main() -> int:
+    set_undumpable()
+    try:
+        payload = json.loads(sys.stdin.read() or "{}")
+    except Exception:
+        sys.stdout.write(json.dumps({"error_log": "invalid_input"}) + "\n")
+        return 2
+
+    rc, body = run_match(payload, on_round=_emit if payload.get("stream") else None)
+    sys.stdout.write(json.dumps(body) + "\n")
+    return rc
+
+
+def _emit(record: dict[str, Any]) -> None:
+    sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
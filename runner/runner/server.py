@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import json
+import signal
+import sys
+
+from runner.bot_worker import set_undumpable
+from runner.harness import reset_sandbox, run_match
+
+
+def _reply(body: dict) -> None:
+    sys.stdout.write(json.dumps(body) + "\n")
+    sys.stdout.flush()
+
+
+def main() -> int:
+    """Long-lived match server used by the backend's warm container pool.
+
+    Protocol: one JSON request per line on stdin, one JSON response per line
+    on stdout. A request is either a health check (`{"op": "ping"}`) or a
+    regular harness payload; match responses carry the harness exit code as `rc`.
+    Payloads with `"stream": true` get one `{"event": "round", ...}` line per
+    round played before the response line. The sandbox is reset after every
+    match (see reset_sandbox), so the next one starts from a clean container.
+
+    The server, the zygote and the bots all run as the container's single
+    uid: the sandbox drops every capability (no-new-privileges, cap-drop
+    ALL), so nothing in it can switch to another uid, and granting
+    CAP_SETUID to a process that outlives untrusted code would widen the
+    sandbox rather than narrow it. Instead every runner process is made
+    non-dumpable (see set_undumpable), so bots cannot ptrace or read the
+    memory and descriptors of the server or of each other. As PID 1 the
+    server only receives signals it handles; SIGINT, the one Python
+    installs a handler for, is ignored. Not covered: a bot can still signal
+    its opponent's process, which ends the match as `bot_exited` blamed on
+    the opponent; closing that needs one uid per bot.
+    """
+
+    set_undumpable()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            msg = json.loads(line)
+        except Exception:
+            _reply({"rc": 2, "error_log": "invalid_input"})
+            continue
+
+        if isinstance(msg, dict) and msg.get("op") == "ping":
+            _reply({"pong": True})
+            continue
+
+        try:
+            payload = msg if isinstance(msg, dict) else {}
+            rc, body = run_match(payload, on_round=_reply if payload.get("stream") else None)
+        except Exception as e:  # noqa: BLE001
+            rc, body = 1, {"error_log": f"harness_crashed: {e}"}
+        reset_sandbox()
+        body["rc"] = rc
+        _reply(body)
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
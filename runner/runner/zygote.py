@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import io
+import json
+import os
+import signal
+import socket
+import sys
+
+# Imported up front so every forked child starts with the worker machinery warm.
+from runner import bot_worker
+
+MAX_REQUEST_BYTES = 4096
+
+
+def _child(*, stdin_fd: int, stdout_fd: int, code_path: str, seed: int) -> None:
+    # Runs in the forked child; never returns.
+    try:
+        os.setsid()
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        os.dup2(stdin_fd, 0)
+        os.dup2(stdout_fd, 1)
+        os.closerange(3, 1024)
+        sys.stdin = io.TextIOWrapper(io.FileIO(0, "r", closefd=False), encoding="utf-8")
+        sys.stdout = io.TextIOWrapper(io.FileIO(1, "w", closefd=False), encoding="utf-8", line_buffering=True)
+        rc = bot_worker.serve(code_path=code_path, seed=seed)
+    except BaseException:
+        rc = 1
+    try:
+        sys.stdout.flush()
+    finally:
+        os._exit(rc)
+
+
+def main() -> int:
+    """Fork-server for bot workers.
+
+    The harness sends one request per bot over a unix socket: a JSON body
+    `{"code_path": ..., "seed": ...}` plus two file descriptors (the child's
+    stdin read end and stdout write end) via SCM_RIGHTS. We fork, wire the
+    descriptors up as the child's stdio and reply with `{"pid": ...}`.
+    Children get their own session so the harness can kill the whole group.
+    """
+
+    bot_worker.set_undumpable()
+    sock = socket.socket(fileno=int(sys.argv[1]))
+    # Children are never waited on by us; let the kernel reap them.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    while True:
+        try:
+            data, fds, _, _ = socket.recv_fds(sock, MAX_REQUEST_BYTES, 2)
+        except OSError:
+            return 1
+        if not data:
+            return 0
+        try:
+            req = json.loads(data)
+            if len(fds) != 2:
+                raise ValueError("expected_two_fds")
+            pid = os.fork()
+            if pid == 0:
+                sock.close()
+                _child(stdin_fd=fds[0], stdout_fd=fds[1], code_path=str(req["code_path"]), seed=int(req["seed"]))
+            reply = {"pid": pid}
+        except Exception as e:  # noqa: BLE001
+            reply = {"error": f"spawn_failed: {e}"}
+        finally:
+            for fd in fds:
+                os.close(fd)
+        sock.sendall(json.dumps(reply).encode("utf-8"))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())